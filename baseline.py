@@ -1,24 +1,13 @@
 # %%
 import os
+import argparse
 import traceback
 import json
 import shutil
-from statistics import mean
 from bs4 import BeautifulSoup
-from shapely.geometry import Polygon
-from src.utils import (
-    pagexml_to_html,
-    format_td
-)
-from src.metrics import (
-    compute_mAP,
-    TEDS,
-    infomration_extraction_precision_recall,
-    best_match_similarity
-)
+from src.evaluation import evaluate_pages, METRICS
 from src.person_info_extraction import extract_info_LLM
 from src.person_info_extraction_ontogpt import extract_person_info as information_extractor
-from statistics import mean
 
 # %%
 DATA_DIR = "data/images"
@@ -29,28 +18,19 @@ OUTPUT_JSON_DIR = "data/json"
 TEMP_DIR = "data/temp"
 SCHEMA_PATH = "data/schema/personbasicinfo.yaml"
 LLM_MODEL = "ollama/llama3"
-
-# storage for metrics
-all_scores = {
-    "TEDS-Struct": [],
-    "TEDS": [],
-    "Precision": [],
-    "Recall": [],
-    "F1-score": []
-}
+SCORES_FILE = "data/eval/baseline.csv"
 
 
 # %% --- Utility Functions ---
 
-def calculate_teds(gt_html, pred_html):
-    """Compute TEDS and TEDS-Struct scores between two HTML tables."""
-    gt_html = format_td(gt_html)
-    teds = TEDS(structure_only=False)
-    teds_struct = TEDS(structure_only=True)
-
-    teds_score = teds.evaluate(gt_html, pred_html)
-    teds_struct_score = teds_struct.evaluate(gt_html, pred_html)
-    return teds_score, teds_struct_score
+def page_inputs(image_name):
+    """Prediction and ground-truth files scored for one image (see src/evaluation.py)."""
+    return {
+        "html": os.path.join(HTML_DIR, f"{image_name}.html"),
+        "gt_html": os.path.join(GT_HTML_DIR, f"{image_name}.html"),
+        "json": os.path.join(OUTPUT_JSON_DIR, f"{image_name}.json"),
+        "gt_info": os.path.join(GT_INFO_DIR, f"{image_name.replace('.jpg', '.json')}"),
+    }
 
 
 def parse_html_table(html_content):
@@ -109,18 +89,13 @@ def extract_persons_from_table(logical_rows):
 
 
 def process_single_image(image_name, IE_method="ontogpt"):
-    """Run the full evaluation pipeline for one image and return metrics."""
+    """Run information extraction for one image; scoring is done by `evaluate`."""
     print("\n===================================")
     print(f"Processing {image_name}...")
 
     html_file = os.path.join(HTML_DIR, f"{image_name}.html")
-
-    # --- Compute TEDS ---
-    with open(os.path.join(GT_HTML_DIR, f"{image_name}.html"), encoding="utf-8") as f:
-        gt_html = f.read()
     with open(html_file, encoding="utf-8") as f:
         pred_html = f.read()
-    teds_score, teds_struct_score = calculate_teds(gt_html, pred_html)
 
     # --- Information Extraction ---
     logical_rows = parse_html_table(pred_html)
@@ -164,54 +139,44 @@ def process_single_image(image_name, IE_method="ontogpt"):
         finally: 
             shutil.rmtree(TEMP_DIR, ignore_errors=True)
 
-    # --- Compare with Ground Truth JSON ---
-    with open(os.path.join(GT_INFO_DIR, f"{image_name.replace('.jpg', '.json')}"), encoding="utf-8") as f:
-        gt_info = json.load(f)
-    with open(json_out_path, encoding="utf-8") as f:
-        pred_info = json.load(f)
-
-    # info_sim = best_match_similarity(gt_info.get("persons", []), pred_info.get("persons", []))
-    precision, recall, f1_score = infomration_extraction_precision_recall(
-        pred_info.get("persons", []), gt_info.get("persons", []), threshold=0.4
-    )
-
-    print(f"TEDS-Struct: {teds_struct_score:.4f}")
-    print(f"TEDS: {teds_score:.4f}")
-    
-    print(f"Information Extraction - \nPrecision: {precision:.4f}, \nRecall: {recall:.4f}, \nF1-score: {f1_score:.4f}")
-
-    return teds_score, teds_struct_score, precision, recall, f1_score
+    return json_out_path
 
 
 # %% --- Main Execution Loop ---
 
-def evaluate():
-    for file in os.listdir(DATA_DIR): 
-        if not file.endswith(".jpg"): 
-            continue 
-
-        image_name = file
-
-        try: 
-            teds, teds_struct, p, r , f= process_single_image(image_name) 
-            all_scores["TEDS-Struct"].append(teds_struct) 
-            all_scores["TEDS"].append(teds) 
-            all_scores["Precision"].append(p) 
-            all_scores["Recall"].append(r) 
-            all_scores["F1-score"].append(f) 
-            print(f"✅ Finished processing {image_name}")
-        except Exception as e: 
-            # Print detailed error info
-            print(f"❌ [ERROR]: {e} An exception occurred!")
-            traceback.print_exc()
-
-
-    # --- Print summary averages ---
-    print("\n===================================") 
-    print("=== Average Metrics Across All Images ===") 
-    for key, vals in all_scores.items(): 
-        avg = mean(vals) if vals else 0.0 
-        print(f"{key}: {avg:.4f}")
+def evaluate(predict=True, workers=None, output_file=SCORES_FILE):
+    """
+    Extract persons for every image (unless `predict` is False), then score all
+    pages in parallel. Scores are cached per file hash, so re-running after
+    changing one page only recomputes that page.
+    """
+    image_names = sorted(file for file in os.listdir(DATA_DIR) if file.endswith(".jpg"))
+
+    if predict:
+        predicted = []
+        for image_name in image_names:
+            try:
+                process_single_image(image_name)
+                predicted.append(image_name)
+                print(f"✅ Finished processing {image_name}")
+            except Exception as e:
+                # Print detailed error info
+                print(f"❌ [ERROR]: {e} An exception occurred!")
+                traceback.print_exc()
+        image_names = predicted
+
+    return evaluate_pages(
+        {image_name: page_inputs(image_name) for image_name in image_names},
+        metrics={name: METRICS[name] for name in ["TEDS", "IE"]},
+        workers=workers,
+        output_file=output_file,
+    )
 
 if __name__ == "__main__":
-    evaluate()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--score_only", action="store_true", help="Only (re-)score the existing predictions")
+    parser.add_argument("--workers", type=int, default=None, help="Number of scoring processes (default: all cores)")
+    parser.add_argument("--output", type=str, default=SCORES_FILE, help="Per-page scores (.csv or .parquet)")
+    args = parser.parse_args()
+
+    evaluate(predict=not args.score_only, workers=args.workers, output_file=args.output)
@@ -1,24 +1,16 @@
 # %%
 import os
+import argparse
 import traceback
 import json
 import shutil
-from statistics import mean
 from bs4 import BeautifulSoup
-from shapely.geometry import Polygon
-from src.utils import (
-    pagexml_to_html,
-    format_td
-)
-from src.metrics import (
-    compute_mAP,
-    TEDS,
-    infomration_extraction_precision_recall,
-    best_match_similarity
-)
-from src.person_info_extraction import extract_info_LLM
+from src.utils import pagexml_to_html
+from src.evaluation import evaluate_pages, METRICS
+from src.person_info_extraction import extract_info_LLM, extract_info_LLM_batch
 from src.person_info_extraction_ontogpt import extract_person_info as information_extractor
-from statistics import mean
+from src.person_info_extraction_ontogpt import extract_person_info_batch as batch_information_extractor
+from src.row_filter import filter_rows
 
 # %%
 DATA_DIR = "data/tables/pagexml"
@@ -30,29 +22,23 @@ OUTPUT_JSON_DIR = "data/json"
 TEMP_DIR = "data/temp"
 SCHEMA_PATH = "data/schema/personbasicinfo.yaml"
 LLM_MODEL = "ollama/llama3"
-
-# storage for metrics
-all_scores = {
-    "mAP": [],
-    "TEDS-Struct": [],
-    "TEDS": [],
-    "Precision": [],
-    "Recall": [],
-    "F1-score": []
-}
+BATCH_SIZE = 1  # rows per model call; > 1 enables row-batch prompting
+ROW_FILTER_THRESHOLD = 0.35  # rows scoring below this are not sent to the model; 0 keeps all
+SCORES_FILE = "data/eval/experiment_1.csv"
 
 
 # %% --- Utility Functions ---
 
-def calculate_teds(gt_html, pred_html):
-    """Compute TEDS and TEDS-Struct scores between two HTML tables."""
-    gt_html = format_td(gt_html)
-    teds = TEDS(structure_only=False)
-    teds_struct = TEDS(structure_only=True)
-
-    teds_score = teds.evaluate(gt_html, pred_html)
-    teds_struct_score = teds_struct.evaluate(gt_html, pred_html)
-    return teds_score, teds_struct_score
+def page_inputs(image_name):
+    """Prediction and ground-truth files scored for one image (see src/evaluation.py)."""
+    return {
+        "pagexml": os.path.join(DATA_DIR, f"{image_name}.xml"),
+        "gt_polygons": os.path.join(GT_POLYGON_DIR, f"{image_name}.polygons.json"),
+        "html": os.path.join(OUTPUT_HTML_DIR, f"{image_name}.html"),
+        "gt_html": os.path.join(GT_HTML_DIR, f"{image_name}.html"),
+        "json": os.path.join(OUTPUT_JSON_DIR, f"{image_name}.json"),
+        "gt_info": os.path.join(GT_INFO_DIR, f"{image_name.replace('.jpg', '.json')}"),
+    }
 
 
 def parse_html_table(html_content):
@@ -99,11 +85,17 @@ def parse_html_table(html_content):
     return logical_rows
 
 
-def extract_persons_from_table(logical_rows):
+def extract_persons_from_table(logical_rows, batch_size=BATCH_SIZE, threshold=ROW_FILTER_THRESHOLD):
     """Extract structured person information from table rows."""
     persons = []
-    for row in logical_rows:
-        person = json.loads(extract_info_LLM(row))
+    kept = filter_rows(logical_rows, threshold=threshold)
+    rows = [row for _, row in kept]
+    if batch_size > 1:
+        responses = extract_info_LLM_batch(rows, row_indices=[i for i, _ in kept], batch_size=batch_size)
+    else:
+        responses = (extract_info_LLM(row) for row in rows)
+    for response in responses:
+        person = json.loads(response)
         if person and not all(v["value"] is None for v in person.values()):
             persons.append(person)
     unique_persons = {json.dumps(p, sort_keys=True) for p in persons}
@@ -111,7 +103,7 @@ def extract_persons_from_table(logical_rows):
 
 
 def process_single_image(image_name, IE_method="ontogpt"):
-    """Run the full evaluation pipeline for one image and return metrics."""
+    """Build the HTML table and run information extraction for one image; scoring is done by `main`."""
     print("\n===================================")
     print(f"Processing {image_name}...")
 
@@ -119,17 +111,8 @@ def process_single_image(image_name, IE_method="ontogpt"):
     output_html_file = os.path.join(OUTPUT_HTML_DIR, f"{image_name}.html")
     pagexml_to_html(pagexml_file, output_html_file)
 
-    # --- Compute mAP ---
-    gt_file = os.path.join(GT_POLYGON_DIR, f"{image_name}.polygons.json")
-    pred_file = pagexml_file
-    mAP = compute_mAP(gt_file, pred_file)
-
-    # --- Compute TEDS ---
-    with open(os.path.join(GT_HTML_DIR, f"{image_name}.html"), encoding="utf-8") as f:
-        gt_html = f.read()
     with open(output_html_file, encoding="utf-8") as f:
         pred_html = f.read()
-    teds_score, teds_struct_score = calculate_teds(gt_html, pred_html)
 
     # --- Information Extraction ---
     logical_rows = parse_html_table(pred_html)
@@ -147,13 +130,19 @@ def process_single_image(image_name, IE_method="ontogpt"):
         os.makedirs(TEMP_DIR, exist_ok=True)
 
         try:
-            for i, row in enumerate(logical_rows):
-                print(f"Processing row {i+1}/{len(logical_rows)}")
-                temp_file = f"person_{i}.json"
+            kept = filter_rows(logical_rows, threshold=ROW_FILTER_THRESHOLD)
+            for start in range(0, len(kept), BATCH_SIZE):
+                indices = [i for i, _ in kept[start:start + BATCH_SIZE]]
+                batch = [row for _, row in kept[start:start + BATCH_SIZE]]
+                print(f"Processing rows {indices} ({start+len(batch)}/{len(kept)} kept rows)")
+                temp_files = [os.path.join(TEMP_DIR, f"person_{i}.json") for i in indices]
                 try:
-                    information_extractor(i, row, schema_path=SCHEMA_PATH, json_output=os.path.join(TEMP_DIR, temp_file), temp_dir=TEMP_DIR, llm_model=LLM_MODEL)
+                    if len(batch) > 1:
+                        batch_information_extractor(indices, batch, schema_path=SCHEMA_PATH, json_outputs=temp_files, temp_dir=TEMP_DIR, llm_model=LLM_MODEL)
+                    else:
+                        information_extractor(indices[0], batch[0], schema_path=SCHEMA_PATH, json_output=temp_files[0], temp_dir=TEMP_DIR, llm_model=LLM_MODEL)
                 except Exception as e:
-                    print(f" ❌ Error processing row {i}: {e}")
+                    print(f" ❌ Error processing rows {indices}: {e}")
                     traceback.print_exc()
                     continue
 
@@ -175,56 +164,44 @@ def process_single_image(image_name, IE_method="ontogpt"):
         finally: 
             shutil.rmtree(TEMP_DIR, ignore_errors=True)
 
-    # --- Compare with Ground Truth JSON ---
-    with open(os.path.join(GT_INFO_DIR, f"{image_name.replace('.jpg', '.json')}"), encoding="utf-8") as f:
-        gt_info = json.load(f)
-    with open(json_out_path, encoding="utf-8") as f:
-        pred_info = json.load(f)
-
-    # info_sim = best_match_similarity(gt_info.get("persons", []), pred_info.get("persons", []))
-    precision, recall, f1_score = infomration_extraction_precision_recall(
-        pred_info.get("persons", []), gt_info.get("persons", []), threshold=0.4
-    )
-
-    print(f"Mean Average Precision (mAP): {mAP:.4f}")
-    print(f"TEDS-Struct: {teds_struct_score:.4f}")
-    print(f"TEDS: {teds_score:.4f}")
-    
-    print(f"Information Extraction - \nPrecision: {precision:.4f}, \nRecall: {recall:.4f}, \nF1-score: {f1_score:.4f}")
-
-    return mAP, teds_score, teds_struct_score, precision, recall, f1_score
+    return json_out_path
 
 
 # %% --- Main Execution Loop ---
 
-def main():
-    for file in os.listdir(DATA_DIR): 
-        if not file.endswith(".xml"): 
-            continue 
-
-        image_name = file.replace(".xml", "") 
-
-        try: 
-            mAP, teds, teds_struct, p, r , f= process_single_image(image_name) 
-            all_scores["mAP"].append(mAP) 
-            all_scores["TEDS-Struct"].append(teds_struct) 
-            all_scores["TEDS"].append(teds) 
-            all_scores["Precision"].append(p) 
-            all_scores["Recall"].append(r) 
-            all_scores["F1-score"].append(f) 
-            print(f"✅ Finished processing {image_name}")
-        except Exception as e: 
-            # Print detailed error info
-            print("❌ [ERROR] An exception occurred!")
-            traceback.print_exc()
-
-
-    # --- Print summary averages ---
-    print("\n===================================") 
-    print("=== Average Metrics Across All Images ===") 
-    for key, vals in all_scores.items(): 
-        avg = mean(vals) if vals else 0.0 
-        print(f"{key}: {avg:.4f}")
+def main(predict=True, workers=None, output_file=SCORES_FILE):
+    """
+    Build tables and extract persons for every PageXML (unless `predict` is False),
+    then score all pages in parallel. Scores are cached per file hash, so
+    re-running after changing one page only recomputes that page.
+    """
+    image_names = sorted(file.replace(".xml", "") for file in os.listdir(DATA_DIR) if file.endswith(".xml"))
+
+    if predict:
+        predicted = []
+        for image_name in image_names:
+            try:
+                process_single_image(image_name)
+                predicted.append(image_name)
+                print(f"✅ Finished processing {image_name}")
+            except Exception as e:
+                # Print detailed error info
+                print("❌ [ERROR] An exception occurred!")
+                traceback.print_exc()
+        image_names = predicted
+
+    return evaluate_pages(
+        {image_name: page_inputs(image_name) for image_name in image_names},
+        metrics={name: METRICS[name] for name in ["mAP", "TEDS", "IE"]},
+        workers=workers,
+        output_file=output_file,
+    )
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--score_only", action="store_true", help="Only (re-)score the existing predictions")
+    parser.add_argument("--workers", type=int, default=None, help="Number of scoring processes (default: all cores)")
+    parser.add_argument("--output", type=str, default=SCORES_FILE, help="Per-page scores (.csv or .parquet)")
+    args = parser.parse_args()
+
+    main(predict=not args.score_only, workers=args.workers, output_file=args.output)
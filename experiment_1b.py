@@ -2,6 +2,9 @@ import json
 import os
 from pathlib import Path
 from src.metrics import infomration_extraction_precision_recall
+from src.evaluation import evaluate_pages
+
+SCORES_FILE = "data/eval/experiment_1b.csv"
 
 
 def count_provenance_and_total(json_path):
@@ -109,57 +112,40 @@ def evaluate_after_provenance_filter(json_pred_path, json_gt_path):
     return precision, recall, f1
 
 
-def main(directory_path):
+def provenance_metric(json_pred_path, json_gt_path):
+    """Provenance counts and provenance-filtered P/R/F1 of one prediction (an evaluation metric)."""
+    cell_count, total_count, ratio = count_provenance_and_total(json_pred_path)
+    precision, recall, f1 = evaluate_after_provenance_filter(json_pred_path, json_gt_path)
+    return {
+        "cell_count": cell_count,
+        "total_count": total_count,
+        "provenance_ratio": ratio,
+        "precision": precision,
+        "recall": recall,
+        "f1": f1
+    }
+
+
+PROVENANCE_METRICS = {
+    "provenance": {"func": provenance_metric, "pred": "json", "gt": "gt_info", "version": 1},
+}
+
+
+def main(directory_path, workers=None, output_file=SCORES_FILE):
     """
-    Process all JSON files in a folder and compute average metrics.
+    Score all JSON files in a folder in parallel and print the averages.
+    Scores are cached per file hash; files without ground truth are skipped.
     """
-    json_files = list(Path(directory_path).glob("*.json"))
-    
-    all_results = []
-    
-    for json_file_path in json_files:
-        try:
-            # Count provenance
-            cell_count, total_count, ratio = count_provenance_and_total(str(json_file_path))
-            
-            # Evaluate metrics (assuming corresponding GT file exists)
-            gt_path = os.path.join("data/labels/info", json_file_path.name.replace('.jpg', ''))
-            
-            if os.path.exists(gt_path):
-                precision, recall, f1 = evaluate_after_provenance_filter(str(json_file_path), gt_path)
-                all_results.append({
-                    "file": json_file_path.name,
-                    "cell_count": cell_count,
-                    "total_count": total_count,
-                    "provenance_ratio": ratio,
-                    "precision": precision,
-                    "recall": recall,
-                    "f1": f1
-                })
-        except Exception as e:
-            print(f"Error processing {json_file_path.name}: {e}")
-    
-    # Compute averages
-    if all_results:
-        avg_cell_count = sum(r["cell_count"] for r in all_results) / len(all_results)
-        avg_total_count = sum(r["total_count"] for r in all_results) / len(all_results)
-        avg_provenance_ratio = sum(r["provenance_ratio"] for r in all_results) / len(all_results)
-        avg_precision = sum(r["precision"] for r in all_results) / len(all_results)
-        avg_recall = sum(r["recall"] for r in all_results) / len(all_results)
-        avg_f1 = sum(r["f1"] for r in all_results) / len(all_results)
-        
-        print(f"\nAverages across {len(all_results)} files:")
-        print(f"Avg Cell Count: {avg_cell_count:.2f}")
-        print(f"Avg Total Count: {avg_total_count:.2f}")
-        print(f"Avg Provenance Ratio: {avg_provenance_ratio:.2f}%")
-        print(f"Avg Precision: {avg_precision:.4f}")
-        print(f"Avg Recall: {avg_recall:.4f}")
-        print(f"Avg F1: {avg_f1:.4f}")
-        
-        return all_results
+    page_inputs = {}
+    for json_file_path in sorted(Path(directory_path).glob("*.json")):
+        # Ground truth file: x.jpg.json -> x.json
+        gt_path = os.path.join("data/labels/info", json_file_path.name.replace('.jpg', ''))
+        if os.path.exists(gt_path):
+            page_inputs[json_file_path.name] = {"json": str(json_file_path), "gt_info": gt_path}
+
+    rows, summary = evaluate_pages(page_inputs, metrics=PROVENANCE_METRICS, workers=workers, output_file=output_file)
+    return [dict(row, file=row["page"]) for row in rows if not row["errors"]]
 
 if __name__ == "__main__":
     folder = "data/json"
     main(folder)
-
-
@@ -165,39 +165,13 @@ def count_new_graph_stats(folio_no: int):
 ###############################################################################
 
 def download_images_for_folio(folio_no: int, output_dir="data/images"):
-    from src.image_downlaod.download_stamboeken import process_archive_link
+    from src.image_downlaod.download_stamboeken import folio_archive_links, process_archive_link
     from src.image_downlaod.download_control_book import download_image
 
     os.makedirs(output_dir, exist_ok=True)
 
-    g = Graph()
-    g.parse(f"folio_{folio_no}_graph.ttl", format="turtle")
-
-    query = f"""
-    PREFIX rico: <https://www.ica.org/standards/RiC/ontology#>
-    PREFIX sdo:  <https://schema.org/>
-    PREFIX xsd:  <http://www.w3.org/2001/XMLSchema#>
-
-    SELECT ?archiveID ?archiveLink WHERE {{
-        ?person a sdo:Person .
-        ?person rico:isOrWasSubjectOf ?archive .
-        ?archive rico:identifier ?archiveID .
-
-        BIND(REPLACE(?archiveID, "NL-HaNA_(.*?)_.*?_.*$", "$1") AS ?archiveN)
-        BIND(REPLACE(?archiveID, "NL-HaNA_.*?_(.*?)_.*$", "$1") AS ?inv)
-        BIND(xsd:integer(?inv) AS ?invNum)
-        FILTER (?invNum = {folio_no})
-
-        BIND(uri(CONCAT(
-            "https://www.nationaalarchief.nl/onderzoeken/archief/",
-            ?archiveN, "/invnr/", ?inv, "/file/", ?archiveID
-        )) AS ?archiveLink)
-    }}
-    """
-
-    for row in g.query(query):
-        image_name = f"{row.archiveID}.jpg"
-        download_url = process_archive_link(row.archiveLink, image_name)
+    for image_name, archive_link in folio_archive_links(folio_no, f"folio_{folio_no}_graph.ttl"):
+        download_url = process_archive_link(archive_link, image_name)
 
         if download_url:
             download_image(download_url, image_name, output_dir)
@@ -380,6 +354,7 @@ from src.metrics import infomration_extraction_precision_recall
 from src.person_info_extraction_ontogpt import extract_person_info as information_extractor
 from statistics import mean
 from experiment_1 import parse_html_table, extract_persons_from_table
+from src.row_filter import filter_rows
 
 DATA_DIR = "data/tables/pagexml"
 GT_POLYGON_DIR = "data/labels/polygons"
@@ -390,6 +365,7 @@ OUTPUT_JSON_DIR = "data/json"
 TEMP_DIR = "data/temp"
 SCHEMA_PATH = "data/schema/personbasicinfo.yaml"
 LLM_MODEL = "ollama/llama3"
+ROW_FILTER_THRESHOLD = 0.35  # rows scoring below this are not sent to the model; 0 keeps all
 
 # storage for metrics
 all_scores = {
@@ -415,7 +391,7 @@ def process_single_image(image_name, IE_method="ontogpt"):
 
     if IE_method == "llm":
         # TODO: this method do not store row index in the JSON output
-        persons = extract_persons_from_table(logical_rows)
+        persons = extract_persons_from_table(logical_rows, threshold=ROW_FILTER_THRESHOLD)
         json_obj = {"persons": persons}
         json_out_path = os.path.join(OUTPUT_JSON_DIR, f"{image_name}.json")
         with open(json_out_path, "w", encoding="utf-8") as jf:
@@ -426,7 +402,7 @@ def process_single_image(image_name, IE_method="ontogpt"):
         os.makedirs(TEMP_DIR, exist_ok=True)
 
         try:
-            for i, row in enumerate(logical_rows):
+            for i, row in filter_rows(logical_rows, threshold=ROW_FILTER_THRESHOLD):
                 print(f"Processing row {i+1}/{len(logical_rows)}")
                 temp_file = f"person_{i}.json"
                 try:
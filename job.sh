@@ -1,13 +1,27 @@
 #!/bin/bash
 
+# One pipeline stage as a SLURM array job: task i processes shard i of N.
+# Submit from the repository root (data/, src/ and the LORE checkout are relative to it).
+#   CONDA_ENV=<env> STAGE=kg sbatch --array=0-7 job.sh
+# After all tasks have finished, merge the shard manifests:
+#   sbatch --dependency=afterok:<job id> --wrap "python src/sharding.py merge --stage kg --num_shards 8 --data_path data"
+#
+# Parameters:
+#   CONDA_ENV  conda environment with the pipeline's requirements (required; LORE runs in its own "LORE" env)
+#   STAGE      tsr | reconstruct | ie | kg (default: kg)
+#   STRATEGY   hash | range page partitioning (default: hash)
+#   Time limit: 12 hours per shard below; override with `sbatch -t HH:MM:SS` (the IE stage
+#   with an LLM takes minutes per page, so size it to the pages per shard).
+
 #SBATCH -n 1
-#SBATCH -t 5:00
+#SBATCH -c 8
+#SBATCH -t 12:00:00
+#SBATCH --array=0-7
 
 module load 2022
 module load Anaconda3/2022.05
 
-cd test_cluster
 eval "$(conda shell.bash hook)"
-source activate test_env
+source activate "${CONDA_ENV:?set CONDA_ENV to the pipeline conda environment}"
 echo $CONDA_DEFAULT_ENV
-srun python -u  ~/test_cluster/main.py ~/test_cluster/ground_truth_20_expertsname.tsv ~/test_cluster/output.>
+srun python -u src/sharding.py run --stage ${STAGE:-kg} --data_path data --strategy ${STRATEGY:-hash}
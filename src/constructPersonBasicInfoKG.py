@@ -1,7 +1,16 @@
+import os
 import json
 import csv
+import gzip
+import time
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 from rdflib import Graph, Dataset, Namespace, URIRef, Literal, RDF, BNode
 from lxml import etree
+from tqdm import tqdm
 
 def load_json(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -11,71 +20,120 @@ def load_json(path):
 # MODULE 1 — ASSERTION GRAPH CONSTRUCTION
 # ============================================================
 
-def build_assertion_graph(json_obj, image_name, output_path):
-
-    # Namespaces
-    SCHEMA = Namespace("https://schema.org/")
-    PVN = Namespace("https://personvocab.nl/")
-    DBO = Namespace("http://dbpedia.org/ontology/")
-    PERSON = Namespace("https://pressingmatter.nl/personbaiscinfo/")
-    EX = Namespace("https://www.example.com/")
-
-    predicate_map = {
-        "date_of_birth": SCHEMA.birthDate,
-        "birth_place": SCHEMA.birthPlace,
-        "last_residence": SCHEMA.homeLocation,
-        "country_of_nationality": SCHEMA.nationality,
-        "military_rank": DBO.militaryRank,
-        "basesurname": PVN.baseName,
-        "firstnames": PVN.firstName,
-        "infix": PVN.infix
-    }
+# Namespaces
+SCHEMA = Namespace("https://schema.org/")
+PVN = Namespace("https://personvocab.nl/")
+DBO = Namespace("http://dbpedia.org/ontology/")
+PERSON = Namespace("https://pressingmatter.nl/personbaiscinfo/")
+EX = Namespace("https://www.example.com/")
 
-    cg = Dataset()
-    cg.bind("schema", SCHEMA)
-    cg.bind("pvn", PVN)
-    cg.bind("dbo", DBO)
-    cg.bind("personbasicinfo", PERSON)
-    cg.bind("ex", EX)
+PREDICATE_MAP = {
+    "date_of_birth": SCHEMA.birthDate,
+    "birth_place": SCHEMA.birthPlace,
+    "last_residence": SCHEMA.homeLocation,
+    "country_of_nationality": SCHEMA.nationality,
+    "military_rank": DBO.militaryRank,
+    "basesurname": PVN.baseName,
+    "firstnames": PVN.firstName,
+    "infix": PVN.infix
+}
+
+ASSERTION_GRAPH_URI = URIRef("http://example.org/assertion")
+
+
+class AssertionQuads:
+    """
+    Collects the assertion quads (s, p, o, graph) of one page.
+
+    Graph identifiers (row, cell and text-span graphs) are created once per page
+    and reused; the quads are added to a Dataset in one `addN` call.
+    """
+
+    def __init__(self, image_name):
+        self.image_name = image_name
+        self.quads = []
+        self._graph_uris = {}
 
-    assertion_graph_uri = URIRef("http://example.org/assertion")
+    def graph_uri(self, uri):
+        graph = self._graph_uris.get(uri)
+        if graph is None:
+            graph = self._graph_uris[uri] = URIRef(uri)
+        return graph
 
-    for idx, person in enumerate(json_obj["persons"], start=1):
+    def row_graph(self, row):
+        return self.graph_uri(f"http://example.org/graph/{self.image_name}/row_{int(row)}")
+
+    def cell_graph(self, cell):
+        return self.graph_uri(f"http://example.org/graph/{self.image_name}/{cell}")
+
+    def span_graph(self, span):
+        return self.graph_uri(f"http://example.org/text_span/{self.image_name}/{str(span).replace(':', '_')}")
+
+    def add(self, s, p, o, graph=ASSERTION_GRAPH_URI):
+        self.quads.append((s, p, o, graph))
+
+
+def assertion_quads(json_obj, image_name, indices=None):
+    """
+    Return the assertion quads for all persons of one page.
+
+    Persons are numbered from 1 in list order; `indices` gives explicit numbers
+    (used to rebuild a subset of the persons of a page).
+    """
+    builder = AssertionQuads(image_name)
+
+    for idx, person in zip(indices or range(1, len(json_obj["persons"]) + 1), json_obj["persons"]):
         person_uri = URIRef(f"http://example.org/person/{image_name}/{idx}")
-        assertion_graph = Graph(store=cg.store, identifier=assertion_graph_uri)
-        assertion_graph.add((person_uri, RDF.type, PERSON.Person))
+        builder.add(person_uri, RDF.type, PERSON.Person)
 
         for key, value_dict in person.items():
 
             # -------------------- Name block ---------------------
             if key == "name":
-                handle_name_block(
-                    person_uri, value_dict, cg, assertion_graph,
-                    image_name, predicate_map
-                )
+                handle_name_block(person_uri, value_dict, builder)
                 continue
 
             # -------------------- Normal field -------------------
-            handle_standard_field(
-                person_uri, key, value_dict, cg, image_name, predicate_map
-            )
+            handle_standard_field(person_uri, key, value_dict, builder)
 
-    cg.serialize(output_path, format="trig")
+    return builder.quads
+
+
+def new_assertion_dataset():
+    cg = Dataset()
+    cg.bind("schema", SCHEMA)
+    cg.bind("pvn", PVN)
+    cg.bind("dbo", DBO)
+    cg.bind("personbasicinfo", PERSON)
+    cg.bind("ex", EX)
     return cg
 
 
-def handle_name_block(person_uri, name_dict, cg, assertion_graph, image_name, predicate_map):
-    PVN = Namespace("https://personvocab.nl/")
+def build_assertion_graph(json_obj, image_name, output_path=None, writer=None):
+    """
+    Build the assertion graph of one page.
+
+    With a `writer` (see `NQuadsWriter`) the quads are streamed to it and returned;
+    otherwise a Dataset is built, serialized to `output_path` as TriG and returned.
+    """
+    quads = assertion_quads(json_obj, image_name)
+    if writer is not None:
+        writer.write(quads)
+        return quads
+
+    cg = new_assertion_dataset()
+    cg.addN(quads)
+    cg.serialize(output_path, format="trig")
+    return cg
 
+
+def handle_name_block(person_uri, name_dict, builder):
     name_blank = BNode()
-    assertion_graph.add((person_uri, PVN.hasName, name_blank))
+    builder.add(person_uri, PVN.hasName, name_blank)
 
     for sub_key, sub_value_dict in name_dict.items():
         value = sub_value_dict.get("value")
-        row = sub_value_dict.get("row")
-        cells = sub_value_dict.get("cell")
-        spans = sub_value_dict.get("original_spans")
-        predicate = predicate_map.get(sub_key)
+        predicate = PREDICATE_MAP.get(sub_key)
 
         if not (value and predicate):
             continue
@@ -84,20 +142,16 @@ def handle_name_block(person_uri, name_dict, cg, assertion_graph, image_name, pr
             target=name_blank,
             predicate=predicate,
             value=value,
-            row=row,
-            cells=cells,
-            spans=spans,
-            cg=cg,
-            image_name=image_name
+            row=sub_value_dict.get("row"),
+            cells=sub_value_dict.get("cell"),
+            spans=sub_value_dict.get("original_spans"),
+            builder=builder
         )
 
 
-def handle_standard_field(person_uri, key, value_dict, cg, image_name, predicate_map):
+def handle_standard_field(person_uri, key, value_dict, builder):
     value = value_dict.get("value")
-    row = value_dict.get("row")
-    cells = value_dict.get("cell")
-    spans = value_dict.get("original_spans")
-    predicate = predicate_map.get(key)
+    predicate = PREDICATE_MAP.get(key)
 
     if not (value and predicate):
         return
@@ -106,48 +160,37 @@ def handle_standard_field(person_uri, key, value_dict, cg, image_name, predicate
         target=person_uri,
         predicate=predicate,
         value=value,
-        row=row,
-        cells=cells,
-        spans=spans,
-        cg=cg,
-        image_name=image_name
+        row=value_dict.get("row"),
+        cells=value_dict.get("cell"),
+        spans=value_dict.get("original_spans"),
+        builder=builder
     )
 
 
-def add_value_to_graph(target, predicate, value, row, cells, spans, cg, image_name):
+def add_value_to_graph(target, predicate, value, row, cells, spans, builder):
     """Adds a value to multiple graphs depending on provenance."""
+    literal = Literal(value)
+
     # Add to assertion graph
-    assertion_graph_uri = URIRef("http://example.org/assertion")
-    assertion_graph = Graph(store=cg.store, identifier=assertion_graph_uri)
-    assertion_graph.add((target, predicate, Literal(value)))
+    builder.add(target, predicate, literal)
 
     # Row-based graphs
     if row is not None:
-        graph_uri = URIRef(f"http://example.org/graph/{image_name}/row_{int(row)}")
-        g = Graph(store=cg.store, identifier=graph_uri)
-        g.add((target, predicate, Literal(value)))
+        builder.add(target, predicate, literal, builder.row_graph(row))
 
     # Cell-based graphs
     if isinstance(cells, list):
         for cell in cells:
-            graph_uri = URIRef(f"http://example.org/graph/{image_name}/{cell}")
-            g = Graph(store=cg.store, identifier=graph_uri)
-            g.add((target, predicate, Literal(value)))
+            builder.add(target, predicate, literal, builder.cell_graph(cell))
     elif cells:
-        graph_uri = URIRef(f"http://example.org/graph/{image_name}/{cells}")
-        g = Graph(store=cg.store, identifier=graph_uri)
-        g.add((target, predicate, Literal(value)))
+        builder.add(target, predicate, literal, builder.cell_graph(cells))
 
     # Text span graphs
     if isinstance(spans, list):
         for span in spans:
-            graph_uri = URIRef(f"http://example.org/text_span/{image_name}/{str(span).replace(':', '_')}")
-            g = Graph(store=cg.store, identifier=graph_uri)
-            g.add((target, predicate, Literal(value)))
+            builder.add(target, predicate, literal, builder.span_graph(span))
     elif spans:
-        graph_uri = URIRef(f"http://example.org/text_span/{image_name}/{str(spans).replace(':', '_')}")
-        g = Graph(store=cg.store, identifier=graph_uri)
-        g.add((target, predicate, Literal(value)))
+        builder.add(target, predicate, literal, builder.span_graph(spans))
 
 
 # ============================================================
@@ -171,253 +214,672 @@ def extract_elements_with_row(data):
     return results
 
 
-def get_cell_info(root, cell_id):
-    cell = root.find(f".//{{*}}TableCell[@id='{cell_id}']")
-    if cell is None:
-        return None
-    coords = cell.find(".//{*}Coords")
-    return {
-        "cell_id": cell_id,
-        "row": cell.get("row"),
-        "col": cell.get("col"),
-        "coords": coords.get("points") if coords is not None else None
-    }
-
-
-def add_provenance_graph(json_path, pagexml_path, stamboek_nummer, output_path):
-    EX = Namespace("http://example.org/ontology/")
-    PROV = Namespace("http://www.w3.org/ns/prov#")
-    RDFS = Namespace("http://www.w3.org/2000/01/rdf-schema#")
-    CSVW = Namespace("http://www.w3.org/ns/csvw#")
-    SKOS = Namespace("http://www.w3.org/2004/02/skos/core#")
-
-    json_data = load_json(json_path)
-    elements = extract_elements_with_row(json_data)
-
-    tree = etree.parse(pagexml_path)
-    root = tree.getroot()
-
+def _read_cell_index(pagexml_path):
+    index = {}
+    for _, cell in etree.iterparse(pagexml_path, events=("end",), tag="{*}TableCell"):
+        cell_id = cell.get("id")
+        coords = cell.find(".//{*}Coords")
+        index[cell_id] = {
+            "cell_id": cell_id,
+            "row": cell.get("row"),
+            "col": cell.get("col"),
+            "coords": coords.get("points") if coords is not None else None
+        }
+        cell.clear()
+    return index
+
+
+@lru_cache(maxsize=32)
+def _cached_cell_index(pagexml_path, mtime_ns):
+    return _read_cell_index(pagexml_path)
+
+
+def load_cell_index(pagexml_path):
+    """
+    Parse a PageXML file once into {cell_id: {"cell_id", "row", "col", "coords"}}.
+
+    Cached per file (and modification time), so assertion and provenance
+    building for the same page share one parse.
+    """
+    path = os.path.abspath(pagexml_path)
+    return _cached_cell_index(path, os.stat(path).st_mtime_ns)
+
+
+def get_cell_info(cell_index, cell_id):
+    return cell_index.get(cell_id)
+
+
+PROV = Namespace("http://www.w3.org/ns/prov#")
+ONTO = Namespace("http://example.org/ontology/")
+CSVW = Namespace("http://www.w3.org/ns/csvw#")
+SKOS = Namespace("http://www.w3.org/2004/02/skos/core#")
+RDFS = Namespace("http://www.w3.org/2000/01/rdf-schema#")
+
+PROVENANCE_GRAPH_URI = URIRef("http://example.org/provenance")
+
+AGENT_1 = URIRef("http://example.org/agent/1")
+PROJECT_AGENT = URIRef("http://example.org/agent/2")
+NATIONAL_ARCHIVES = URIRef("http://example.org/agent/3")
+
+
+class ProvenanceQuads:
+    """
+    Collects the provenance quads of one page.
+
+    The page-level skeleton (agents, image, table, JSON file, page activities) is
+    emitted once, and each row, cell and span once, instead of once per JSON element.
+    """
+
+    def __init__(self, stamboek_nummer, graph=PROVENANCE_GRAPH_URI):
+        self.stamboek_nummer = stamboek_nummer
+        self.graph = graph
+        self.quads = []
+        self._skeleton_done = False
+        self._rows_done = set()
+        self._cells_done = set()
+        self._spans_done = set()
+
+        self.kg_construction_activity = URIRef(f"http://example.org/activity/stamboekenKGConstructionactivity/{stamboek_nummer}")
+        self.table_construction_activity = URIRef(f"http://example.org/activity/TableExtraction/{stamboek_nummer}")
+        self.json_uri = URIRef(f"http://example.org/json/{stamboek_nummer}.json")
+        self.table_uri = URIRef(f"http://example.org/Table/{stamboek_nummer}")
+        self.stamboek_uri = URIRef(f"http://example.org/Image/{stamboek_nummer}")
+
+    @property
+    def count(self):
+        """Number of provenance triples generated for this page."""
+        return len(self.quads)
+
+    def add(self, s, p, o):
+        self.quads.append((s, p, o, self.graph))
+
+    def add_skeleton(self):
+        """Page-level triples shared by all rows (emitted once)."""
+        if self._skeleton_done:
+            return
+        self._skeleton_done = True
+        nummer = self.stamboek_nummer
+        add = self.add
+
+        # agents
+        add(AGENT_1, RDF.type, PROV.Agent)
+        add(AGENT_1, RDFS.label, Literal("Jane Doe"))
+        add(PROJECT_AGENT, RDF.type, PROV.Agent)
+        add(PROJECT_AGENT, RDFS.label, Literal("Pressing Matter Project"))
+        add(AGENT_1, PROV.actedOnBehalfOf, PROJECT_AGENT)
+
+        # activity
+        add(self.kg_construction_activity, RDF.type, PROV.Activity)
+        add(self.kg_construction_activity, PROV.wasAssociatedWith, AGENT_1)
+        add(self.kg_construction_activity, PROV.wasInformedBy, self.table_construction_activity)
+        add(self.table_construction_activity, RDF.type, PROV.Activity)
+
+        add(self.json_uri, RDF.type, PROV.Entity)
+        add(self.json_uri, RDFS.label, Literal(f"JSON file: {nummer}.json"))
+
+        # TODO: add more information about prov:Activity
+        # add(self.kg_construction_activity, PROV.endedAtTime, Literal(end_time))
+        # add(self.kg_construction_activity, PROV.startedAtTime, Literal(start_time))
+
+        # Create a Table instance URI
+        add(self.table_uri, RDF.type, PROV.Entity)
+        add(self.table_uri, RDF.type, ONTO.Table)
+        add(self.table_uri, RDFS.label, Literal(f"Table from {nummer}"))
+        add(self.table_uri, PROV.wasGeneratedBy, self.table_construction_activity)
+
+        # stamboeken
+        add(self.stamboek_uri, RDF.type, PROV.Entity)
+        add(self.stamboek_uri, RDF.type, ONTO.Image)
+        add(self.stamboek_uri, RDFS.label, Literal(f"Stamboek {nummer}"))
+        add(self.table_construction_activity, PROV.used, self.stamboek_uri)
+        add(self.table_uri, PROV.wasDerivedFrom, self.stamboek_uri)
+        add(NATIONAL_ARCHIVES, RDF.type, PROV.Agent)
+        add(NATIONAL_ARCHIVES, RDFS.label, Literal("Nationaal Archief"))
+        add(self.stamboek_uri, PROV.wasAttributedTo, NATIONAL_ARCHIVES)
+
+    def add_row(self, row_id):
+        """Row entity, row graph attribution and per-row activities; returns the row URI."""
+        nummer = self.stamboek_nummer
+        row_uri = URIRef(f"http://example.org/id/{nummer}/row_{row_id}")
+        if row_id in self._rows_done:
+            return row_uri
+        self._rows_done.add(row_id)
+        add = self.add
+
+        row_graph_uri = URIRef(f"http://example.org/graph/{nummer}/row_{row_id}")
+        add(row_graph_uri, PROV.wasDerivedFrom, row_uri)
+        add(row_uri, RDF.type, PROV.Entity)
+        add(row_uri, RDF.type, ONTO.Row)
+        add(row_uri, RDFS.label, Literal(f"Row {row_id} from {nummer}"))
+        add(row_graph_uri, PROV.wasAttributedTo, AGENT_1)
+
+        information_extraction_activity = URIRef(f"http://example.org/activity/InformationExtraction/{nummer}/row_{row_id}")
+        kg_construction_activity = URIRef(f"http://example.org/activity/KGConstruction/{nummer}/row_{row_id}")
+        add(self.kg_construction_activity, PROV.wasInformedBy, information_extraction_activity)
+        add(information_extraction_activity, RDF.type, PROV.Activity)
+        add(information_extraction_activity, PROV.used, row_uri)
+        add(self.kg_construction_activity, PROV.wasInformedBy, kg_construction_activity)
+        add(kg_construction_activity, RDF.type, PROV.Activity)
+        add(kg_construction_activity, PROV.used, self.json_uri)
+
+        add(row_uri, SKOS.partOf, self.table_uri)
+        return row_uri
+
+    def first_time(self, seen, key):
+        if key in seen:
+            return False
+        seen.add(key)
+        return True
+
+
+def new_provenance_dataset():
     g = Dataset()
-    g.bind("ex", EX)
+    g.bind("ex", ONTO)
     g.bind("prov", PROV)
     g.bind("csvw", CSVW)
     g.bind("skos", SKOS)
     g.bind("rdfs", RDFS)
+    return g
 
-    provenance_graph_uri = URIRef("http://example.org/provenance")
-    provenance_graph = Graph(store=g.store, identifier=provenance_graph_uri)
 
+def provenance_quads(elements, cell_index, stamboek_nummer):
+    """Return the provenance builder (quads and triple count) for the row elements of one page."""
+    builder = ProvenanceQuads(stamboek_nummer)
     for elem in elements:
-        process_row_provenance(elem, provenance_graph, root, stamboek_nummer)
+        process_row_provenance(elem, builder, cell_index, stamboek_nummer)
+    return builder
+
+
+def add_provenance_graph(json_path, pagexml_path, stamboek_nummer, output_path=None, cell_index=None, writer=None):
+    """
+    Build the provenance graph of one page.
+
+    With a `writer` the quads are streamed to it and returned; otherwise a Dataset
+    is built, serialized to `output_path` as TriG and returned.
+    """
+    json_data = load_json(json_path)
+    elements = extract_elements_with_row(json_data)
+
+    if cell_index is None:
+        cell_index = load_cell_index(pagexml_path)
+
+    builder = provenance_quads(elements, cell_index, stamboek_nummer)
+    print(f"Generated {builder.count} provenance triples for {stamboek_nummer}")
 
+    if writer is not None:
+        writer.write(builder.quads)
+        return builder.quads
+
+    g = new_provenance_dataset()
+    g.addN(builder.quads)
     g.serialize(output_path, format="trig")
     return g
 
 
-def process_row_provenance(elem, g, root, stamboek_nummer):
+def process_row_provenance(elem, builder, cell_index, stamboek_nummer):
     """Handles one JSON row block and creates its provenance triples."""
-    PROV = Namespace("http://www.w3.org/ns/prov#")
-    EX = Namespace("http://example.org/ontology/")
-    CSVW = Namespace("http://www.w3.org/ns/csvw#")
-    SKOS = Namespace("http://www.w3.org/2004/02/skos/core#")
-    RDFS = Namespace("http://www.w3.org/2000/01/rdf-schema#")
-
     row_id = elem["row"]
     cells = elem.get("cell")
     spans = elem.get("original_spans")
 
-    row_graph_uri = URIRef(f"http://example.org/graph/{stamboek_nummer}/row_{row_id}")
-    row_uri = URIRef(f"http://example.org/id/{stamboek_nummer}/row_{row_id}")
-
-    g.add((row_graph_uri, PROV.wasDerivedFrom, row_uri))
-    g.add((row_uri, RDF.type, PROV.Entity))
-    g.add((row_uri, RDF.type, EX.Row))
-    g.add((row_uri, RDFS.label, Literal(f"Row {row_id} from {stamboek_nummer}")))
-
-    # agents
-    agent_1 = URIRef("http://example.org/agent/1")
-    g.add((agent_1, RDF.type, PROV.Agent))
-    g.add((agent_1, RDFS.label, Literal("Jane Doe")))
-    g.add((row_graph_uri, PROV.wasAttributedTo, agent_1))
-    project_agent = URIRef("http://example.org/agent/2")
-    g.add((project_agent, RDF.type, PROV.Agent))
-    g.add((project_agent, RDFS.label, Literal("Pressing Matter Project")))
-    g.add((agent_1, PROV.actedOnBehalfOf, project_agent))
-
-    # activity
-    stamboekenKGConstructionactivity = URIRef(f"http://example.org/activity/stamboekenKGConstructionactivity/{stamboek_nummer}")
-    tableConstructionactivity = URIRef(f"http://example.org/activity/TableExtraction/{stamboek_nummer}")
-    informationExtractionactivity = URIRef(f"http://example.org/activity/InformationExtraction/{stamboek_nummer}/row_{row_id}")
-    KGConstructionactivity = URIRef(f"http://example.org/activity/KGConstruction/{stamboek_nummer}/row_{row_id}")
-            
-    g.add((stamboekenKGConstructionactivity, RDF.type, PROV.Activity))
-    # g.add((named_graph_uri, PROV.wasGeneratedBy, stamboekenKGConstructionactivity))
-    g.add((stamboekenKGConstructionactivity, PROV.wasAssociatedWith, agent_1))
-    g.add((stamboekenKGConstructionactivity, PROV.wasInformedBy, tableConstructionactivity))
-    g.add((tableConstructionactivity, RDF.type, PROV.Activity))
-    g.add((stamboekenKGConstructionactivity, PROV.wasInformedBy, informationExtractionactivity))
-    g.add((informationExtractionactivity, RDF.type, PROV.Activity))
-    g.add((informationExtractionactivity, PROV.used, row_uri))
-    g.add((stamboekenKGConstructionactivity, PROV.wasInformedBy, KGConstructionactivity))
-    g.add((KGConstructionactivity, RDF.type, PROV.Activity))
-
-    json_URI = URIRef(f"http://example.org/json/{stamboek_nummer}.json")
-    g.add((json_URI, RDF.type, PROV.Entity))
-    g.add((json_URI, RDFS.label, Literal(f"JSON file: {stamboek_nummer}.json")))
-    g.add((KGConstructionactivity, PROV.used, json_URI))
-
-    # TODO: add more information about prov:Activity
-    # g.add((stamboekenKGConstructionactivity,PROV.endedAtTime, Literal(end_time)))
-    # g.add((stamboekenKGConstructionactivity,PROV.startedAtTime, Literal(start_time)))
-
-    # Create a Table instance URI
-    table_uri = URIRef(f"http://example.org/Table/{stamboek_nummer}")
-    g.add((table_uri, RDF.type, PROV.Entity))
-    g.add((table_uri, RDF.type, EX.Table))
-    g.add((table_uri, RDFS.label, Literal(f"Table from {stamboek_nummer}")))
-    g.add((table_uri, PROV.wasGeneratedBy, tableConstructionactivity))
-    g.add((row_uri, SKOS.partOf, table_uri))
-        
-    # stamboeken
-    stamboek_uri = URIRef(f"http://example.org/Image/{stamboek_nummer}")
-    g.add((stamboek_uri, RDF.type, PROV.Entity))
-    g.add((stamboek_uri, RDF.type, EX.Image))
-    g.add((stamboek_uri, RDFS.label, Literal(f"Stamboek {stamboek_nummer}")))
-    g.add((tableConstructionactivity, PROV.used, stamboek_uri))
-    g.add((table_uri, PROV.wasDerivedFrom, stamboek_uri))
-    national_archives = URIRef("http://example.org/agent/3")
-    g.add((national_archives, RDF.type, PROV.Agent))
-    g.add((national_archives, RDFS.label, Literal("Nationaal Archief")))
-    g.add((stamboek_uri, PROV.wasAttributedTo, national_archives))
+    builder.add_skeleton()
+    row_uri = builder.add_row(row_id)
 
     # Cell entries
     if cells:
         if isinstance(cells, list):
             for cell_id in cells:
-                process_cell_provenance(cell_id, g, root, stamboek_nummer, row_uri)
+                process_cell_provenance(cell_id, builder, cell_index, stamboek_nummer, row_uri)
         else:
-            process_cell_provenance(cells, g, root, stamboek_nummer, row_uri)
+            process_cell_provenance(cells, builder, cell_index, stamboek_nummer, row_uri)
 
     # Text spans
     if spans:
         if isinstance(spans, list):
             for span in spans:
-                process_span(span, g, stamboek_nummer, row_uri)
+                process_span(span, builder, stamboek_nummer, row_uri)
         else:
-            process_span(spans, g, stamboek_nummer, row_uri)
+            process_span(spans, builder, stamboek_nummer, row_uri)
 
 
-def process_cell_provenance(cell_id, g, root, stamboek_nummer, row_uri):
-    PROV = Namespace("http://www.w3.org/ns/prov#")
-    CSVW = Namespace("http://www.w3.org/ns/csvw#")
-    EX = Namespace("http://example.org/ontology/")
-    SKOS = Namespace("http://www.w3.org/2004/02/skos/core#")
-    RDFS = Namespace("http://www.w3.org/2000/01/rdf-schema#")
+def process_cell_provenance(cell_id, builder, cell_index, stamboek_nummer, row_uri):
+    if not builder.first_time(builder._cells_done, (cell_id, row_uri)):
+        return
 
-    info = get_cell_info(root, cell_id)
+    info = get_cell_info(cell_index, cell_id)
     if info is None:
         return
 
     cell_uri = URIRef(f"http://example.org/id/{stamboek_nummer}/{cell_id}")
 
-    g.add((cell_uri, RDF.type, PROV.Entity))
-    g.add((cell_uri, RDFS.label, Literal(f"Cell {cell_id} from {stamboek_nummer}")))
-    g.add((cell_uri, CSVW.rowNumber, Literal(info["row"])))
-    g.add((cell_uri, CSVW.columnNumber, Literal(info["col"])))
-    g.add((cell_uri, EX.ImageRegion, Literal(info["coords"])))
-    g.add((cell_uri, SKOS.partOf, row_uri))
+    builder.add(cell_uri, RDF.type, PROV.Entity)
+    builder.add(cell_uri, RDFS.label, Literal(f"Cell {cell_id} from {stamboek_nummer}"))
+    builder.add(cell_uri, CSVW.rowNumber, Literal(info["row"]))
+    builder.add(cell_uri, CSVW.columnNumber, Literal(info["col"]))
+    builder.add(cell_uri, ONTO.ImageRegion, Literal(info["coords"]))
+    builder.add(cell_uri, SKOS.partOf, row_uri)
 
 
-def process_span(span, g, stamboek_nummer, row_uri):
-    PROV = Namespace("http://www.w3.org/ns/prov#")
-    EX = Namespace("http://example.org/ontology/")
-    SKOS = Namespace("http://www.w3.org/2004/02/skos/core#")
-    RDFS = Namespace("http://www.w3.org/2000/01/rdf-schema#")
+def process_span(span, builder, stamboek_nummer, row_uri):
+    if not builder.first_time(builder._spans_done, (span, row_uri)):
+        return
 
     span_id = str(span).replace(":", "_")
     span_uri = URIRef(f"http://example.org/id/{stamboek_nummer}/{span_id}")
 
-    g.add((span_uri, RDF.type, PROV.Entity))
-    g.add((span_uri, EX.range, Literal(span)))
-    g.add((span_uri, SKOS.partOf, row_uri))
-    g.add((span_uri, RDFS.label, Literal(f"Span {span}")))
+    builder.add(span_uri, RDF.type, PROV.Entity)
+    builder.add(span_uri, ONTO.range, Literal(span))
+    builder.add(span_uri, SKOS.partOf, row_uri)
+    builder.add(span_uri, RDFS.label, Literal(f"Span {span}"))
 
 
 # ============================================================
-# MODULE 3 — TRIPLE COUNTING
+# MODULE 3 — STREAMING N-QUADS OUTPUT
 # ============================================================
 
-def count_triples(path):
-    cg = Dataset()
-    cg.parse(path, format="trig")
-    unique = set(cg.quads((None, None, None, None)))
-    spo = set((s, p, o) for s, p, o, _ in unique)
-    return len(unique), len(spo)
+def _nquads_escape(value):
+    return (value.replace("\\", "\\\\").replace('"', '\\"')
+                 .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def nquads_term(term):
+    """Serialize an rdflib term in N-Quads syntax."""
+    if isinstance(term, Literal):
+        text = f'"{_nquads_escape(str(term))}"'
+        if term.language:
+            return f"{text}@{term.language}"
+        if term.datatype:
+            return f"{text}^^<{term.datatype}>"
+        return text
+    if isinstance(term, BNode):
+        return f"_:{term}"
+    return f"<{term}>"
+
+
+class NQuadsWriter:
+    """
+    Appends quads to an N-Quads file as each page is produced, so memory does not
+    grow with the size of the folio. Paths ending in `.gz` are gzip-compressed.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.count = 0
+        mode = "at" if append else "wt"
+        opener = gzip.open if path.endswith(".gz") else open
+        self._file = opener(path, mode, encoding="utf-8")
+
+    def write(self, quads):
+        lines = [
+            f"{nquads_term(s)} {nquads_term(p)} {nquads_term(o)} {nquads_term(g)} .\n"
+            for s, p, o, g in quads
+        ]
+        self._file.write("".join(lines))
+        self.count += len(lines)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def nquads_to_trig(nquads_path, trig_path, dataset=None):
+    """
+    Optional final pass: convert a (gzip) N-Quads file to pretty TriG.
+
+    This loads the whole file, so only use it when the folio fits in memory.
+    `dataset` is an empty Dataset with the prefixes to bind (e.g. `new_assertion_dataset()`).
+    """
+    cg = dataset if dataset is not None else Dataset()
+    opener = gzip.open if nquads_path.endswith(".gz") else open
+    with opener(nquads_path, "rb") as f:
+        cg.parse(source=f, format="nquads")
+    cg.serialize(trig_path, format="trig")
+    return trig_path
+
+
+def stream_folio(directory, output_dir="data/triples", compress=True, to_trig=False):
+    """
+    Stream the assertion and provenance quads of every page in `directory`
+    into two folio-level N-Quads files.
+    """
+    suffix = ".nq.gz" if compress else ".nq"
+    assertion_output = os.path.join(output_dir, "assertion" + suffix)
+    provenance_output = os.path.join(output_dir, "provenance" + suffix)
+    os.makedirs(output_dir, exist_ok=True)
+
+    with NQuadsWriter(assertion_output) as assertion_writer, NQuadsWriter(provenance_output) as provenance_writer:
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".jpg"):
+                continue
+            image_name = filename
+            json_path = f"data/json/{image_name}.json"
+            pagexml_path = f"data/tables/pagexml/{image_name}.xml"
+
+            build_assertion_graph(load_json(json_path), image_name, writer=assertion_writer)
+            add_provenance_graph(json_path, pagexml_path, image_name, writer=provenance_writer)
+
+    print(f"Streamed {assertion_writer.count} assertion quads to {assertion_output}")
+    print(f"Streamed {provenance_writer.count} provenance quads to {provenance_output}")
+
+    if to_trig:
+        nquads_to_trig(assertion_output, os.path.join(output_dir, "assertion.trig"), new_assertion_dataset())
+        nquads_to_trig(provenance_output, os.path.join(output_dir, "provenance.trig"), new_provenance_dataset())
+
+    return assertion_output, provenance_output
 
-def count_triples_with_text_span(path):
-    cg = Dataset()
-    cg.parse(path, format="trig")
-    unique = set(cg.quads((None, None, None, None)))
-    spo = set((s, p, o) for s, p, o, g in unique if "text_span" in str(g))
-    return len(unique), len(spo)
 
 # ============================================================
-# MAIN EXECUTION PIPELINE
+# MODULE 4 — TRIPLE COUNTING
+# ============================================================
+
+def graph_type(graph):
+    """Classify a named graph as assertion, provenance, row, cell or text_span."""
+    uri = str(getattr(graph, "identifier", graph))
+    if uri == str(ASSERTION_GRAPH_URI):
+        return "assertion"
+    if uri == str(PROVENANCE_GRAPH_URI):
+        return "provenance"
+    if "text_span" in uri:
+        return "text_span"
+    if "/row_" in uri:
+        return "row"
+    if "/graph/" in uri:
+        return "cell"
+    return "other"
+
+
+class TripleStats:
+    """
+    Accumulates triple statistics while quads are emitted, so the written
+    files never have to be parsed again to count them.
+    """
+
+    def __init__(self):
+        self._quads = set()
+        self._spo = set()
+        self._graph_quads = {}
+        self._graph_spo = {}
+
+    def add(self, quads):
+        for s, p, o, g in quads:
+            quad = (s, p, o, g)
+            if quad in self._quads:
+                continue
+            self._quads.add(quad)
+            spo = (s, p, o)
+            self._spo.add(spo)
+            kind = graph_type(g)
+            self._graph_quads[kind] = self._graph_quads.get(kind, 0) + 1
+            self._graph_spo.setdefault(kind, set()).add(spo)
+
+    # Lets a TripleStats be passed wherever a writer is accepted
+    write = add
+
+    def record(self):
+        return {
+            "quads": len(self._quads),
+            "spo": len(self._spo),
+            "graphs": {
+                kind: {"quads": self._graph_quads[kind], "spo": len(self._graph_spo[kind])}
+                for kind in sorted(self._graph_quads)
+            },
+        }
+
+
+# ============================================================
+# MODULE 5 — SHACL VALIDATION
 # ============================================================
 from pyshacl  import validate
-import os
-def main(directory):
-    # Iterate through all files in the directory
-    for filename in os.listdir(directory):
-        if filename.endswith(".jpg"):
-            image_name = filename
-            json_path = f"data/json/{image_name}.json"
-            pagexml_path = f"data/tables/pagexml/{image_name}.xml"
-            assertion_output = f"data/triples/{image_name.replace('.jpg', '')}_assertion.trig"
-            provenance_output = f"data/triples/{image_name.replace('.jpg', '')}_provenance.trig"
-            provenace_shacl_shape = "data/schema/data_provenance.ttl"
-
-            json_obj = load_json(json_path)
-
-            # 1. Assertion graph
-            build_assertion_graph(json_obj, image_name, assertion_output)
-
-            # 2. Provenance graph
-            add_provenance_graph(json_path, pagexml_path, image_name, provenance_output)
-
-            # 3. Triple counts
-            graphs_total, spo_total = count_triples(assertion_output)
-            print(
-                f"Triple counts for {image_name}:"
-                f"\n\t{graphs_total} quads across all graphs (includes graph/context), and"
-                f"\n\t{spo_total} unique triples (subject-predicate-object, graph context ignored)."
-            )
-
-            graphs_text_span, spo_text_span = count_triples_with_text_span(assertion_output)
-            print(
-                f"Text span triple counts for {image_name}:"
-                f"\n\t{graphs_text_span} quads across text span graphs (includes graph/context), and"
-                f"\n\t{spo_text_span} unique triples (subject-predicate-object, graph context ignored)."
-            )
-
-            # If SHACL validation is needed
-            try:
-                conforms, results_graph, results_text = validate(
-                        provenance_output,
-                        shacl_graph=provenace_shacl_shape,
-                        data_graph_format="trig",
-                        shacl_graph_format="turtle",
-                        inference="rdfs",
-                        abort_on_error=False,
-                        meta_shacl=False,
-                        advanced=False,
-                        js=False,
-                    )
-                print(f"Provenance SHACL Conforms for {image_name}:", conforms)
-                print(results_text)
-            except Exception as e:
-                print("Error during SHACL validation for", image_name, ":", e)
-
-        print("===================================\n")
+
+SH = Namespace("http://www.w3.org/ns/shacl#")
+PROVENANCE_SHAPES = "data/schema/data_provenance.ttl"
+SHACL_OPTIONS = {
+    "inference": "rdfs",
+    "abort_on_error": False,
+    "meta_shacl": False,
+    "advanced": False,
+    "js": False,
+}
+
+
+@lru_cache(maxsize=4)
+def load_shapes_graph(shapes_path=PROVENANCE_SHAPES):
+    """Parse a SHACL shapes file once per process and reuse it for every page."""
+    shapes = Graph()
+    shapes.parse(shapes_path, format="turtle")
+    return shapes
+
+
+def validate_graph(data_graph, shapes_path=PROVENANCE_SHAPES):
+    """Validate an in-memory graph/dataset; returns (conforms, results_graph, results_text)."""
+    return validate(data_graph, shacl_graph=load_shapes_graph(shapes_path), **SHACL_OPTIONS)
+
+
+def attribute_results(results_graph, pages):
+    """
+    Split the results of a validation over the pages they belong to.
+
+    A result belongs to the page whose name occurs in its focus node URI; results
+    on shared nodes (e.g. agents) are collected under "shared".
+    """
+    by_length = sorted(pages, key=len, reverse=True)
+    attributed = {page: [] for page in pages}
+    attributed["shared"] = []
+    for result in results_graph.objects(None, SH.result):
+        focus = str(results_graph.value(result, SH.focusNode))
+        message = str(results_graph.value(result, SH.resultMessage))
+        page = next((page for page in by_length if page in focus), "shared")
+        attributed[page].append(message)
+    return attributed
+
+
+def _init_shacl_worker(shapes_path):
+    """Pool initializer: parse the shapes graph once per worker process."""
+    load_shapes_graph(shapes_path)
+
+
+# ============================================================
+# MAIN EXECUTION PIPELINE
+# ============================================================
+def kg_page_paths(image_name, data_path="data"):
+    """Input and output paths used to build the KG of one page image."""
+    base_name = image_name.replace('.jpg', '')
+    triples_dir = os.path.join(data_path, "triples")
+    return {
+        "json": os.path.join(data_path, "json", image_name + ".json"),
+        "pagexml": os.path.join(data_path, "tables", "pagexml", image_name + ".xml"),
+        "assertion": os.path.join(triples_dir, base_name + "_assertion.trig"),
+        "provenance": os.path.join(triples_dir, base_name + "_provenance.trig"),
+        "assertion_nq": os.path.join(triples_dir, "pages", base_name + "_assertion.nq"),
+        "provenance_nq": os.path.join(triples_dir, "pages", base_name + "_provenance.nq"),
+        "stats": os.path.join(triples_dir, base_name + "_stats.json"),
+    }
+
+
+def folio_of(image_name):
+    """Folio (inventory) an image belongs to, e.g. NL-HaNA_2.10.50_45_0143.jpg -> NL-HaNA_2.10.50_45."""
+    return image_name.replace('.jpg', '').rsplit("_", 1)[0]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_quads(dataset, quads, trig_path, nquads_path):
+    dataset.addN(quads)
+    dataset.serialize(trig_path, format="trig")
+    with NQuadsWriter(nquads_path) as writer:
+        writer.write(quads)
+
+
+def build_page_kg(image_name, data_path="data", shapes_path=PROVENANCE_SHAPES):
+    """
+    Build, count and validate the assertion and provenance graphs of one page.
+
+    Writes the per-page TriG files, the N-Quads used for the folio merge and the
+    stats record. Never raises: failures are reported in the returned record.
+    """
+    start = time.perf_counter()
+    paths = kg_page_paths(image_name, data_path)
+    record = {"image": image_name, "status": "ok", "error": None}
+    try:
+        json_obj = load_json(paths["json"])
+
+        # 1. Assertion graph
+        assertion = assertion_quads(json_obj, image_name)
+
+        # 2. Provenance graph (PageXML cells parsed once per page)
+        cell_index = load_cell_index(paths["pagexml"])
+        provenance = provenance_quads(extract_elements_with_row(json_obj), cell_index, image_name).quads
+
+        provenance_graph = new_provenance_dataset()
+        _write_quads(new_assertion_dataset(), assertion, paths["assertion"], paths["assertion_nq"])
+        _write_quads(provenance_graph, provenance, paths["provenance"], paths["provenance_nq"])
+
+        # 3. Triple counts (from the emitted quads, no reparsing)
+        assertion_stats = TripleStats()
+        assertion_stats.add(assertion)
+        provenance_stats = TripleStats()
+        provenance_stats.add(provenance)
+        record["assertion"] = assertion_stats.record()
+        record["provenance"] = provenance_stats.record()
+
+        # 4. SHACL validation (shapes parsed once per process, in-memory data graph)
+        conforms, results_graph, _ = validate_graph(provenance_graph, shapes_path)
+        record["conforms"] = conforms
+        record["shacl_results"] = attribute_results(results_graph, [image_name])[image_name]
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 3)
+
+    if record["status"] == "ok":
+        with open(paths["stats"], "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2)
+    return record
+
+
+def merge_folio(image_names, data_path="data"):
+    """Concatenate the per-page N-Quads of one folio into gzip N-Quads datasets (no parsing)."""
+    folio = folio_of(image_names[0])
+    folio_dir = os.path.join(data_path, "triples", "folios")
+    outputs = {}
+    for kind in ["assertion", "provenance"]:
+        output = os.path.join(folio_dir, f"{folio}_{kind}.nq.gz")
+        with gzip.open(output, "wb") as out:
+            for image_name in sorted(image_names):
+                with open(kg_page_paths(image_name, data_path)[kind + "_nq"], "rb") as f:
+                    shutil.copyfileobj(f, out)
+        outputs[kind] = output
+    return outputs
+
+
+def main(directory, data_path="data", workers=None, force=False, shapes_path=PROVENANCE_SHAPES):
+    """
+    Build the KG of every page in `directory` across a process pool.
+
+    Pages whose input JSON and PageXML are unchanged since the last run (by sha256,
+    kept in `data_path`/triples/kg_state.json) are skipped unless `force` is set.
+    Page outputs are merged into per-folio N-Quads datasets and a summary of
+    counts and SHACL conformance is written to `data_path`/triples/summary.json.
+    """
+    triples_dir = os.path.join(data_path, "triples")
+    for folder in [triples_dir, os.path.join(triples_dir, "pages"), os.path.join(triples_dir, "folios")]:
+        os.makedirs(folder, exist_ok=True)
+    state_file = os.path.join(triples_dir, "kg_state.json")
+    state = load_json(state_file) if os.path.exists(state_file) else {}
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    image_names = sorted(f for f in os.listdir(directory) if f.endswith(".jpg"))
+    records, to_build, hashes = {}, [], {}
+    for image_name in image_names:
+        paths = kg_page_paths(image_name, data_path)
+        try:
+            hashes[image_name] = {"json": file_sha256(paths["json"]), "pagexml": file_sha256(paths["pagexml"])}
+        except OSError as e:
+            records[image_name] = {"image": image_name, "status": "failed", "error": f"{type(e).__name__}: {e}"}
+            continue
+        up_to_date = (
+            state.get(image_name) == hashes[image_name]
+            and all(os.path.exists(paths[key]) for key in ["assertion_nq", "provenance_nq", "stats"])
+        )
+        if up_to_date and not force:
+            records[image_name] = dict(load_json(paths["stats"]), status="skipped")
+        else:
+            to_build.append(image_name)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_shacl_worker, initargs=(shapes_path,)) as executor:
+        futures = [executor.submit(build_page_kg, image_name, data_path, shapes_path) for image_name in to_build]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Building KG"):
+            record = future.result()
+            records[record["image"]] = record
+            if record["status"] == "ok":
+                state[record["image"]] = hashes[record["image"]]
+                print(f"Provenance SHACL Conforms for {record['image']}:", record["conforms"])
+            else:
+                state.pop(record["image"], None)
+                print(f"Failed to build KG for {record['image']}: {record['error']}")
+
+    with open(state_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+    # Merge per-page outputs into per-folio datasets
+    folios = {}
+    for image_name in image_names:
+        if records[image_name]["status"] != "failed":
+            folios.setdefault(folio_of(image_name), []).append(image_name)
+
+    folio_summary = {}
+    for folio, pages in folios.items():
+        page_records = [records[page] for page in pages]
+        folio_summary[folio] = {
+            "pages": len(pages),
+            "outputs": merge_folio(pages, data_path),
+            "assertion_quads": sum(r["assertion"]["quads"] for r in page_records),
+            "assertion_spo": sum(r["assertion"]["spo"] for r in page_records),
+            "provenance_quads": sum(r["provenance"]["quads"] for r in page_records),
+            "conforms": all(r["conforms"] for r in page_records),
+            "non_conforming": [r["image"] for r in page_records if not r["conforms"]],
+        }
+
+    statuses = [records[image_name]["status"] for image_name in image_names]
+    summary = {
+        "pages": len(image_names),
+        "built": statuses.count("ok"),
+        "skipped": statuses.count("skipped"),
+        "failed": [image_name for image_name in image_names if records[image_name]["status"] == "failed"],
+        "seconds": round(time.perf_counter() - start, 3),
+        "folios": folio_summary,
+    }
+    with open(os.path.join(triples_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+
+    print(f"Built {summary['built']} pages, skipped {summary['skipped']} unchanged, "
+          f"{len(summary['failed'])} failed in {summary['seconds']}s")
+    print("===================================\n")
+    return summary
+
+
 if __name__== "__main__":
-    main("data/images")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=str, default="data/images", help="Directory with the page images")
+    parser.add_argument("--stream", action="store_true", help="Stream folio-level N-Quads instead of per-page TriG")
+    parser.add_argument("--to_trig", action="store_true", help="With --stream, also convert the N-Quads to TriG")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all cores)")
+    parser.add_argument("--force", action="store_true", help="Rebuild pages even if their inputs are unchanged")
+    args = parser.parse_args()
+
+    if args.stream:
+        stream_folio(args.images, to_trig=args.to_trig)
+    else:
+        main(args.images, workers=args.workers, force=args.force)
\ No newline at end of file
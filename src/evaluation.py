@@ -0,0 +1,270 @@
+import os
+import csv
+import json
+import time
+import sqlite3
+import hashlib
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.utils import format_td
+from src.metrics import compute_mAP, TEDS, infomration_extraction_precision_recall
+
+# ============================================================
+# Evaluation harness
+#
+# Every metric is a function of one prediction file and (usually) one
+# ground-truth file (and its fixed parameters). Scores are cached in SQLite per
+# (metric, version + parameters, prediction sha256, ground-truth sha256), so
+# re-scoring a folio after changing one page only recomputes that page. Uncached pages are
+# scored in a process pool; per-page rows go to CSV (or Parquet) and the
+# aggregates are printed with bootstrap confidence intervals.
+# ============================================================
+
+DEFAULT_CACHE = "data/eval_cache.sqlite"
+IE_THRESHOLD = 0.4
+
+
+def calculate_teds(gt_html, pred_html):
+    """Compute TEDS and TEDS-Struct scores between two HTML tables."""
+    gt_html = format_td(gt_html)
+    teds = TEDS(structure_only=False)
+    teds_struct = TEDS(structure_only=True)
+
+    teds_score = teds.evaluate(gt_html, pred_html)
+    teds_struct_score = teds_struct.evaluate(gt_html, pred_html)
+    return teds_score, teds_struct_score
+
+
+def _read_text(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _read_persons(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("persons", [])
+
+
+# ------------------------------------------------------------
+# Metrics: func(pred_path, gt_path) -> {column: value}
+# ------------------------------------------------------------
+
+def map_metric(pred_path, gt_path):
+    return {"mAP": compute_mAP(gt_path, pred_path)}
+
+
+def teds_metric(pred_path, gt_path):
+    teds_score, teds_struct_score = calculate_teds(_read_text(gt_path), _read_text(pred_path))
+    return {"TEDS": teds_score, "TEDS-Struct": teds_struct_score}
+
+
+def ie_metric(pred_path, gt_path, threshold=IE_THRESHOLD):
+    precision, recall, f1_score = infomration_extraction_precision_recall(
+        _read_persons(pred_path), _read_persons(gt_path), threshold=threshold
+    )
+    return {"Precision": precision, "Recall": recall, "F1-score": f1_score}
+
+
+# name -> {"func", "pred": input kind, "gt": input kind or None, "version", optional "params"}
+# "params" are passed to func as keyword arguments and are part of the cache key.
+# Only the input files and "params" are hashed, not code: bump "version" whenever
+# the metric's implementation changes, including the src/metrics.py (or other)
+# functions it calls, or the old scores keep being served from the cache.
+METRICS = {
+    "mAP": {"func": map_metric, "pred": "pagexml", "gt": "gt_polygons", "version": 1},
+    "TEDS": {"func": teds_metric, "pred": "html", "gt": "gt_html", "version": 1},
+    "IE": {"func": ie_metric, "pred": "json", "gt": "gt_info", "version": 2, "params": {"threshold": IE_THRESHOLD}},
+}
+
+
+def cache_version(spec):
+    """Version of a metric as stored in the cache: "version" plus the metric's parameters."""
+    params = spec.get("params")
+    return f"{spec['version']}:{json.dumps(params, sort_keys=True)}" if params else str(spec["version"])
+
+
+# ------------------------------------------------------------
+# Score cache
+# ------------------------------------------------------------
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_cache(db_path=DEFAULT_CACHE):
+    """Open (and create if needed) the metric cache database."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    db = sqlite3.connect(db_path)
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS scores (
+            metric TEXT NOT NULL,
+            version TEXT NOT NULL,
+            pred_sha256 TEXT NOT NULL,
+            gt_sha256 TEXT NOT NULL,
+            scores TEXT NOT NULL,
+            seconds REAL,
+            PRIMARY KEY (metric, version, pred_sha256, gt_sha256)
+        );
+    """)
+    return db
+
+
+def cached_scores(db, metric, version, pred_hash, gt_hash):
+    row = db.execute(
+        "SELECT scores FROM scores WHERE metric = ? AND version = ? AND pred_sha256 = ? AND gt_sha256 = ?",
+        (metric, version, pred_hash, gt_hash)
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+# ------------------------------------------------------------
+# Scoring
+# ------------------------------------------------------------
+
+def score_page(image_name, tasks):
+    """
+    Compute the uncached metrics of one page (runs in a worker process).
+
+    tasks: [(metric name, func, pred path, gt path, params)]. Returns {metric: {"scores", "error", "seconds"}}.
+    """
+    results = {}
+    for name, func, pred_path, gt_path, params in tasks:
+        start = time.perf_counter()
+        try:
+            results[name] = {"scores": func(pred_path, gt_path, **params), "error": None}
+        except Exception as e:
+            traceback.print_exc()
+            results[name] = {"scores": {}, "error": f"{type(e).__name__}: {e}"}
+        results[name]["seconds"] = round(time.perf_counter() - start, 3)
+    return image_name, results
+
+
+def confidence_interval(values, level=0.95, resamples=2000, seed=0):
+    """Percentile bootstrap interval of the mean (deterministic for a given seed)."""
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return (float(values.mean()), float(values.mean())) if len(values) else (0.0, 0.0)
+    rng = np.random.default_rng(seed)
+    means = values[rng.integers(0, len(values), size=(resamples, len(values)))].mean(axis=1)
+    tail = (1 - level) / 2 * 100
+    return float(np.percentile(means, tail)), float(np.percentile(means, 100 - tail))
+
+
+def aggregate(rows, columns, level=0.95):
+    """{column: {"n", "mean", "ci_low", "ci_high"}} over the pages that have the column."""
+    summary = {}
+    for column in columns:
+        values = [row[column] for row in rows if row.get(column) is not None]
+        low, high = confidence_interval(values, level)
+        summary[column] = {
+            "n": len(values),
+            "mean": float(np.mean(values)) if values else 0.0,
+            "ci_low": low,
+            "ci_high": high,
+        }
+    return summary
+
+
+def write_rows(rows, columns, output_file):
+    """Per-page rows as CSV, or as Parquet when `output_file` ends in .parquet (needs pandas + pyarrow)."""
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    header = ["page"] + columns + ["cached", "errors"]
+    if output_file.endswith(".parquet"):
+        import pandas as pd
+        pd.DataFrame(rows, columns=header).to_parquet(output_file, index=False)
+        return output_file
+    with open(output_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=header, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return output_file
+
+
+def evaluate_pages(page_inputs, metrics=None, workers=None, cache_file=DEFAULT_CACHE, output_file=None,
+                   level=0.95, force=False):
+    """
+    Score pages and print the aggregates.
+
+    Args:
+        page_inputs: {page name: {input kind: path}}, e.g. {"x.jpg": {"html": ..., "gt_html": ...}}.
+        metrics: {name: spec} as in METRICS (default: all of METRICS); a metric is
+            skipped for a page when one of its input files is missing.
+        workers: Number of worker processes for the uncached scores (default: all cores).
+        cache_file: SQLite score cache (None disables caching).
+        output_file: Per-page rows (.csv or .parquet); not written if None.
+        level: Confidence level of the intervals.
+        force: Recompute every score, ignoring (but refreshing) the cache.
+
+    Returns:
+        (rows, summary)
+    """
+    metrics = metrics if metrics is not None else METRICS
+    workers = workers or os.cpu_count() or 1
+    db = open_cache(cache_file) if cache_file else None
+    start = time.perf_counter()
+
+    rows, pending, hashes = {}, {}, {}
+    produced = {name: [] for name in metrics}  # score columns of every metric, in order
+    for page in sorted(page_inputs):
+        paths = page_inputs[page]
+        rows[page] = {"page": page, "cached": 0, "errors": []}
+        for name, spec in metrics.items():
+            pred_path, gt_path = paths.get(spec["pred"]), paths.get(spec["gt"]) if spec["gt"] else None
+            missing = [path for path in [pred_path] + ([gt_path] if spec["gt"] else []) if not path or not os.path.exists(path)]
+            if missing:
+                rows[page]["errors"].append(f"{name}: missing {missing}")
+                continue
+            key = (file_sha256(pred_path), file_sha256(gt_path) if gt_path else "")
+            hashes[(page, name)] = key
+            scores = None if (force or db is None) else cached_scores(db, name, cache_version(spec), *key)
+            if scores is not None:
+                rows[page].update(scores)
+                produced[name].extend(column for column in scores if column not in produced[name])
+                rows[page]["cached"] += 1
+            else:
+                pending.setdefault(page, []).append((name, spec["func"], pred_path, gt_path, spec.get("params") or {}))
+
+    print(f"Scoring {sum(len(tasks) for tasks in pending.values())} metrics on {len(pending)} pages "
+          f"({sum(row['cached'] for row in rows.values())} cached)")
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(score_page, page, tasks) for page, tasks in pending.items()]
+            for future in as_completed(futures):
+                page, results = future.result()
+                for name, result in results.items():
+                    if result["error"]:
+                        rows[page]["errors"].append(f"{name}: {result['error']}")
+                        continue
+                    rows[page].update(result["scores"])
+                    produced[name].extend(column for column in result["scores"] if column not in produced[name])
+                    if db is not None:
+                        with db:
+                            db.execute("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)",
+                                       (name, cache_version(metrics[name]), *hashes[(page, name)],
+                                        json.dumps(result["scores"]), result["seconds"]))
+    if db is not None:
+        db.close()
+
+    rows = [rows[page] for page in sorted(rows)]
+    for row in rows:
+        row["errors"] = "; ".join(row["errors"])
+    columns = [column for name in metrics for column in produced[name]]
+    summary = aggregate(rows, columns, level)
+
+    if output_file:
+        write_rows(rows, columns, output_file)
+        print(f"Per-page scores saved to {output_file}")
+
+    print("\n===================================")
+    print(f"=== Metrics across {len(rows)} pages ({round(time.perf_counter() - start, 3)}s) ===")
+    for column, stats in summary.items():
+        print(f"{column}: {stats['mean']:.4f}  [{level:.0%} CI {stats['ci_low']:.4f}, {stats['ci_high']:.4f}]  (n={stats['n']})")
+    failed = [row["page"] for row in rows if row["errors"]]
+    if failed:
+        print(f"Pages with errors: {failed}")
+    return rows, summary
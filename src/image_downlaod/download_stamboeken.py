@@ -80,6 +80,47 @@ def process_archive_link(archive_link, image_filename):
     return None
 
 
+def folio_archive_links(folio_no, graph_path):
+    """
+    Yield (image file name, archive link) for every scan of inventory `folio_no`
+    referenced in a folio graph (see experiment_2.create_sub_graph_for_folio),
+    once per scan however many persons are recorded on it.
+    """
+    from rdflib import Graph
+
+    g = Graph()
+    g.parse(graph_path, format="turtle")
+
+    query = f"""
+    PREFIX rico: <https://www.ica.org/standards/RiC/ontology#>
+    PREFIX sdo:  <https://schema.org/>
+    PREFIX xsd:  <http://www.w3.org/2001/XMLSchema#>
+
+    SELECT DISTINCT ?archiveID ?archiveLink WHERE {{
+        ?person a sdo:Person .
+        ?person rico:isOrWasSubjectOf ?archive .
+        ?archive rico:identifier ?archiveID .
+
+        BIND(REPLACE(?archiveID, "NL-HaNA_(.*?)_.*?_.*$", "$1") AS ?archiveN)
+        BIND(REPLACE(?archiveID, "NL-HaNA_.*?_(.*?)_.*$", "$1") AS ?inv)
+        BIND(xsd:integer(?inv) AS ?invNum)
+        FILTER (?invNum = {folio_no})
+
+        BIND(uri(CONCAT(
+            "https://www.nationaalarchief.nl/onderzoeken/archief/",
+            ?archiveN, "/invnr/", ?inv, "/file/", ?archiveID
+        )) AS ?archiveLink)
+    }}
+    """
+
+    seen = set()
+    for row in g.query(query):
+        image_name = f"{row.archiveID}.jpg"
+        if image_name not in seen:
+            seen.add(image_name)
+            yield image_name, row.archiveLink
+
+
 def parse_excel_rows(file_path):
     """
     Parse rows from an Excel file using openpyxl.
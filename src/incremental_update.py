@@ -0,0 +1,417 @@
+import os
+import json
+import time
+import argparse
+from lxml import etree
+from bs4 import BeautifulSoup
+from rdflib import URIRef
+from utils import (
+    NS, PAGE_NS, to_polygon, load_table_cells, cell_lines, pagexml_to_html, patch_html_rows,
+    patch_table_cells, atomic_write_bytes
+)
+from person_info_extraction_ontogpt import extract_person_info
+from row_filter import score_row, DEFAULT_THRESHOLD
+from constructPersonBasicInfoKG import (
+    PVN, load_json, kg_page_paths, assertion_quads, new_assertion_dataset, extract_elements_with_row,
+    load_cell_index, provenance_quads, new_provenance_dataset, NQuadsWriter
+)
+
+# ============================================================
+# Incremental recomputation after cell corrections
+#
+# Every output of a page depends on its cells:
+#   cell polygon -> text lines of the cell -> HTML row -> persons of the row
+#   -> row/cell named graphs of the assertion TriG
+# so a correction of a few cells only invalidates the rows whose cell text it changes.
+# ============================================================
+
+MATCH_THRESHOLD = 0.2  # fraction of a text line that must lie inside a cell (as in find_cell_text)
+
+
+def load_changes(changes_file, offset=0):
+    """
+    Read the cell change log written by the webapp (`<session>/changes.jsonl`) from
+    byte `offset` on.
+
+    Returns ({cell_id: points or None (deleted)}, orphaned lines, new offset); for a
+    cell changed several times the last change wins. The orphaned lines are the
+    TextLines of the deleted cells, see `orphan_lines`.
+    """
+    changes = {}
+    deleted = []
+    with open(changes_file, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.strip():
+                continue
+            change = json.loads(line)
+            if change.get("action") == "modified":
+                changes[change["cell_id"]] = change["points"]
+            elif change.get("action") == "deleted":
+                changes[change["cell_id"]] = None
+                deleted.append(change)
+        offset = f.tell()
+    return changes, orphan_lines(deleted), offset
+
+
+def orphan_lines(changes):
+    """[(deleted cell id, TextLine element)] of the change records of `patch_table_cells`."""
+    return [(change["cell_id"], etree.fromstring(line))
+            for change in changes if change.get("action") == "deleted" for line in change.get("lines") or []]
+
+
+# ------------------------------------------------------------
+# Step 1 — Re-match the text lines touching the changed cells
+# ------------------------------------------------------------
+
+def _coverage(line_polygon, cell_polygon):
+    if line_polygon.area <= 0:
+        return 0.0
+    return line_polygon.intersection(cell_polygon).area / line_polygon.area
+
+
+def _element_polygon(element):
+    coords = element.find("pc:Coords", namespaces=NS)
+    return to_polygon(coords.get("points")) if coords is not None else None
+
+
+def _insert_line(cell, line):
+    """Append a TextLine after the last TextLine (or Coords) of a TableCell."""
+    previous = cell.findall("pc:TextLine", namespaces=NS) or cell.findall("pc:Coords", namespaces=NS)
+    if previous:
+        previous[-1].addnext(line)
+    else:
+        cell.insert(0, line)
+
+
+def rematch_lines(tree, changed_ids, threshold=MATCH_THRESHOLD, orphans=()):
+    """
+    Move the TextLines touching the changed cells to the cell covering them most.
+
+    Only the changed cells and the cells whose polygon intersects one of them are
+    looked at; a line is moved when another of these cells covers at least
+    `threshold` of it and more than its current cell does.
+
+    `orphans` are (deleted cell id, TextLine) pairs of lines that lost their cell
+    (see `orphan_lines`); each goes to the cell covering the largest part of it.
+    Orphans whose id is already in the tree are skipped, and one that no cell
+    covers stays out of the tree (reported with to cell id None).
+
+    Returns the list of moves as (line id, from cell id, to cell id).
+    """
+    cells = {cell.get("id"): cell for cell in tree.iter(f"{{{PAGE_NS}}}TableCell")}
+    polygons = {cell_id: _element_polygon(cell) for cell_id, cell in cells.items()}
+    changed = {cell_id: polygons[cell_id] for cell_id in changed_ids if polygons.get(cell_id) is not None}
+
+    candidates = [
+        cell_id for cell_id, polygon in polygons.items()
+        if polygon is not None and (cell_id in changed or any(polygon.intersects(p) for p in changed.values()))
+    ]
+
+    # Some exports repeat a line in several cells; never put two copies in one cell
+    line_ids = {cell_id: {line.get("id") for line in cells[cell_id].findall("pc:TextLine", namespaces=NS)}
+                for cell_id in candidates}
+    moves = []
+    for cell_id in candidates:
+        for line in cells[cell_id].findall("pc:TextLine", namespaces=NS):
+            line_polygon = _element_polygon(line)
+            if line_polygon is None:
+                continue
+            if cell_id not in changed and not any(line_polygon.intersects(p) for p in changed.values()):
+                continue
+            coverage = {other: _coverage(line_polygon, polygons[other]) for other in candidates}
+            best = max(coverage, key=coverage.get)
+            if (best != cell_id and coverage[best] >= threshold and coverage[best] > coverage[cell_id]
+                    and line.get("id") not in line_ids[best]):
+                line_ids[best].add(line.get("id"))
+                moves.append((line, cell_id, best))
+
+    for line, _, target in moves:
+        _insert_line(cells[target], line)
+
+    placed = {line.get("id") for line in tree.iter(f"{{{PAGE_NS}}}TextLine")}
+    for source, line in orphans:
+        if line.get("id") in placed:
+            continue
+        line_polygon = _element_polygon(line)
+        coverage = {cell_id: _coverage(line_polygon, polygon) for cell_id, polygon in polygons.items()
+                    if polygon is not None} if line_polygon is not None else {}
+        best = max(coverage, key=coverage.get, default=None)
+        target = best if best is not None and coverage[best] > 0 else None
+        if target is not None:
+            _insert_line(cells[target], line)
+            placed.add(line.get("id"))
+        moves.append((line, source, target))
+    return [(line.get("id"), source, target) for line, source, target in moves]
+
+
+# ------------------------------------------------------------
+# Step 2 — Affected rows
+# ------------------------------------------------------------
+
+def html_cell_rows(html_file):
+    """{cell id: (row, rowspan)} of the `<td>`s of an HTML table."""
+    with open(html_file, encoding="utf-8") as f:
+        soup = BeautifulSoup(f.read(), "html.parser")
+    return {td.get("id"): (int(td.get("row", 0)), int(td.get("rowspan", 1))) for td in soup.find_all("td")}
+
+
+def affected_rows(cell_ids, cells, old_rows=None):
+    """Row indices spanned by the given cells (deleted cells are looked up in `old_rows`)."""
+    by_id = {cell.id: cell for cell in cells}
+    rows = set()
+    for cell_id in cell_ids:
+        cell = by_id.get(cell_id)
+        if cell is not None:
+            rows.update(range(cell.row, cell.end_row + 1))
+        elif old_rows and cell_id in old_rows:
+            row, row_span = old_rows[cell_id]
+            rows.update(range(row, row + row_span))
+    return rows
+
+
+def logical_rows(cells):
+    """
+    Logical rows of the table as `parse_html_table` returns them for the HTML of
+    `pagexml_to_html`: carried-down rowspan cells first, then the cells starting
+    in the row.
+    """
+    if not cells:
+        return []
+    records = {}
+    for cell in cells:
+        records[id(cell)] = {
+            "text": " ".join(line for line in cell_lines(cell) if line),
+            "id": cell.id,
+            "row": cell.row,
+            "col": cell.col,
+            "rowspan": cell.row_span,
+            "colspan": cell.col_span,
+        }
+    ordered = sorted(cells, key=lambda cell: (cell.row, cell.col))
+    rows = []
+    for r in range(max(cell.row for cell in cells) + 1):
+        carried = [records[id(cell)] for cell in ordered if cell.row < r <= cell.end_row]
+        starting = [records[id(cell)] for cell in ordered if cell.row == r]
+        rows.append(carried + starting)
+    return rows
+
+
+# ------------------------------------------------------------
+# Step 3 — Re-extract persons of the affected rows
+# ------------------------------------------------------------
+
+def ontogpt_row_extractor(schema_path, temp_dir="temp/", llm_model="ollama/llama3"):
+    """Row extractor running `extract_person_info` (OntoGPT) on one row."""
+    def extract(row_idx, row):
+        json_output = os.path.join(temp_dir, f"person_{row_idx}.json")
+        extract_person_info(row_idx, row, schema_path, json_output, temp_dir=temp_dir, llm_model=llm_model)
+        if not os.path.exists(json_output):
+            return []
+        persons = load_json(json_output).get("persons", [])
+        os.remove(json_output)
+        return persons
+
+    return extract
+
+
+def person_row(person):
+    """Row index a person was extracted from (first field carrying one), or None."""
+    for element in extract_elements_with_row(person):
+        if element.get("row") is not None:
+            return int(element["row"])
+    return None
+
+
+def replace_row_persons(persons, new_persons):
+    """
+    Replace the persons of the re-extracted rows.
+
+    `new_persons` maps row index -> persons. The new persons of a row take the list
+    position of the first old person of that row, so that persons of other rows
+    keep their position (and URI) whenever possible; rows without an old person
+    are appended.
+
+    Returns (new person list, old 1-based indices removed, new 1-based indices added,
+    whether any other person changed position).
+    """
+    result, removed, added = [], [], []
+    placed = set()
+    renumbered = False
+    for idx, person in enumerate(persons, start=1):
+        row = person_row(person)
+        if row not in new_persons:
+            result.append(person)
+            renumbered = renumbered or len(result) != idx
+            continue
+        removed.append(idx)
+        if row not in placed:
+            placed.add(row)
+            for new_person in new_persons[row]:
+                result.append(new_person)
+                added.append(len(result))
+    for row in sorted(set(new_persons) - placed):
+        for new_person in new_persons[row]:
+            result.append(new_person)
+            added.append(len(result))
+    return result, removed, added, renumbered
+
+
+# ------------------------------------------------------------
+# Step 4 — Replace the row/cell named graphs of the KG
+# ------------------------------------------------------------
+
+def replace_person_quads(dataset, image_name, removed, json_obj, added):
+    """
+    Remove every quad about the persons numbered `removed` (and their name nodes)
+    and add the quads of the persons numbered `added` in `json_obj`.
+
+    Row, cell and text-span graphs left empty are dropped from the dataset.
+    """
+    subjects = {URIRef(f"http://example.org/person/{image_name}/{idx}") for idx in removed}
+    for person in list(subjects):
+        subjects.update(o for _, _, o, _ in dataset.quads((person, PVN.hasName, None, None)))
+
+    touched = set()
+    for subject in subjects:
+        for quad in list(dataset.quads((subject, None, None, None))):
+            dataset.remove(quad)
+            touched.add(quad[3])
+
+    subset = {"persons": [json_obj["persons"][idx - 1] for idx in added]}
+    dataset.addN(assertion_quads(subset, image_name, indices=added))
+
+    for graph in touched:
+        if len(dataset.graph(graph)) == 0:
+            dataset.remove_graph(graph)
+    return dataset
+
+
+def _write_dataset(dataset, trig_path, nquads_path):
+    dataset.serialize(trig_path, format="trig")
+    with NQuadsWriter(nquads_path) as writer:
+        writer.write(dataset.quads((None, None, None, None)))
+
+
+def update_page(image_name, changes, data_path="data", html_file=None, extractor=None,
+                threshold=DEFAULT_THRESHOLD, pretty=True, orphans=None):
+    """
+    Bring the outputs of one page up to date after cell corrections.
+
+    Args:
+        image_name: Page image, e.g. NL-HaNA_2.10.50_45_0143.jpg.
+        changes: {cell_id: points ([[x, y], ...]) or None for a deleted cell}, see `load_changes`.
+        data_path: Root of the data directory (layout of `kg_page_paths`).
+        html_file: Table HTML; defaults to `data_path`/tables/html/<image>.html.
+        extractor: Callable (row index, logical row) -> persons, e.g. `ontogpt_row_extractor(...)`.
+            Without it the persons and the KG are left untouched.
+        threshold: Affected rows scoring below this in `score_row` yield no persons.
+        pretty: The HTML was written with `pretty=True`.
+        orphans: TextLines of cells deleted before this call (already gone from the
+            PageXML), as returned by `load_changes`.
+
+    Returns:
+        A report of what was recomputed.
+    """
+    start = time.perf_counter()
+    paths = kg_page_paths(image_name, data_path)
+    if html_file is None:
+        html_file = os.path.join(data_path, "tables", "html", image_name + ".html")
+    report = {"image": image_name, "changed_cells": sorted(changes), "moved_lines": [], "rows": [],
+              "html": None, "persons_removed": 0, "persons_added": 0, "kg": None}
+
+    # 1. Apply the polygons (a no-op when the webapp already patched this file) and re-match lines
+    old_rows = html_cell_rows(html_file) if os.path.exists(html_file) else {}
+    patched = patch_table_cells(
+        paths["pagexml"],
+        {cell_id: points for cell_id, points in changes.items() if points is not None},
+        [cell_id for cell_id, points in changes.items() if points is None]
+    )
+    tree = etree.parse(paths["pagexml"])
+    moves = rematch_lines(tree, [cell_id for cell_id, points in changes.items() if points is not None],
+                          orphans=orphan_lines(patched) + list(orphans or []))
+    if moves:
+        atomic_write_bytes(paths["pagexml"], etree.tostring(tree, xml_declaration=True, encoding="utf-8"))
+    report["moved_lines"] = moves
+
+    # 2. Affected rows of the HTML table: only rows whose cell text changed (deleted
+    # cells, moved lines); a polygon edit that moves no line changes no text
+    cells = load_table_cells(paths["pagexml"], all_regions=False)  # the cells of the HTML table
+    affected_cells = ({cell_id for cell_id, points in changes.items() if points is None}
+                      | {source for _, source, _ in moves} | {target for _, _, target in moves if target})
+    rows = sorted(affected_rows(affected_cells, cells, old_rows))
+    report["rows"] = rows
+    if os.path.exists(html_file) and cells and patch_html_rows(html_file, cells, rows, pretty=pretty):
+        report["html"] = "rows"
+    else:
+        pagexml_to_html(paths["pagexml"], html_file, pretty=pretty, force=True)
+        report["html"] = "rebuilt"
+
+    # 3. Persons of the affected rows
+    if extractor is None or not rows:
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        return report
+    table = logical_rows(cells)
+    new_persons = {}
+    for row_idx in rows:
+        if row_idx < len(table) and score_row(table[row_idx])["score"] >= threshold:
+            new_persons[row_idx] = extractor(row_idx, table[row_idx])
+        else:
+            new_persons[row_idx] = []
+
+    json_obj = load_json(paths["json"])
+    json_obj["persons"], removed, added, renumbered = replace_row_persons(json_obj["persons"], new_persons)
+    atomic_write_bytes(paths["json"], json.dumps(json_obj, indent=2, ensure_ascii=False).encode("utf-8"))
+    report["persons_removed"], report["persons_added"] = len(removed), len(added)
+
+    # 4. KG: swap the quads of the replaced persons when the other persons kept
+    # their number, otherwise rebuild the page's assertion graph (no model calls either way)
+    dataset = new_assertion_dataset()
+    if os.path.exists(paths["assertion"]) and not renumbered:
+        dataset.parse(paths["assertion"], format="trig")
+        replace_person_quads(dataset, image_name, removed, json_obj, added)
+        report["kg"] = "graphs"
+    else:
+        dataset.addN(assertion_quads(json_obj, image_name))
+        report["kg"] = "rebuilt"
+    _write_dataset(dataset, paths["assertion"], paths["assertion_nq"])
+
+    # The provenance graph is one graph derived from JSON + PageXML; rebuilt whole
+    provenance = new_provenance_dataset()
+    provenance.addN(provenance_quads(extract_elements_with_row(json_obj), load_cell_index(paths["pagexml"]), image_name).quads)
+    _write_dataset(provenance, paths["provenance"], paths["provenance_nq"])
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    return report
+
+
+def update_from_log(image_name, changes_file, data_path="data", **kwargs):
+    """
+    Apply the changes logged since the last call (the byte offset is kept in
+    `<changes_file>.offset`) and return the report, or None if there were none.
+    """
+    offset_file = changes_file + ".offset"
+    offset = 0
+    if os.path.exists(offset_file):
+        with open(offset_file) as f:
+            offset = int(f.read().strip() or 0)
+    changes, orphans, new_offset = load_changes(changes_file, offset)
+    report = update_page(image_name, changes, data_path, orphans=orphans, **kwargs) if changes else None
+    with open(offset_file, "w") as f:
+        f.write(str(new_offset))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", type=str, required=True, help="Page image name, e.g. NL-HaNA_2.10.50_45_0143.jpg")
+    parser.add_argument("--changes", type=str, required=True, help="Cell change log of a webapp session (changes.jsonl)")
+    parser.add_argument("--data_path", type=str, default="data", help="Root of the data directory")
+    parser.add_argument("--schema", type=str, default=None, help="OntoGPT schema; re-extracts persons of affected rows")
+    parser.add_argument("--temp_dir", type=str, default="data/temp", help="OntoGPT working directory")
+    parser.add_argument("--llm_model", type=str, default="ollama/llama3", help="OntoGPT model")
+    args = parser.parse_args()
+
+    extractor = ontogpt_row_extractor(args.schema, args.temp_dir, args.llm_model) if args.schema else None
+    report = update_from_log(args.image, args.changes, args.data_path, extractor=extractor)
+    print(json.dumps(report, indent=2) if report else "No new changes.")
@@ -2,64 +2,190 @@ import os
 from lxml import etree
 import re
 import csv
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 # Define the pattern for "folio <integer>"
 pattern = re.compile('folio [0-9]+', re.IGNORECASE)
 
+PAGE_NS = 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15'
+PLAIN_TEXT = f'{{{PAGE_NS}}}PlainText'
+TEXT_LINE = f'{{{PAGE_NS}}}TextLine'
+
 
 # Function to process each XML file
 def process_xml(file_path):
+    """
+    Stream one PageXML file and collect the PlainText lines mentioning "folio <n>".
+
+    Returns {'image', 'folio': [texts], 'status'}; status is "ok", "no_plaintext"
+    or "error" (malformed XML).
+    """
+    image = file_path.split("/")[-1]
+    folios = list()
+    found_plain_text = False
+
     try:
-        # Parse the XML file
-        tree = etree.parse(file_path)
-
-        # Define the namespace (taken from the XML)
-        namespace = {'ns': 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15'}
-
-        # Use XPath to find all PlainText elements
-        plain_text_elements = tree.xpath("//ns:PlainText", namespaces=namespace)
-
-        if not plain_text_elements:
-            # Log file name if no PlainText tag is found
-            with open(os.path.join(output_directory, "image_htr_error.txt"), "a+") as error_log:
-                error_log.write(f"{file_path}\n")
-            print(f"No PlainText tag found in {file_path}. Logged in image_htr_error.txt.")
-
-        else:
-            # If PlainText tags are found, check each one for the pattern
-            dict = {'image': None, 'folio': list()}
-            for element in plain_text_elements:
-                dict['image'] = file_path.split("/")[-1]
+        # iterparse + clearing: only one TextLine is kept in memory at a time
+        for _, element in etree.iterparse(file_path, events=("end",), tag=(PLAIN_TEXT, TEXT_LINE)):
+            if element.tag == PLAIN_TEXT:
+                found_plain_text = True
                 if element.text and pattern.search(element.text):
                     print(f"File: {file_path} | Tag: {element.tag} | Text: {element.text}")
-                    dict['folio'].append(element.text)
-            return dict
+                    folios.append(element.text)
+            else:
+                element.clear()
 
     except etree.XMLSyntaxError:
         print(f"Error parsing {file_path}. File may be malformed.")
+        return {'image': image, 'folio': [], 'status': 'error'}
 
+    if not found_plain_text:
+        # Log file name if no PlainText tag is found
+        with open(os.path.join(output_directory, "image_htr_error.txt"), "a+") as error_log:
+            error_log.write(f"{file_path}\n")
+        print(f"No PlainText tag found in {file_path}. Logged in image_htr_error.txt.")
+        return {'image': image, 'folio': [], 'status': 'no_plaintext'}
 
-# Walk through all .xml files in the folder
-def process_all_xml_files(folder):
-    folio_list = list()
+    return {'image': image, 'folio': folios, 'status': 'ok'}
+
+
+def folio_number(text):
+    match = pattern.search(text)
+    return int(match.group().split()[1]) if match else None
+
+
+# ============================================================
+# Incremental SQLite index
+# ============================================================
+
+def open_index(db_path):
+    """Open (and create if needed) the folio index database."""
+    db = sqlite3.connect(db_path)
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            image TEXT NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            status TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS folios (
+            path TEXT NOT NULL,
+            image TEXT NOT NULL,
+            folio TEXT NOT NULL,
+            folio_number INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS files_image ON files (image);
+        CREATE INDEX IF NOT EXISTS folios_path ON folios (path);
+        CREATE INDEX IF NOT EXISTS folios_image ON folios (image);
+        CREATE INDEX IF NOT EXISTS folios_number ON folios (folio_number);
+    """)
+    return db
+
+
+def list_xml_files(folder):
+    xml_files = []
     for root_dir, _, files in os.walk(folder):
         for file_name in sorted(files):
             if file_name.endswith(".xml"):
-                file_path = os.path.join(root_dir, file_name)
-                folios = process_xml(file_path)
-                if folios:
-                    folio_list.append(folios)
+                xml_files.append(os.path.join(root_dir, file_name))
+    return xml_files
+
+
+def update_index(db, folder, workers=None):
+    """
+    Bring the index up to date with `folder`.
+
+    Only files that are new or whose mtime/size changed are parsed (in a process
+    pool); files that disappeared are removed. Returns (parsed, unchanged, removed).
+    """
+    known = {path: (mtime_ns, size) for path, mtime_ns, size in db.execute("SELECT path, mtime_ns, size FROM files")}
+
+    changed = []
+    present = set()
+    for file_path in list_xml_files(folder):
+        stat = os.stat(file_path)
+        present.add(file_path)
+        if known.get(file_path) != (stat.st_mtime_ns, stat.st_size):
+            changed.append((file_path, stat.st_mtime_ns, stat.st_size))
 
-    csv_file = os.path.join(output_directory, 'image_to_folio_mapping.csv')
+    removed = [path for path in known if path not in present]
+    with db:
+        db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+        db.executemany("DELETE FROM folios WHERE path = ?", [(path,) for path in removed])
+
+    if changed:
+        workers = workers or os.cpu_count() or 1
+        chunksize = max(1, len(changed) // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(process_xml, [file_path for file_path, _, _ in changed], chunksize=chunksize)
+            with db:
+                for (file_path, mtime_ns, size), result in zip(changed, results):
+                    db.execute("DELETE FROM folios WHERE path = ?", (file_path,))
+                    db.execute(
+                        "INSERT OR REPLACE INTO files (path, image, mtime_ns, size, status) VALUES (?, ?, ?, ?, ?)",
+                        (file_path, result['image'], mtime_ns, size, result['status'])
+                    )
+                    db.executemany(
+                        "INSERT INTO folios (path, image, folio, folio_number) VALUES (?, ?, ?, ?)",
+                        [(file_path, result['image'], text, folio_number(text)) for text in result['folio']]
+                    )
+
+    print(f"Folio index: parsed {len(changed)}, unchanged {len(present) - len(changed)}, removed {len(removed)}")
+    return len(changed), len(present) - len(changed), len(removed)
+
+
+def lookup_image(db, image):
+    """Folio texts found on one image."""
+    return [folio for (folio,) in db.execute("SELECT folio FROM folios WHERE image = ? ORDER BY rowid", (image,))]
+
+
+def lookup_folio(db, number):
+    """Images on which "folio <number>" occurs."""
+    return [image for (image,) in db.execute(
+        "SELECT DISTINCT image FROM folios WHERE folio_number = ? ORDER BY image", (number,)
+    )]
+
+
+def write_mapping_csv(db, csv_file):
+    """Write image_to_folio_mapping.csv from the index (no XML parsing)."""
+    rows = db.execute("""
+        SELECT f.image, GROUP_CONCAT(fo.folio, ', ')
+        FROM files f LEFT JOIN (SELECT path, folio FROM folios ORDER BY rowid) fo ON fo.path = f.path
+        WHERE f.status = 'ok'
+        GROUP BY f.path
+        ORDER BY f.path
+    """)
     with open(csv_file, mode='w', newline='') as file:
         writer = csv.writer(file)
         writer.writerow(['image', 'folio'])
-        for item in folio_list:
-            writer.writerow([item['image'], ', '.join(item['folio'])])
+        for image, folios in rows:
+            writer.writerow([image, folios or ''])
     print(f"Data has been written to {csv_file}")
 
 
+# Walk through all .xml files in the folder
+def process_all_xml_files(folder, workers=None):
+    db = open_index(os.path.join(output_directory, 'image_to_folio_index.sqlite'))
+    try:
+        update_index(db, folder, workers=workers)
+        write_mapping_csv(db, os.path.join(output_directory, 'image_to_folio_mapping.csv'))
+    finally:
+        db.close()
+
+
 # Example usage
 input_path = "../image_samples/page"
 output_directory = '../output'
-process_all_xml_files(input_path)
\ No newline at end of file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_path", type=str, default=input_path, help="Folder with PageXML files")
+    parser.add_argument("--output_directory", type=str, default=output_directory, help="Folder for the index and CSV")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    output_directory = args.output_directory
+    process_all_xml_files(args.input_path, workers=args.workers)
@@ -4,6 +4,33 @@ import os
 from lxml import etree
 import re
 import csv
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+PAGE_NS = {'ns': 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15'}
+TEXTLINE_XPATH = etree.XPath('//ns:TextRegion/ns:TextLine[ns:TextEquiv[not(ancestor::ns:Word)]]', namespaces=PAGE_NS)
+
+# Case 1-6 patterns (see table below), compiled once
+VADER = re.compile(r'.*Vader\s+(.+)', re.IGNORECASE)
+MOEDER = re.compile(r'.*Moeder\s+(.+)', re.IGNORECASE)
+GEBOORTE_DATUM = re.compile(r'Geboren\s+(.+)', re.IGNORECASE)
+GEBOORTE_PLAATS = re.compile(r'^te\s+(.+)', re.IGNORECASE)
+LAATSTE_WOONPLAATS = re.compile(r'laatst\s*gewoond te\s+(.+)', re.IGNORECASE)
+CAMPAIGN = re.compile(r'\b(\d{4})\s+([a-zA-Z]+.*)', re.IGNORECASE)
+
+# One alternation pass per line: a line can only match a case above if it
+# matches this prefilter, so most lines are rejected by a single search
+KEYWORDS = re.compile(
+    r'vader\s|moeder\s|geboren\s|^te\s|laatst\s*gewoond te\s|\b\d{4}\s+[a-z]',
+    re.IGNORECASE
+)
+
+# Case 7: 2-digit(date) followed by string(month) followed by 4-digit(year)
+DATE_PATTERN = r'[0-9]{1,2}\s[A-Z]+[a-z]*\s[1-9]{4}\.*'
+EVENT_LINE = re.compile(rf"(.*?{DATE_PATTERN})")
+EVENT = re.compile(rf'(.*)?({DATE_PATTERN})', re.IGNORECASE)
+
+CSV_HEADER = ["stamboeken", "Vader", "Moeder", "Geboorte datum", "Geboorte Plaats", "Laatste Woonplaats", "Campaigns"]
 
 
 # Function to process each XML file
@@ -13,10 +40,7 @@ def extract_textequiv(file_path):
         root = etree.parse(file_path)
 
         # XPath query to get TextRegion id, TextLine id, and TextEquiv text without nested Word tags
-        result = root.xpath(
-            '//ns:TextRegion/ns:TextLine[ns:TextEquiv[not(ancestor::ns:Word)]]',
-            namespaces={'ns': 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15'}
-        )
+        result = TEXTLINE_XPATH(root)
 
         if result is None:
             # Log file name if no TextEquiv tag is found
@@ -58,7 +82,7 @@ Pseudo-code:
 """
 
 
-def extract_information(xml_file, output_file):
+def extract_information(xml_file, output_file=None):
     """
         Extracts genealogy information, i.e.,:
             - Vader (father)
@@ -71,25 +95,23 @@ def extract_information(xml_file, output_file):
 
         Parameters:
         xml_file (file): XML data as a file
+        output_file (str): Optional CSV file to append the row to
 
         Returns:
-        dict: Extracted genealogy information.
+        list: The CSV row with the extracted genealogy information (None on error).
 
     """
 
     try:
         root = etree.parse(xml_file)
 
-        result = root.xpath(
-            '//ns:TextRegion/ns:TextLine[ns:TextEquiv[not(ancestor::ns:Word)]]',
-            namespaces={'ns': 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15'}
-        )
+        result = TEXTLINE_XPATH(root)
 
         if result is None:
             # Log file name if no TextEquiv tag is found
             with open(os.path.join(output_path, "image_htr_error.txt"), "a+") as error_log:
-                error_log.write(f"{file_path}\n")
-            print(f"No TextEquiv tag found in {file_path}. Logged in image_htr_error.txt.")
+                error_log.write(f"{xml_file}\n")
+            print(f"No TextEquiv tag found in {xml_file}. Logged in image_htr_error.txt.")
             return
 
         # WHEN HTR DONE SUCCESSFULLY!
@@ -108,9 +130,8 @@ def extract_information(xml_file, output_file):
         # Extract and print the required information
         for line in result:
             text_region_id = line.getparent().get("id")
-            text_line_id = line.get("id")
-            text_equiv_text = line.find("ns:TextEquiv/ns:PlainText", namespaces={
-                'ns': 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15'}).text
+            plain_text = line.find("ns:TextEquiv/ns:PlainText", namespaces=PAGE_NS)
+            text_equiv_text = plain_text.text if plain_text is not None else None
 
             if text_equiv_text is None:
                 continue
@@ -123,91 +144,116 @@ def extract_information(xml_file, output_file):
                 # Initialize entry for new text_region_id
                 text_by_region[text_region_id] = text_equiv_text
 
+            # Lines without any keyword cannot match cases 1-6
+            if not KEYWORDS.search(text_equiv_text):
+                continue
+
             # Case 1: Extract Vader
-            vader_match = re.search(r'.*Vader\s+(.+)', text_equiv_text, re.IGNORECASE)
+            vader_match = VADER.search(text_equiv_text)
             if vader_match:
                 genealogy_info["Vader"] = vader_match.group(1).strip()
 
             # Case 2: Extract Moeder
-            moeder_match = re.search(r'.*Moeder\s+(.+)', text_equiv_text, re.IGNORECASE)
+            moeder_match = MOEDER.search(text_equiv_text)
             if moeder_match:
                 genealogy_info["Moeder"] = moeder_match.group(1).strip()
 
             # Case 3: Extract Geboorte datum (e.g., "Geboren: 01-01-1900")
-            geboorte_datum_match = re.search(r'Geboren\s+(.+)', text_equiv_text, re.IGNORECASE)
+            geboorte_datum_match = GEBOORTE_DATUM.search(text_equiv_text)
             if geboorte_datum_match:
                 genealogy_info["Geboorte datum"] = geboorte_datum_match.group(1).strip()
 
             # Case 4: Extract Geboorte Plaats (e.g., "te Amsterdam")
-            geboorte_plaats_match = re.search(r'^te\s+(.+)', text_equiv_text, re.IGNORECASE)
+            geboorte_plaats_match = GEBOORTE_PLAATS.search(text_equiv_text)
             if geboorte_plaats_match:
                 if genealogy_info["Geboorte Plaats"] is None:
                     genealogy_info["Geboorte Plaats"] = geboorte_plaats_match.group(1).strip()
 
             # Case 5: Extract Laatste Woonplaats (e.g., "laatst gewoond te Rotterdam")
-            laatste_woonplaats_match = re.search(r'laatst\s*gewoond te\s+(.+)', text_equiv_text, re.IGNORECASE)
+            laatste_woonplaats_match = LAATSTE_WOONPLAATS.search(text_equiv_text)
             if laatste_woonplaats_match:
                 genealogy_info["Laatste Woonplaats"] = laatste_woonplaats_match.group(1).strip()
 
             # Case 6: Extract campaign (e.g., "1809 Zeeland")
-
-            campaign_match = re.search(r'\b(\d{4})\s+([a-zA-Z]+.*)', text_equiv_text, re.IGNORECASE)
+            campaign_match = CAMPAIGN.search(text_equiv_text)
             if campaign_match:
                 campaign = {"Year": campaign_match.group(1).strip(), "Place": campaign_match.group(2).strip()}
                 campaign_list.append(campaign)
 
         # Extract Event --> Military posting information
         for region_id, concatenated_text in text_by_region.items():
-            # print(f"Region ID: {region_id}, Text: {concatenated_text}")
-            date_pattern = r'[0-9]{1,2}\s[A-Z]+[a-z]*\s[1-9]{4}\.*' # 2-digit(date) followed by string(month) followed by 4-digit(year)
-            pattern = rf"(.*?{date_pattern})"
-            event_lines = re.findall(pattern, concatenated_text)
+            event_lines = EVENT_LINE.findall(concatenated_text)
             if len(event_lines) >= 2:
                 for event in event_lines:
-                    match = re.search(rf'(.*)?({date_pattern})', event, re.IGNORECASE)
+                    match = EVENT.search(event)
                     event_dict = {
                         'Context': match.group(1).strip(),
                         'Date': match.group(2).strip()
                     }
                     event_list.append(event_dict)
 
-        with open(output_file, 'a') as f:
-            csvwriter = csv.writer(f)
-            csvwriter.writerow(
-                [''.join(xml_file.split('/')[-1].split(".")[:-1]),
-                 genealogy_info["Vader"],
-                 genealogy_info["Moeder"],
-                 genealogy_info["Geboorte datum"],
-                 genealogy_info["Geboorte Plaats"],
-                 genealogy_info["Laatste Woonplaats"],
-                 ';'.join([str(dict) for dict in campaign_list]),
-                 ';'.join([str(event) for event in event_list])])
+        row = [''.join(xml_file.split('/')[-1].split(".")[:-1]),
+               genealogy_info["Vader"],
+               genealogy_info["Moeder"],
+               genealogy_info["Geboorte datum"],
+               genealogy_info["Geboorte Plaats"],
+               genealogy_info["Laatste Woonplaats"],
+               ';'.join([str(dict) for dict in campaign_list]),
+               ';'.join([str(event) for event in event_list])]
+
+        if output_file:
+            with open(output_file, 'a') as f:
+                csv.writer(f).writerow(row)
+        return row
 
     except etree.XMLSyntaxError:
-        print(f"Error parsing {file_path}. File may be malformed.")
+        print(f"Error parsing {xml_file}. File may be malformed.")
+
+
+def list_xml_files(folder):
+    xml_files = []
+    for root_dir, _, files in os.walk(folder):
+        for file_name in sorted(files):
+            if file_name.endswith(".xml"):
+                xml_files.append(os.path.join(root_dir, file_name))
+    return xml_files
 
 
 # Walk through all .xml files in the folder
-def process_all_xml_files(folder):
-    output_file = os.path.join(output_path, 'regex_extracted_information.csv')
-    with open(output_file, 'w+') as f:
+def process_all_xml_files(folder, output_dir=None, workers=None):
+    """
+    Extract all .xml files under `folder` in a process pool and write one CSV for
+    the folio, keeping the CSV handle open for the whole run.
+    """
+    output_file = os.path.join(output_dir or output_path, 'regex_extracted_information.csv')
+    xml_files = list_xml_files(folder)
+    workers = workers or os.cpu_count() or 1
+
+    with open(output_file, 'w+') as f, ProcessPoolExecutor(max_workers=workers) as executor:
         csvwriter = csv.writer(f)
         # Write header row
-        csvwriter.writerow(["stamboeken", "Vader", "Moeder", "Geboorte datum", "Geboorte Plaats", "Laatste Woonplaats", "Campaigns"])
+        csvwriter.writerow(CSV_HEADER)
 
-    for root_dir, _, files in os.walk(folder):
-        for file_name in sorted(files):
-            if file_name.endswith(".xml"):
-                file_path = os.path.join(root_dir, file_name)
-                print(f"Processing xml: {file_path}...")
-                # extract_textequiv(file_path)
+        chunksize = max(1, len(xml_files) // (4 * workers))
+        for file_path, row in zip(xml_files, executor.map(extract_information, xml_files, chunksize=chunksize)):
+            print(f"Processing xml: {file_path}...")
+            if row is not None:
+                csvwriter.writerow(row)
 
-                extract_information(file_path, output_file)
+    return output_file
 
 
 # Example usage
 input_path = "../image_samples/page"
 output_path = '../output'
 
-process_all_xml_files(input_path)
-# print(extract_information("../image_samples/page/NL-HaNA_2.10.50_71_0006.xml", "out.csv")) # perfect exmaple NL-HaNA_2.10.50_71_0006.xml
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input_path", type=str, default=input_path, help="Folder with PageXML files")
+    parser.add_argument("--output_path", type=str, default=output_path, help="Folder for the extracted CSV")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    output_path = args.output_path
+    process_all_xml_files(args.input_path, args.output_path, workers=args.workers)
+    # print(extract_information("../image_samples/page/NL-HaNA_2.10.50_71_0006.xml", "out.csv")) # perfect exmaple NL-HaNA_2.10.50_71_0006.xml
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import shlex
+import argparse
+import subprocess
+
+# ============================================================
+# Persistent LORE worker
+#
+# Loads the table-structure model once and then serves requests over a
+# JSON-lines protocol on stdin/stdout:
+#
+#   -> {"id": 1, "image": "data/images/x.jpg"}           (or "images": [...])
+#   <- {"event": "result", "id": 1, "image": ..., "status": "ok",
+#       "center": ".../center/x.jpg.txt", "logi": ".../logi/x.jpg.txt", "seconds": 0.8}
+#   -> {"cmd": "ping"}       <- {"event": "pong"}
+#   -> {"cmd": "shutdown"}   (or EOF)
+#
+# One result line is written (and flushed) per image as soon as it is done.
+# Everything the model itself prints goes to stderr, stdout only carries protocol.
+# ============================================================
+
+LORE_SRC = os.path.join("Image2TableBoundingBoxDetection", "src")
+# Options of scripts/infer/demo_wired.sh (wired tables, WTW checkpoint), which the
+# pipeline used to run; relative paths are resolved from LORE_SRC, the worker's cwd
+LORE_ARGS = (
+    "ctdet_mid --dataset table_mid --demo ../input_images/wired --demo_name demo_wired --debug 1 "
+    "--arch resfpnhalf_18 --K 500 --MK 1000 --tsfm_layers 4 --stacking_layers 4 --gpus 0 "
+    "--wiz_2dpe --wiz_stacking --convert_onnx 0 --vis_thresh_corner 0.3 --vis_thresh 0.2 "
+    "--scores_thresh 0.2 --nms --demo_dir ../visualization_wired/ "
+    "--load_model ../ckpts/ckpt_wtw/model_best.pth --load_processor ../ckpts/ckpt_wtw/processor_best.pth"
+)
+DEFAULT_OUTPUT_DIR = os.path.join("data", "tables", "cells")
+
+
+def cell_file_paths(image_path, output_dir):
+    """center/logi files of an image, as read by `reconstruct_table.page_paths`."""
+    image_name = os.path.basename(image_path)
+    return (
+        os.path.join(output_dir, "center", image_name + ".txt"),
+        os.path.join(output_dir, "logi", image_name + ".txt"),
+    )
+
+
+def write_cell_files(image_path, cells, output_dir, wired=True):
+    """
+    Write LORE-style cell files: one "x1,y1;x2,y2;..." polygon per line in center/,
+    the matching logical position per line in logi/ ("start_col,end_col,start_row,end_row"
+    with `wired`, else "start_row,end_row,start_col,end_col").
+    """
+    center_file, logi_file = cell_file_paths(image_path, output_dir)
+    os.makedirs(os.path.dirname(center_file), exist_ok=True)
+    os.makedirs(os.path.dirname(logi_file), exist_ok=True)
+    with open(center_file, "w") as center, open(logi_file, "w") as logi:
+        for cell in cells:
+            center.write(";".join(f"{x},{y}" for x, y in cell["polygon"]) + "\n")
+            if wired:
+                structure = (cell["start_col"], cell["end_col"], cell["start_row"], cell["end_row"])
+            else:
+                structure = (cell["start_row"], cell["end_row"], cell["start_col"], cell["end_col"])
+            logi.write(",".join(str(v) for v in structure) + "\n")
+    return center_file, logi_file
+
+
+# ------------------------------------------------------------
+# Backends: load() once, process(image_path, output_dir) per image
+# ------------------------------------------------------------
+
+class StubBackend:
+    """Stand-in model for tests: a regular rows x cols grid over the whole image."""
+
+    name = "stub"
+
+    def __init__(self, rows=4, cols=3, delay=0.0, wired=True):
+        self.rows = rows
+        self.cols = cols
+        self.delay = delay
+        self.wired = wired
+
+    def load(self):
+        pass
+
+    def process(self, image_path, output_dir):
+        from PIL import Image
+        with Image.open(image_path) as image:
+            width, height = image.size
+        if self.delay:
+            time.sleep(self.delay)
+
+        cell_width, cell_height = width / self.cols, height / self.rows
+        cells = []
+        for row in range(self.rows):
+            for col in range(self.cols):
+                x0, y0 = round(col * cell_width, 2), round(row * cell_height, 2)
+                x1, y1 = round((col + 1) * cell_width, 2), round((row + 1) * cell_height, 2)
+                cells.append({
+                    "polygon": [(x0, y0), (x1, y0), (x1, y1), (x0, y1)],
+                    "start_row": row, "end_row": row, "start_col": col, "end_col": col,
+                })
+        return write_cell_files(image_path, cells, output_dir, wired=self.wired)
+
+
+class LoreBackend:
+    """
+    LORE-TSR detector from `Image2TableBoundingBoxDetection/src`, built once with the
+    options of `scripts/infer/demo_wired.sh` (`lore_args`, LORE_ARGS by default).
+
+    The detector writes center/<image>.txt and logi/<image>.txt into
+    `opt.output_dir` itself, exactly as the demo script does.
+    """
+
+    name = "lore"
+
+    def __init__(self, lore_src=LORE_SRC, lore_args=LORE_ARGS):
+        self.lore_src = os.path.abspath(lore_src)
+        self.lore_args = shlex.split(lore_args or "")
+        if not self.lore_args:
+            raise ValueError("No LORE options given (task, --arch, --load_model, ...), see LORE_ARGS")
+        self.opt = None
+        self.detector = None
+        self._output_dir = None
+
+    def load(self):
+        sys.path.insert(0, os.path.join(self.lore_src, "lib"))
+        from opts import opts
+        from detectors.detector_factory import detector_factory
+        self.opt = opts().init(self.lore_args)
+        self.detector = detector_factory[self.opt.task](self.opt)
+
+    def process(self, image_path, output_dir):
+        output_dir = os.path.abspath(output_dir)
+        if output_dir != self._output_dir:
+            self.opt.output_dir = output_dir
+            self._output_dir = output_dir
+        self.detector.run(self.opt, os.path.abspath(image_path))
+        return cell_file_paths(image_path, output_dir)
+
+
+BACKENDS = {"stub": StubBackend, "lore": LoreBackend}
+
+
+# ------------------------------------------------------------
+# Server side
+# ------------------------------------------------------------
+
+def _protocol_stream():
+    """
+    Keep the real stdout for protocol lines and point fd 1 (and sys.stdout) at
+    stderr, so prints of the model (including C extensions) cannot corrupt it.
+    """
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", buffering=1)
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    return protocol
+
+
+def serve(backend, output_dir=DEFAULT_OUTPUT_DIR, requests=None, protocol=None):
+    """Load the backend and answer requests until shutdown or EOF. Returns the number of images processed."""
+    requests = requests if requests is not None else sys.stdin
+    protocol = protocol if protocol is not None else _protocol_stream()
+
+    def emit(message):
+        protocol.write(json.dumps(message) + "\n")
+        protocol.flush()
+
+    start = time.perf_counter()
+    try:
+        backend.load()
+    except Exception as e:
+        emit({"event": "error", "error": f"{type(e).__name__}: {e}"})
+        return 0
+    emit({"event": "ready", "backend": backend.name, "load_seconds": round(time.perf_counter() - start, 3)})
+
+    processed = 0
+    for line in requests:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            emit({"event": "error", "error": f"Invalid request: {e}"})
+            continue
+
+        if request.get("cmd") == "shutdown":
+            break
+        if request.get("cmd") == "ping":
+            emit({"event": "pong", "processed": processed})
+            continue
+
+        images = request.get("images") or ([request["image"]] if request.get("image") else [])
+        for image_path in images:
+            start = time.perf_counter()
+            result = {"event": "result", "id": request.get("id"), "image": image_path}
+            try:
+                center, logi = backend.process(image_path, request.get("output_dir", output_dir))
+                result.update(status="ok", center=center, logi=logi)
+            except Exception as e:
+                result.update(status="failed", error=f"{type(e).__name__}: {e}")
+            result["seconds"] = round(time.perf_counter() - start, 3)
+            processed += 1
+            emit(result)
+        emit({"event": "done", "id": request.get("id"), "images": len(images)})
+    return processed
+
+
+# ------------------------------------------------------------
+# Client side
+# ------------------------------------------------------------
+
+class LoreWorker:
+    """
+    Start `lore_worker.py` as a child process and talk to it.
+
+    `command` is the prefix used to run Python in the model's environment, e.g.
+    ["conda", "run", "--no-capture-output", "-n", "LORE", "python"]; the
+    environment is entered once for the lifetime of the worker. Paths sent to the
+    worker are made absolute, so it may run in another directory (`cwd`).
+    """
+
+    def __init__(self, backend="lore", output_dir=DEFAULT_OUTPUT_DIR, command=None, backend_args=(), cwd=None):
+        command = list(command or [sys.executable])
+        args = command + ["-u", os.path.abspath(__file__), "--backend", backend,
+                          "--output_dir", os.path.abspath(output_dir)] + list(backend_args)
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1, cwd=cwd)
+        self._next_id = 0
+        ready = self._read()
+        if ready.get("event") != "ready":
+            self.close()
+            raise RuntimeError(f"LORE worker failed to start: {ready.get('error', ready)}")
+        self.load_seconds = ready.get("load_seconds")
+
+    def _read(self):
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"LORE worker exited (rc={self.process.poll()})")
+        return json.loads(line)
+
+    def _send(self, message):
+        self.process.stdin.write(json.dumps(message) + "\n")
+        self.process.stdin.flush()
+
+    def process_images(self, image_paths, output_dir=None):
+        """Yield one result dict per image, as soon as the worker reports it."""
+        self._next_id += 1
+        request = {"id": self._next_id, "images": [os.path.abspath(path) for path in image_paths]}
+        if output_dir:
+            request["output_dir"] = os.path.abspath(output_dir)
+        self._send(request)
+        while True:
+            message = self._read()
+            if message.get("event") == "result":
+                yield message
+            elif message.get("event") == "done" and message.get("id") == request["id"]:
+                return
+            elif message.get("event") == "error":
+                raise RuntimeError(message.get("error"))
+
+    def ping(self):
+        self._send({"cmd": "ping"})
+        return self._read()
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self._send({"cmd": "shutdown"})
+                self.process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="lore", help="Model backend")
+    parser.add_argument("--output_dir", type=str, default=DEFAULT_OUTPUT_DIR, help="Root of the center/ and logi/ folders")
+    parser.add_argument("--lore_src", type=str, default=LORE_SRC, help="LORE-TSR src folder (lore backend)")
+    parser.add_argument("--lore_args", type=str, default=LORE_ARGS, help="LORE options, as in scripts/infer/demo_wired.sh")
+    parser.add_argument("--stub_grid", type=str, default="4x3", help="Rows x cols of the stub backend")
+    parser.add_argument("--stub_delay", type=float, default=0.0, help="Seconds the stub backend sleeps per image")
+    args = parser.parse_args()
+
+    if args.backend == "lore":
+        backend = LoreBackend(args.lore_src, args.lore_args)
+    else:
+        rows, cols = (int(v) for v in args.stub_grid.lower().split("x"))
+        backend = StubBackend(rows, cols, delay=args.stub_delay)
+    serve(backend, args.output_dir)
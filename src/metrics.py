@@ -1,6 +1,7 @@
 import json
 import distance  
 from difflib import SequenceMatcher
+from functools import lru_cache
 import numpy as np
 from scipy.optimize import linear_sum_assignment
 import distance
@@ -169,52 +170,27 @@ def calculate_normalized_information_distance(predicted_json, ground_truth_json)
         return overall_dataset_norm_dist
     
 
+# ============================================================
+# Person similarity
+#
+# Persons are flattened once to {field path: value}; the similarity matrix
+# between two person lists is built per field from the unique values on each
+# side, with one batched string kernel call per field:
+#   "levenshtein": 1 - normalized Levenshtein distance (used for matching)
+#   "ratio":       difflib.SequenceMatcher ratio
+# ============================================================
+
 def string_similarity(a, b):
     """Return a similarity between 0 and 1 for two strings (handles None)."""
     if not a or not b:
         return 0.0
-    return SequenceMatcher(None, a.strip().lower(), b.strip().lower()).ratio()
-
-def person_similarity(p1, p2, use_fuzzy=True):
-    """Compare two person dicts by their .value fields."""
-    fields = ['vader', 'moeder', 'geboorte_datum', 'geboorte_plaats', 'laatste_woonplaats']
-    scores = []
-    for field in fields:
-        v1 = p1.get(field, {}).get('value')
-        v2 = p2.get(field, {}).get('value')
-        if use_fuzzy:
-            scores.append(string_similarity(v1, v2))
-        else:
-            scores.append(1.0 if v1 == v2 and v1 is not None else 0.0)
-        scores.append(string_similarity(v1, v2))
-    return sum(scores) / len(scores)
+    return _sequence_ratio(a.strip().lower(), b.strip().lower())
 
-def best_match_similarity(list1, list2):
-    """Compute max similarity matching between two person lists regardless of order."""
-    n = len(list1)
-    m = len(list2)
-    size = max(n, m)
-    
-    # Build similarity matrix (size x size)
-    sim_matrix = np.zeros((size, size))
-    for i in range(size):
-        for j in range(size):
-            if i < n and j < m:
-                sim_matrix[i, j] = person_similarity(list1[i], list2[j])
-            else:
-                sim_matrix[i, j] = 0.0  # no match for extra rows
-    
-    # Convert to cost matrix for Hungarian algorithm (we minimize cost)
-    cost_matrix = 1.0 - sim_matrix
-    
-    row_ind, col_ind = linear_sum_assignment(cost_matrix)
-    matched_similarities = sim_matrix[row_ind, col_ind]
-    return matched_similarities.mean()
 
+@lru_cache(maxsize=1 << 18)
+def _sequence_ratio(a, b):
+    return SequenceMatcher(None, a, b).ratio()
 
-import numpy as np
-import distance
-from scipy.optimize import linear_sum_assignment
 
 def normalized_edit_distance(a, b):
     """Compute normalized Levenshtein distance (0–1)."""
@@ -222,6 +198,120 @@ def normalized_edit_distance(a, b):
         return 1.0  # completely dissimilar if one is empty
     return distance.levenshtein(a.strip().lower(), b.strip().lower()) / max(len(a), len(b))
 
+
+def levenshtein_matrix(left, right):
+    """
+    Levenshtein distances between every string in `left` and every string in `right`.
+
+    Uses the bit-parallel algorithm of Myers/Hyyrö, vectorized over all pairs:
+    one pass over the characters of the `right` strings. Strings of `left` are
+    split into blocks of 64 characters (one uint64 word each) chained by the
+    horizontal carry, so there is no length limit, but the work grows with the
+    number of blocks; the side needing fewer blocks per character of the other
+    side is used as `left` (the distance is symmetric).
+    """
+    dist = np.zeros((len(left), len(right)), dtype=np.int64)
+    if not left or not right:
+        return dist
+    if _block_cost(right, left) < _block_cost(left, right):
+        return levenshtein_matrix(right, left).T.copy()
+
+    right_lengths = np.array([len(b) for b in right])
+    groups = {}
+    for i, a in enumerate(left):
+        if a:
+            groups.setdefault((len(a) + 63) // 64, []).append(i)
+        else:
+            dist[i] = right_lengths
+
+    alphabet = {c: k for k, c in enumerate(sorted(set("".join(left)) | set("".join(right))))}
+    codes = np.full((len(right), max(right_lengths.max(), 1)), len(alphabet), dtype=np.int64)
+    for j, b in enumerate(right):
+        codes[j, :len(b)] = [alphabet[c] for c in b]
+
+    for words, rows in groups.items():
+        dist[rows] = _block_levenshtein([left[i] for i in rows], words, alphabet, codes, right_lengths)
+    return dist
+
+
+def _block_cost(left, right):
+    """Word operations of `levenshtein_matrix(left, right)`, up to a constant factor."""
+    return sum((len(a) + 63) // 64 for a in left) * max(len(b) for b in right)
+
+
+def _block_levenshtein(strings, words, alphabet, codes, right_lengths):
+    """
+    Distances of non-empty `strings` of `words` 64-character blocks each to the
+    `right` strings encoded in `codes` (multi-word Myers/Hyyrö).
+    """
+    word = (1 << 64) - 1
+    # Peq[w, s, c]: bit k set where character 64 * w + k of string s is c (last column: padding)
+    peq = np.zeros((words, len(strings), len(alphabet) + 1), dtype=np.uint64)
+    pv = np.zeros((words, len(strings), 1), dtype=np.uint64)
+    last = np.zeros((words, len(strings), 1), dtype=np.uint64)
+    for row, a in enumerate(strings):
+        masks = {}
+        for pos, c in enumerate(a):
+            masks[c] = masks.get(c, 0) | (1 << pos)
+        for w in range(words):
+            for c, mask in masks.items():
+                peq[w, row, alphabet[c]] = (mask >> (64 * w)) & word
+            pv[w, row] = (((1 << len(a)) - 1) >> (64 * w)) & word
+        last[(len(a) - 1) // 64, row] = 1 << ((len(a) - 1) % 64)
+
+    pv = np.repeat(pv, len(right_lengths), axis=2)
+    mv = np.zeros_like(pv)
+    score = np.repeat(np.array([len(a) for a in strings], dtype=np.int64)[:, None], len(right_lengths), axis=1)
+    zero, one, top = np.uint64(0), np.uint64(1), np.uint64(63)
+    for j in range(codes.shape[1]):
+        active = (j < right_lengths)[None, :]
+        # Horizontal carry into the first block: row 0 of the matrix grows by 1 per column
+        hp, hn = one, zero
+        for w in range(words):
+            eq = peq[w][:, codes[:, j]]
+            p, m = pv[w], mv[w]
+            xv = eq | m
+            eq = eq | hn
+            xh = (((eq & p) + p) ^ p) | eq
+            ph = m | ~(xh | p)
+            mh = p & xh
+            score += active & ((ph & last[w]) != 0)
+            score -= active & ((mh & last[w]) != 0)
+            carry_p, carry_n = ph >> top, mh >> top
+            ph = (ph << one) | hp
+            mh = (mh << one) | hn
+            pv[w] = np.where(active, mh | ~(xv | ph), p)
+            mv[w] = np.where(active, ph & xv, m)
+            hp, hn = carry_p, carry_n
+    return score
+
+
+def _levenshtein_kernel(left, right):
+    """1 - normalized_edit_distance for all pairs of non-empty values."""
+    dist = levenshtein_matrix([a.strip().lower() for a in left], [b.strip().lower() for b in right])
+    lengths = np.maximum(np.array([len(a) for a in left])[:, None], np.array([len(b) for b in right])[None, :])
+    return 1 - dist / lengths
+
+
+def _ratio_kernel(left, right):
+    """string_similarity for all pairs of non-empty values."""
+    scores = np.zeros((len(left), len(right)))
+    matcher = SequenceMatcher(None)
+    for j, b in enumerate(right):
+        # seq2 is indexed once per value and reused for every value on the left
+        matcher.set_seq2(b.strip().lower())
+        for i, a in enumerate(left):
+            matcher.set_seq1(a.strip().lower())
+            scores[i, j] = matcher.ratio()
+    return scores
+
+
+SIMILARITY_KERNELS = {
+    "levenshtein": _levenshtein_kernel,
+    "ratio": _ratio_kernel,
+}
+
+
 def extract_value_paths(obj, prefix=""):
     paths = []
 
@@ -250,21 +340,88 @@ def get_nested_value(obj, path):
     return None
 
 
-def person_similarity(p1, p2):
-    fields = extract_value_paths(p2)
+def flatten_person(person):
+    """{field path: value} of every field with a "value" (see extract_value_paths)."""
+    return {path: get_nested_value(person, path) for path in extract_value_paths(person)}
 
-    sims = []
-    for field_path in fields:
-        v1 = get_nested_value(p1, field_path)
-        v2 = get_nested_value(p2, field_path)
 
-        if not v1 and not v2:
-            continue
+def _field_values(flat_persons, field):
+    """Unique non-empty values of `field` and, per person, the index of its value (-1: empty, -2: absent)."""
+    values, index = {}, []
+    for person in flat_persons:
+        if field not in person:
+            index.append(-2)
+        elif not person[field]:
+            index.append(-1)
+        else:
+            index.append(values.setdefault(person[field], len(values)))
+    return list(values), np.array(index, dtype=np.int64)
+
+
+def flat_similarity_matrix(flat1, flat2, kernel="levenshtein"):
+    """similarity_matrix on already flattened persons."""
+    kernel_func = SIMILARITY_KERNELS[kernel]
+    total = np.zeros((len(flat1), len(flat2)))
+    counts = np.zeros((len(flat1), len(flat2)), dtype=np.int64)
+
+    fields = list(dict.fromkeys(field for person in flat2 for field in person))
+    for field in fields:
+        values2, index2 = _field_values(flat2, field)
+        values1, index1 = _field_values(flat1, field)
+        # `field` is absent from some persons of list1: it counts as an empty value there
+        index1[index1 == -2] = -1
+
+        present2 = index2 != -2
+        filled1 = (index1 >= 0)[:, None]
+        filled2 = (index2 >= 0)[None, :]
+        # Fields that are empty on both sides are skipped; one empty side scores 0
+        counts += present2[None, :] & (filled1 | filled2)
+        if values1 and values2:
+            strings = all(isinstance(v, str) for v in values1 + values2)
+            if strings:
+                scores = kernel_func(values1, values2)
+            else:
+                # Non-string values: the scalar definitions decide (and raise) as before
+                scalar = string_similarity if kernel == "ratio" else lambda a, b: 1 - normalized_edit_distance(a, b)
+                scores = np.array([[scalar(a, b) for b in values2] for a in values1], dtype=float)
+            both = filled1 & filled2
+            total += np.where(both, scores[np.maximum(index1, 0)][:, np.maximum(index2, 0)], 0.0)
+
+    return np.divide(total, counts, out=np.zeros_like(total), where=counts > 0)
+
+
+def similarity_matrix(list1, list2, kernel="levenshtein"):
+    """
+    Similarity of every person in `list1` to every person in `list2`, shape (len(list1), len(list2)).
+
+    For each pair: the mean kernel similarity over the fields of the `list2`
+    person, skipping fields that are empty in both; a field empty on one side
+    scores 0.
+    """
+    return flat_similarity_matrix([flatten_person(p) for p in list1], [flatten_person(p) for p in list2], kernel)
 
-        d = normalized_edit_distance(v1 or "", v2 or "")
-        sims.append(1 - d)
 
-    return np.mean(sims) if sims else 0.0
+def person_similarity(p1, p2, kernel="levenshtein"):
+    """Similarity of two persons over the fields of `p2` (see similarity_matrix)."""
+    return similarity_matrix([p1], [p2], kernel)[0, 0]
+
+
+def best_match_similarity(list1, list2, kernel="levenshtein"):
+    """Compute max similarity matching between two person lists regardless of order."""
+    n = len(list1)
+    m = len(list2)
+    size = max(n, m)
+    
+    # Build similarity matrix (size x size); no match for extra rows
+    sim_matrix = np.zeros((size, size))
+    sim_matrix[:n, :m] = similarity_matrix(list1, list2, kernel)
+    
+    # Convert to cost matrix for Hungarian algorithm (we minimize cost)
+    cost_matrix = 1.0 - sim_matrix
+    
+    row_ind, col_ind = linear_sum_assignment(cost_matrix)
+    matched_similarities = sim_matrix[row_ind, col_ind]
+    return matched_similarities.mean()
 
 
 def infomration_extraction_precision_recall(list_pred, list_gt, threshold=0.4):
@@ -275,11 +432,11 @@ def infomration_extraction_precision_recall(list_pred, list_gt, threshold=0.4):
     n, m = len(list_pred), len(list_gt)
     size = max(n, m)
 
-    # --- Step 1: Build similarity matrix for matching ---
+    # --- Step 1: Build similarity matrix for matching (persons flattened once) ---
+    flat_pred = [flatten_person(p) for p in list_pred]
+    flat_gt = [flatten_person(p) for p in list_gt]
     sim_matrix = np.zeros((size, size))
-    for i in range(n):
-        for j in range(m):
-            sim_matrix[i, j] = person_similarity(list_pred[i], list_gt[j])
+    sim_matrix[:n, :m] = flat_similarity_matrix(flat_pred, flat_gt)
 
     # --- Step 2: Hungarian assignment ---
     cost_matrix = 1.0 - sim_matrix
@@ -294,19 +451,15 @@ def infomration_extraction_precision_recall(list_pred, list_gt, threshold=0.4):
         if i >= n or j >= m:
             continue
 
-        person_pred = list_pred[i]
-        person_gt = list_gt[j]
-
-        pred_fields = extract_value_paths(person_pred)
-        gt_fields   = extract_value_paths(person_gt)
+        person_pred = flat_pred[i]
+        person_gt = flat_gt[j]
 
-        total_pred_fields += len(pred_fields)
-        total_gt_fields   += len(gt_fields)
+        total_pred_fields += len(person_pred)
+        total_gt_fields   += len(person_gt)
 
         # Count matches
-        for field_path in pred_fields:
-            v1 = get_nested_value(person_pred, field_path)
-            v2 = get_nested_value(person_gt, field_path)
+        for field_path, v1 in person_pred.items():
+            v2 = person_gt.get(field_path)
             if v1 is None and v2 is None:
                 continue
             d = normalized_edit_distance(v1 or "", v2 or "")
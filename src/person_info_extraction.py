@@ -38,12 +38,9 @@ def generate_prompt(cells):
     """
     return prompt
 
-def extract_info_LLM(cells, model_name="llama-3.3-70b-versatile", temperature=.5):
+def _chat_json(prompt, model_name, temperature):
     client = Groq(api_key=groq_key)
-    
-    prompt = generate_prompt(cells)
-    
-    
+
     response_format = { "type": "json_object" }
     content = [{"type": "text", "text": prompt}]
 
@@ -59,8 +56,126 @@ def extract_info_LLM(cells, model_name="llama-3.3-70b-versatile", temperature=.5
         response_format=response_format,
     )
 
-    result = response.choices[0].message.content
-    return result
+    return response.choices[0].message.content
+
+
+def extract_info_LLM(cells, model_name="llama-3.3-70b-versatile", temperature=.5):
+    prompt = generate_prompt(cells)
+    return _chat_json(prompt, model_name, temperature)
+
+
+# ============================================================
+# Row-batch mode: K rows per model call
+# ============================================================
+
+PERSON_FIELDS = ["vader", "moeder", "geboorte_datum", "geboorte_plaats", "laatste_woonplaats"]
+
+
+def row_delimiter(row_index):
+    return f"### ROW {row_index} ###"
+
+
+def generate_batch_prompt(rows, row_indices):
+    """Prompt for several rows at once; the instructions are sent only once."""
+    blocks = "\n".join(
+        f"{row_delimiter(idx)}\n{str([cell for cell in cells])}\n### END ROW {idx} ###"
+        for idx, cells in zip(row_indices, rows)
+    )
+    prompt = f"""
+    You are given the cells of several rows of a table. Each row is one person and
+    is enclosed between "### ROW <n> ###" and "### END ROW <n> ###".
+    Extract the information from each row separately; never combine cells of different rows.
+
+    Rows:
+    {blocks}
+
+    Rules:
+    - Search all cell text of a row for the following fields:
+    - vader: The father’s name (after "Vader").
+    - moeder: The mother’s name (after "Moeder").
+    - geboorte_datum: The date after "Geboren Den".
+    - geboorte_plaats: The place after "Geboortplaats".
+    - laatste_woonplaats: The place after "Laatste Woonplaats".
+    - For each extracted value, also include the cell’s HTML `id` where the value was found as “cell”.
+    - If a field is not present, return None.
+    - Output one JSON object keyed by the row number <n>, with one entry for every row:
+
+    {{
+    "<n>": {{
+        "vader": {{"value": "...", "cell": "..."}},
+        "moeder": {{"value": "...", "cell": "..."}},
+        "geboorte_datum": {{"value": "...", "cell": "..."}},
+        "geboorte_plaats": {{"value": "...", "cell": "..."}},
+        "laatste_woonplaats": {{"value": "...", "cell": "..."}}
+    }}
+    }}
+
+    """
+    return prompt
+
+
+def _cell_ids(cells):
+    return {cell.get("id") for cell in cells if cell.get("id") is not None}
+
+
+def parse_batch_response(response, rows, row_indices):
+    """
+    Split a batch response into one person object per row.
+
+    Fields the model left out or returned as null/None (as the prompt allows)
+    become {"value": None, "cell": None}. Raises ValueError when a row is missing,
+    malformed, or cites a cell that is not part of that row (so row and cell
+    provenance cannot be trusted).
+    """
+    data = json.loads(response)
+    if not isinstance(data, dict):
+        raise ValueError("Batch response is not a JSON object")
+
+    persons = []
+    for idx, cells in zip(row_indices, rows):
+        person = data.get(str(idx))
+        if not isinstance(person, dict):
+            raise ValueError(f"Row {idx} missing or malformed in batch response")
+        for key in PERSON_FIELDS:
+            if person.get(key) in (None, "None", "null"):
+                person[key] = {"value": None, "cell": None}
+            elif not isinstance(person[key], dict):
+                raise ValueError(f"Row {idx} field {key} malformed in batch response")
+        allowed = _cell_ids(cells)
+        for field in person.values():
+            cell = field.get("cell") if isinstance(field, dict) else None
+            if isinstance(cell, (list, dict)):
+                raise ValueError(f"Row {idx} has a malformed cell {cell!r}")
+            if cell not in (None, "None", "") and cell not in allowed:
+                raise ValueError(f"Row {idx} cites cell {cell} outside the row")
+        persons.append(json.dumps(person))
+    return persons
+
+
+def extract_info_LLM_batch(rows, row_indices=None, batch_size=8, model_name="llama-3.3-70b-versatile", temperature=.5):
+    """
+    Extract persons from many rows with `batch_size` rows per model call.
+
+    Returns one JSON string per row, in the same format as `extract_info_LLM`.
+    Batches whose response cannot be parsed back into rows fall back to
+    single-row calls.
+    """
+    if row_indices is None:
+        row_indices = list(range(len(rows)))
+
+    results = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        indices = row_indices[start:start + batch_size]
+        if len(batch) > 1:
+            try:
+                response = _chat_json(generate_batch_prompt(batch, indices), model_name, temperature)
+                results.extend(parse_batch_response(response, batch, indices))
+                continue
+            except ValueError as e:
+                print(f"Batch of rows {indices[0]}-{indices[-1]} could not be parsed ({e}); falling back to single rows")
+        results.extend(extract_info_LLM(cells, model_name, temperature) for cells in batch)
+    return results
 
 def extract_info_regex(cells):
     person = {
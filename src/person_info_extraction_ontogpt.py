@@ -3,6 +3,7 @@ import yaml
 import json
 import shutil
 import subprocess
+from bisect import bisect_right
 from copy import deepcopy
 
 
@@ -41,30 +42,39 @@ def write_json(path: str, data):
 # Step 1 — Extract Text & Cell Spans
 # ============================================================
 
+def layout_row(row, text=""):
+    """
+    Append the cells of one row to `text`, one cell per line.
+
+    Returns the new text and the cell spans as true character offsets into it,
+    so single-row and batch inputs map OntoGPT spans to the same cells.
+    """
+    cell_spans = []
+    for cell in row:
+        start = len(text)
+        cell_spans.append({"id": cell["id"], "start": start, "end": start + len(cell["text"]), "text": cell["text"]})
+        text += cell["text"] + "\n"
+    return text, cell_spans
+
+
 def extract_text_and_spans(row, out_dir):
     """
     Convert OCR table rows → flat text + span mapping.
     Only processes row index 1 (as per original behaviour).
-    """
 
-    ensure_dir(out_dir)
-    row_text = ""
-    cursor = 0
-    cell_spans = []
-
-    for cell in row:
-        text = cell["text"]
-        cid = cell["id"]
-        start = cursor
-        end = start + len(text)
+    Writes row.txt for OntoGPT and returns the cell spans.
 
-        cell_spans.append({"id": cid, "start": start, "end": end, "text": text})
+    row.txt is the same as it has always been. The spans used to leave out the
+    newline after each cell, so an entity in a later cell could be mapped to the
+    wrong cell: JSON written before that was corrected can differ in its "cell"
+    values (and so in the provenance cell links), never in the extracted values.
+    """
 
-        row_text += text + "\n"
-        cursor = end
+    ensure_dir(out_dir)
+    row_text, cell_spans = layout_row(row)
 
-    write_yaml(os.path.join(out_dir, "table_cells.yaml"), cell_spans)
     write_text(os.path.join(out_dir, "row.txt"), row_text)
+    return cell_spans
 
 
 # ============================================================
@@ -100,22 +110,34 @@ def run_ontogpt(template, cwd, input_file="row.txt", output_file="person.yaml",
 # Step 3 — Map Text Spans → Cell IDs
 # ============================================================
 
-def find_cell_for_span(start, spans):
+def build_span_index(cell_spans):
+    """
+    Sort the cell spans into parallel start/end/id arrays for `bisect` lookups.
+    Empty cells (start == end) can never cover an offset and are left out.
+    """
+    spans = sorted((item for item in cell_spans if item["start"] < item["end"]), key=lambda item: item["start"])
+    return (
+        [item["start"] for item in spans],
+        [item["end"] for item in spans],
+        [item["id"] for item in spans],
+    )
+
+
+def find_cell_for_span(start, span_index):
     """Return the cell ID covering a character offset."""
-    for item in spans:
-        if item["start"] <= start < item["end"]:
-            return item["id"]
+    starts, ends, ids = span_index
+    i = bisect_right(starts, start) - 1
+    if i >= 0 and start < ends[i]:
+        return ids[i]
     return None
 
 
-def map_text_spans_to_cells(yaml_path, cells_path):
+def map_text_spans_to_cells(data, cell_spans):
     """
-    Merges OntoGPT YAML with provenance mapping to cell IDs.
+    Adds the cell IDs covering each named entity's spans to the parsed
+    OntoGPT output (in memory).
     """
-
-    data = load_yaml(yaml_path)
-    cell_spans = load_yaml(cells_path)
-
+    span_index = build_span_index(cell_spans)
     named_entities = data.get("named_entities", [])
 
     for ent in named_entities:
@@ -130,12 +152,12 @@ def map_text_spans_to_cells(yaml_path, cells_path):
             except AttributeError:
                 continue
 
-            cid = find_cell_for_span(start, cell_spans)
+            cid = find_cell_for_span(start, span_index)
             mapped_cells.append(cid)
 
         ent["cell"] = mapped_cells[0] if len(mapped_cells) == 1 else mapped_cells or None
 
-    write_yaml(yaml_path, data)
+    return data
 
 
 # ============================================================
@@ -191,11 +213,14 @@ def process_value(row_index, value, named_entities):
 
 def convert_yaml_to_json(row_index, yaml_path, json_output):
     """
-    Converts OntoGPT YAML output into normalized JSON, supporting
+    Converts an OntoGPT YAML file into normalized JSON, supporting
     nested structures safely.
     """
-    data = load_yaml(yaml_path)
+    convert_to_json(row_index, load_yaml(yaml_path), json_output)
 
+
+def convert_to_json(row_index, data, json_output):
+    """Converts parsed OntoGPT output into normalized JSON."""
     extracted_raw = data.get("extracted_object")
     if not isinstance(extracted_raw, (dict, list)):
         print("Warning: Invalid or missing 'extracted_object'.")
@@ -230,7 +255,7 @@ def extract_person_info(row_idx, logical_rows, schema_path, json_output, temp_di
     ensure_dir(temp_dir)
 
     # Step 1: Prepare text + spans
-    extract_text_and_spans(logical_rows, temp_dir)
+    cell_spans = extract_text_and_spans(logical_rows, temp_dir)
 
     # Step 2: Copy schema locally
     schema_copy = os.path.join(temp_dir, os.path.basename(schema_path))
@@ -240,12 +265,197 @@ def extract_person_info(row_idx, logical_rows, schema_path, json_output, temp_di
     # Step 3: Run OntoGPT
     yaml_path = run_ontogpt(template=schema_name, cwd=temp_dir, model=llm_model)
 
-    # Step 4: Add provenance
-    map_text_spans_to_cells(
-        yaml_path,
-        os.path.join(temp_dir, "table_cells.yaml")
-    )
+    # Step 4: Add provenance (in memory, the YAML is read once)
+    data = map_text_spans_to_cells(load_yaml(yaml_path), cell_spans)
 
     # Step 5: Convert to JSON
-    convert_yaml_to_json(row_idx, yaml_path, json_output)
+    convert_to_json(row_idx, data, json_output)
+
+
+# ============================================================
+# Row-batch mode: K rows per OntoGPT call
+# ============================================================
+
+def extract_batch_text_and_spans(rows, row_indices, out_dir):
+    """
+    Write K rows as one OntoGPT input, each preceded by a "### ROW <n> ###" line.
+
+    Returns {row index: cell spans} with the offsets of a single-row input (i.e.
+    relative to the row's start) and the (start, end, row index) character range
+    of every row in the batch text.
+    """
+    ensure_dir(out_dir)
+    batch_text = ""
+    cell_spans = {}
+    row_ranges = []
+
+    for row_idx, row in zip(row_indices, rows):
+        batch_text += f"### ROW {row_idx} ###\n"
+        row_text, cell_spans[row_idx] = layout_row(row)
+        row_ranges.append((len(batch_text), len(batch_text) + len(row_text), row_idx))
+        batch_text += row_text
+
+    write_text(os.path.join(out_dir, "row.txt"), batch_text)
+    return cell_spans, row_ranges
+
+
+BATCH_CLASS = "PersonList"
+
+
+def write_batch_schema(schema_path, out_dir):
+    """
+    Write the row-batch version of a one-person template to `out_dir`.
+
+    The template's tree_root class becomes the range of the multivalued `persons`
+    slot of a new tree_root class PersonList, so one OntoGPT call extracts the
+    list of persons that `split_batch_output` expects. Returns the file name.
+    """
+    schema = load_yaml(schema_path)
+    classes = schema.get("classes") or {}
+    roots = [name for name, cls in classes.items() if (cls or {}).get("tree_root")]
+    if len(roots) != 1:
+        raise ValueError(f"Template {schema_path} has no single tree_root class")
+    root = roots[0]
+
+    classes[root] = dict(classes[root], tree_root=False)
+    classes[BATCH_CLASS] = {
+        "tree_root": True,
+        "description": f"All {root} entries of the text, one for every \"### ROW <n> ###\" section.",
+        "attributes": {
+            "persons": {
+                "description": f"One {root} per table row.",
+                "range": root,
+                "multivalued": True,
+                "inlined_as_list": True,
+                "annotations": {
+                    "prompt": "semicolon-separated list of the persons, one for every \"### ROW <n> ###\" "
+                              "section, each taken only from the text of its own section",
+                },
+            },
+        },
+    }
+    schema["classes"] = classes
+    schema["id"] = f"{schema.get('id', '')}_batch"
+    schema["name"] = f"{schema.get('name', 'schema')}_batch"
+
+    file_name = os.path.splitext(os.path.basename(schema_path))[0] + "_batch.yaml"
+    write_yaml(os.path.join(out_dir, file_name), schema)
+    return file_name
+
+
+def _span_start(span_str):
+    try:
+        start, _ = map(int, span_str.split(":"))
+    except (ValueError, AttributeError):
+        return None
+    return start
+
+
+def _entity_row(ent, row_ranges):
+    """Row index whose text contains all spans of a named entity, or None."""
+    starts = [row_start for row_start, _, _ in row_ranges]
+    rows = set()
+    for span_str in ent.get("original_spans") or []:
+        start = _span_start(span_str)
+        if start is None:
+            continue
+        i = bisect_right(starts, start) - 1
+        if i < 0 or start >= row_ranges[i][1]:
+            raise ValueError(f"Span {span_str} falls outside every row")
+        rows.add(row_ranges[i][2])
+    if len(rows) > 1:
+        raise ValueError(f"Entity {ent.get('id')} spans several rows")
+    return rows.pop() if rows else None
+
+
+def _shift_spans(ent, offset):
+    """Copy of a named entity with its "start:end" spans moved `offset` characters back."""
+    spans = []
+    for span_str in ent.get("original_spans") or []:
+        try:
+            start, end = map(int, span_str.split(":"))
+        except (ValueError, AttributeError):
+            spans.append(span_str)
+            continue
+        spans.append(f"{start - offset}:{end - offset}")
+    return dict(ent, original_spans=spans) if ent.get("original_spans") else dict(ent)
+
+
+def _referenced_ids(value):
+    if isinstance(value, dict):
+        return [ref for val in value.values() for ref in _referenced_ids(val)]
+    if isinstance(value, list):
+        return [ref for item in value for ref in _referenced_ids(item)]
+    return [value] if isinstance(value, str) else []
+
+
+def split_batch_output(data, row_ranges):
+    """
+    Split the parsed OntoGPT output of a batch back into per-row outputs.
+
+    The output must hold a list of persons (either the extracted object itself
+    or its single list-valued field), as the template of `write_batch_schema` does. Each person is assigned to the row of the
+    named entities it references, at most one person per row; raises ValueError
+    when that is not possible. The spans of each row's named entities are made
+    relative to the row's start, as in a single-row call.
+    """
+    extracted = data.get("extracted_object")
+    if isinstance(extracted, dict):
+        lists = [val for key, val in extracted.items() if key not in ("id", "type") and isinstance(val, list)]
+        if len(lists) != 1:
+            raise ValueError("Batch output does not contain a list of persons")
+        extracted = lists[0]
+    if not isinstance(extracted, list):
+        raise ValueError("Invalid or missing 'extracted_object'")
+
+    named_entities = data.get("named_entities") or []
+    entity_rows = {ent.get("id"): _entity_row(ent, row_ranges) for ent in named_entities}
+
+    per_row = {}
+    for person in extracted:
+        if not isinstance(person, dict):
+            raise ValueError("Person is not an object")
+        rows = {entity_rows[ref] for ref in _referenced_ids(person) if entity_rows.get(ref) is not None}
+        if len(rows) != 1:
+            raise ValueError("Person cannot be assigned to exactly one row")
+        row_idx = rows.pop()
+        if row_idx in per_row:
+            raise ValueError(f"Several persons extracted from row {row_idx}")
+        per_row[row_idx] = {"extracted_object": person, "named_entities": []}
+
+    row_starts = {row_idx: start for start, _, row_idx in row_ranges}
+    for ent in named_entities:
+        row_idx = entity_rows[ent.get("id")]
+        if row_idx in per_row:
+            per_row[row_idx]["named_entities"].append(_shift_spans(ent, row_starts[row_idx]))
+    return per_row
+
+
+def extract_person_info_batch(row_indices, rows, schema_path, json_outputs, temp_dir="temp/", llm_model="ollama/llama3"):
+    """
+    Batch version of `extract_person_info`: one OntoGPT call for all given rows.
+
+    `schema_path` is the one-person template of `extract_person_info`; the call
+    uses its PersonList version (see `write_batch_schema`). `json_outputs` holds one
+    output path per row. Falls back to single-row calls when the batch output
+    cannot be split back into rows.
+    """
+    ensure_dir(temp_dir)
+
+    try:
+        cell_spans, row_ranges = extract_batch_text_and_spans(rows, row_indices, temp_dir)
+
+        batch_schema = write_batch_schema(schema_path, temp_dir)
+        yaml_path = run_ontogpt(template=batch_schema, cwd=temp_dir, model=llm_model)
+
+        per_row = split_batch_output(load_yaml(yaml_path), row_ranges)
+    except (ValueError, RuntimeError) as e:
+        print(f"Batch of rows {row_indices[0]}-{row_indices[-1]} failed ({e}); falling back to single rows")
+        for row_idx, row, json_output in zip(row_indices, rows, json_outputs):
+            extract_person_info(row_idx, row, schema_path, json_output, temp_dir=temp_dir, llm_model=llm_model)
+        return
+
+    for row_idx, json_output in zip(row_indices, json_outputs):
+        if row_idx in per_row:
+            convert_to_json(row_idx, map_text_spans_to_cells(per_row[row_idx], cell_spans[row_idx]), json_output)
 
@@ -1,8 +1,11 @@
-from utils import check_polygone_overlap, extract_textline, swap_row_col
+from utils import load_lore_cells, load_textlines, write_textlines_csv, to_polygon, polygon_covered, TextLine
 from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
 import os
 import json
-import pandas as pd
+import time
+import argparse
 
 
 def load_jsonl(file_path):
@@ -14,69 +17,80 @@ def load_jsonl(file_path):
     return data
 
 
-def find_cell_text(page_lines, cell_lines, output_file):
-    if len(page_lines) == 0 or not cell_lines:
-        return
-
-    with open(output_file, 'w') as f:
-        for cell_index, cell in enumerate(cell_lines):
-            # print(f"Processing cell {cell_index + 1}/{len(cell_lines)}")
-            matched_lines = []
-
-            for _, textline in page_lines.iterrows():
-                if check_polygone_overlap(textline['TextRegion Coords'], cell, threshold=0.2):
-                    # print(f"Cell {cell_index + 1} overlaps with textline: {textline['TextEquiv Text']}")
-                    matched_lines.append({
-                        'TextRegion ID': textline['TextRegion ID'],
-                        'TextLine ID': textline['TextLine ID'],
-                        'TextEquiv Text': textline['TextEquiv Text'],
-                        'TextRegion Coords': textline['TextRegion Coords']
-                    })
-
-            json_line = {str(cell_index): matched_lines}
-            f.write(json.dumps(json_line) + '\n')
-
-
-def add_text_to_cells(cells, cell_texts, wired=False):
+def load_cell_texts(file_path):
+    """Load a cell-text JSONL file into a list of TextLines indexed by cell id."""
+    cell_texts = []
+    for record in load_jsonl(file_path):
+        for key, matched_lines in record.items():
+            cell_index = int(key)
+            if cell_index >= len(cell_texts):
+                cell_texts.extend([] for _ in range(cell_index + 1 - len(cell_texts)))
+            cell_texts[cell_index] = [TextLine.from_record(item) for item in matched_lines]
+    return cell_texts
+
+
+def find_cell_text(textlines, cells, output_file=None):
+    """
+    Match text lines to cells.
+
+    Returns a list indexed by cell id holding the matched TextLines of each cell.
+    The JSONL file is only written when `output_file` is given (debug artifact).
+    """
+    if len(textlines) == 0 or not cells:
+        return []
+
+    # Build every polygon once instead of once per (line, cell) pair
+    line_polygons = [(textline, to_polygon(textline.coords)) for textline in textlines]
+    line_polygons = [(textline, polygon) for textline, polygon in line_polygons if polygon is not None]
+
+    cell_texts = []
+    for cell in cells:
+        cell_polygon = to_polygon(cell.coords)
+        if cell_polygon is None:
+            cell_texts.append([])
+            continue
+        cell_texts.append([
+            textline for textline, polygon in line_polygons
+            if polygon_covered(polygon, cell_polygon, threshold=0.2)
+        ])
+
+    if output_file:
+        with open(output_file, 'w') as f:
+            for cell_index, matched_lines in enumerate(cell_texts):
+                f.write(json.dumps({str(cell_index): [line.to_record() for line in matched_lines]}) + '\n')
+
+    return cell_texts
+
+
+def add_text_to_cells(cells, cell_texts):
+    """
+    Attach the matched text lines to each cell.
+
+    `cell_texts` is indexed by cell id, as returned by `find_cell_text` or `load_cell_texts`.
+    """
     for cell_index, cell in enumerate(cells):
-        if wired:
-            start_col, end_col, start_row, end_row = map(int, cell.split(","))
-        else:
-            start_row, end_row, start_col, end_col = map(int, cell.split(","))
-        content = ""
-        for line in cell_texts:
-            if str(cell_index) in line:
-                for item in line[str(cell_index)]:
-                    if 'TextEquiv Text' in item:
-                        content += str(item['TextEquiv Text']) + "<br/>"
-        cells[cell_index] = (start_row, end_row, start_col, end_col, content)
+        cell.lines = cell_texts[cell_index] if cell_index < len(cell_texts) else []
     return cells
 
 
 def build_table_from_cells(cells, output_file):
-    # cells = sorted(cells, key=lambda cell: (cell[0], cell[2]))
-    cells = list(enumerate(cells))
-    cells.sort(key=lambda x: (x[1][0], x[1][2]))
-    max_row = max(cell[1][1] for cell in cells) + 1
-    max_col = max(cell[1][3] for cell in cells) + 1
+    cells = sorted(cells, key=lambda cell: (cell.row, cell.col))
+    max_row = max(cell.end_row for cell in cells) + 1
+    max_col = max(cell.end_col for cell in cells) + 1
 
     table = [[None for _ in range(max_col)] for _ in range(max_row)]
 
-    for idx, cell in cells:
-        start_row, end_row, start_col, end_col, content = cell
-        rowspan = 1 + end_row - start_row
-        colspan = 1 + end_col - start_col
-
-        for row in range(start_row, end_row + 1):
-            for col in range(start_col, end_col + 1):
-                if row == start_row and col == start_col and table[row][col] != "merged":
+    for cell in cells:
+        for row in range(cell.row, cell.end_row + 1):
+            for col in range(cell.col, cell.end_col + 1):
+                if row == cell.row and col == cell.col and table[row][col] != "merged":
                     table[row][col] = {
-                        "id": idx,
-                        "row":row,
-                        "col":col,
-                        "rowspan": rowspan,
-                        "colspan": colspan,
-                        "content": content
+                        "id": cell.id,
+                        "row": row,
+                        "col": col,
+                        "rowspan": cell.row_span,
+                        "colspan": cell.col_span,
+                        "content": cell.content
                     }
                 else:
                     table[row][col] = "merged"
@@ -110,46 +124,128 @@ def table_to_markup(table):
     return markup
 
 
-def main(cells_file, structure_file, page_file, json_file, image_name, wired=False):
-    with open(cells_file, 'r') as file:
-        cell_lines = file.readlines()
-
-    with open(structure_file, 'r') as file:
-        cells_structure_lines = file.readlines()
+def main(cells_file, structure_file, page_file, json_file, image_name, wired=False, data_path="data"):
+    cells = load_lore_cells(cells_file, structure_file, wired)
 
-    csv_file = extract_textline(page_file, output_path=(os.path.dirname(page_file) + "/../" + "csv/"))
-    page_lines = pd.read_csv(csv_file, quotechar='\"', escapechar='\\', on_bad_lines='skip')
+    textlines = load_textlines(page_file)
+    csv_file = os.path.join(os.path.dirname(page_file), "..", "csv", os.path.basename(page_file) + ".csv")
+    write_textlines_csv(textlines, csv_file)
 
-    find_cell_text(page_lines, cell_lines, json_file)
-    cells_with_content = add_text_to_cells(cells_structure_lines, load_jsonl(json_file), wired)
+    cell_texts = find_cell_text(textlines, cells, json_file)
+    cells_with_content = add_text_to_cells(cells, cell_texts)
 
-    with open(os.path.join("data", "htr", "csv", image_name +'.txt'), 'w') as f:
+    text_file = os.path.join(data_path, "htr", "csv", image_name + '.txt')
+    with open(text_file, 'w') as f:
         for cell in cells_with_content:
-            line = ",".join(str(cell) for cell in cell)
+            line = ",".join(str(v) for v in (cell.row, cell.end_row, cell.col, cell.end_col, cell.content))
             f.write(line + "\n")
     # print(f"Text construction completed and saved to {json_file}")
 
-    table_html = build_table_from_cells(cells_with_content, output_file=os.path.join("data", "tables", "2D", image_name + ".txt"))
+    table_file = os.path.join(data_path, "tables", "2D", image_name + ".txt")
+    table_html = build_table_from_cells(cells_with_content, output_file=table_file)
     print("Table structure built successfully.")
 
-    markup_file = os.path.join("data", "tables", "html", image_name+ ".html")
+    markup_file = os.path.join(data_path, "tables", "html", image_name + ".html")
     table = BeautifulSoup(table_html, "html.parser")
     with open(markup_file, "w", encoding="utf-8") as f:
         f.write(table.prettify())
     print(f"Table reconstructed and saved to {markup_file}")
 
+    return {"csv": csv_file, "json": json_file, "text": text_file, "table": table_file, "html": markup_file}
+
+
+# =========================
+# FOLIO-LEVEL DRIVER
+# =========================
+
+def page_paths(image_name, data_path="data"):
+    """Input and intermediate paths used to reconstruct one page image."""
+    base_name = os.path.splitext(image_name)[0]
+    return {
+        "cells_file": os.path.join(data_path, "tables", "cells", "center", image_name + ".txt"),
+        "structure_file": os.path.join(data_path, "tables", "cells", "logi", image_name + ".txt"),
+        "page_file": os.path.join(data_path, "htr", "page", base_name + ".xml"),
+        "json_file": os.path.join(data_path, "tables", "json", image_name + ".jsonl"),
+    }
+
+
+def reconstruct_page(image_name, data_path="data", wired=True):
+    """
+    Reconstruct the table of one page.
+
+    Never raises: failures are reported in the returned manifest record so that
+    one bad page does not abort the whole folio.
+    """
+    start = time.perf_counter()
+    record = {"image": image_name, "status": "ok", "outputs": {}, "error": None}
+    try:
+        paths = page_paths(image_name, data_path)
+        record["outputs"] = main(
+            paths["cells_file"], paths["structure_file"], paths["page_file"], paths["json_file"],
+            image_name, wired=wired, data_path=data_path
+        )
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def reconstruct_folio(data_path="data", image_names=None, workers=None, wired=True, manifest_file=None):
+    """
+    Reconstruct the tables of all pages of a folio in a process pool.
+
+    Args:
+        data_path: Root of the data directory (images, htr, tables).
+        image_names: Images to process; defaults to every .jpg in `data_path`/images.
+        workers: Number of worker processes; defaults to all cores.
+        wired: Cell structure files are in LORE "wired" (col, col, row, row) order.
+        manifest_file: Where to write the summary manifest; defaults to `data_path`/tables/manifest.json.
+
+    Returns:
+        The manifest as a dict.
+    """
+    if image_names is None:
+        image_names = sorted(f for f in os.listdir(os.path.join(data_path, "images")) if f.endswith(".jpg"))
+    if manifest_file is None:
+        manifest_file = os.path.join(data_path, "tables", "manifest.json")
+    workers = workers or os.cpu_count() or 1
+
+    for folder in [("htr", "csv"), ("tables", "json"), ("tables", "2D"), ("tables", "html")]:
+        os.makedirs(os.path.join(data_path, *folder), exist_ok=True)
+
+    start = time.perf_counter()
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(reconstruct_page, image_name, data_path, wired) for image_name in image_names]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Reconstructing tables"):
+            record = future.result()
+            if record["status"] != "ok":
+                print(f"Failed to reconstruct {record['image']}: {record['error']}")
+            records.append(record)
+
+    records.sort(key=lambda r: r["image"])
+    failed = [r["image"] for r in records if r["status"] != "ok"]
+    manifest = {
+        "data_path": data_path,
+        "workers": workers,
+        "pages": len(records),
+        "succeeded": len(records) - len(failed),
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 3),
+        "records": records,
+    }
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Reconstructed {manifest['succeeded']}/{manifest['pages']} pages in {manifest['seconds']}s; "
+          f"manifest saved to {manifest_file}")
+    return manifest
 
-if __name__ == "__main__":
-    image_path = "data/images/"
-    image_files = [f for f in os.listdir(image_path) if f.endswith(".jpg")]
 
-    for image_name in image_files:
-        base_name = os.path.splitext(image_name)[0]
-
-        cells_bounding_box = f"data/tables/cells/center/{image_name}.txt"
-        cells_structure = f"data/tables/cells/logi/{image_name}.txt"
-        page_file = f"data/htr/page/{base_name}.xml"
-        json_file = f"data/tables/json/{image_name}.jsonl"
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_path", type=str, default="data", help="Root of the data directory")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all cores)")
+    args = parser.parse_args()
 
-        print(f"\nProcessing image: {image_name}")
-        main(cells_bounding_box, cells_structure, page_file, json_file, image_name, wired=True)
+    reconstruct_folio(args.data_path, workers=args.workers)
@@ -0,0 +1,89 @@
+import re
+
+# ============================================================
+# Cheap row classifier: drop rows that cannot contain a person
+# before any (expensive) LLM / OntoGPT call.
+# ============================================================
+
+# Keyword cues of a person row (same fields as `extract_info_regex`, tolerant of
+# common HTR errors such as "Geberen" / "Vaden")
+PERSON_CUES = {
+    "vader": re.compile(r"\bvad[ae][rn]\b", re.IGNORECASE),
+    "moeder": re.compile(r"\bmoe[dn]er\b", re.IGNORECASE),
+    "geboren": re.compile(r"\bgeb[oe]ren\b", re.IGNORECASE),
+    "geboorteplaats": re.compile(r"geboorte?\s*plaats", re.IGNORECASE),
+    "woonplaats": re.compile(r"woonplaats", re.IGNORECASE),
+    "jaar": re.compile(r"\b1[6-9]\d\d\b"),
+}
+
+# Column titles of the stamboeken tables
+HEADER_CUES = re.compile(
+    r"namen\s+en\s+toenamen|namen\s+der\s+ouders|datum\s+van\s+geboorte|gedane\s+veldtogten",
+    re.IGNORECASE
+)
+
+# Cells holding only ditto marks (,, „ " do id idem) or punctuation
+DITTO = re.compile(r"^(?:[\s,.;:„\"'\-–—]|\bdo\b|\bid\b|\bidem\b)*$", re.IGNORECASE)
+
+DEFAULT_THRESHOLD = 0.35
+MIN_CHARS = 40
+
+
+def score_row(row):
+    """
+    Score how likely a logical row holds a person.
+
+    Combines keyword hits (0.4), text length (0.3) and the fraction of cells with
+    content (0.3). Header rows (column titles but no person cues) score 0.
+
+    Returns a dict with the score and its components.
+    """
+    texts = [(cell.get("text") or "").strip() for cell in row]
+    header_cells = [text for text in texts if HEADER_CUES.search(text)]
+    content = [text for text in texts if text and not DITTO.match(text) and not HEADER_CUES.search(text)]
+
+    joined = " ".join(content)
+    keywords = [name for name, pattern in PERSON_CUES.items() if pattern.search(joined)]
+    length = len(joined)
+    coverage = len(content) / len(texts) if texts else 0.0
+
+    header = bool(header_cells) and not keywords
+    if header or not content:
+        score = 0.0
+    else:
+        score = 0.4 * min(1.0, len(keywords) / 2) + 0.3 * min(1.0, length / MIN_CHARS) + 0.3 * coverage
+
+    return {
+        "score": round(score, 4),
+        "keywords": keywords,
+        "length": length,
+        "coverage": round(coverage, 4),
+        "header": header,
+    }
+
+
+def filter_rows(logical_rows, threshold=DEFAULT_THRESHOLD, verbose=True):
+    """
+    Keep the rows that may contain a person.
+
+    Args:
+        logical_rows: Rows as returned by `parse_html_table` (lists of cell dicts).
+        threshold: Minimum score to keep a row; 0 keeps every row.
+        verbose: Print the rows that are skipped and why.
+
+    Returns:
+        A list of (original row index, row) tuples.
+    """
+    kept = []
+    for index, row in enumerate(logical_rows):
+        result = score_row(row)
+        if result["score"] >= threshold:
+            kept.append((index, row))
+        elif verbose:
+            reason = "header" if result["header"] else f"score {result['score']:.2f} < {threshold}"
+            print(f"Skipping row {index} ({reason}; keywords={result['keywords']}, "
+                  f"length={result['length']}, coverage={result['coverage']:.2f})")
+
+    if verbose:
+        print(f"Row filter kept {len(kept)}/{len(logical_rows)} rows")
+    return kept
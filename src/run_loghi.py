@@ -1,5 +1,6 @@
 import os
 import pty
+import shlex
 import shutil
 import time
 import subprocess
@@ -23,10 +24,11 @@ def copy_image(image_name):
 
 
 # Function to run the bash script
-def run_bash_script():
+def run_bash_script(loghi_dir="loghi", htr_dir=None):
     try:
-        # os.chdir("../")
-        os.chdir("loghi")
+        # The script is run from `loghi_dir` (cwd of the child only, so this is
+        # safe to call from a worker thread); `htr_dir` is the folder LOGHI
+        # processes, by default data/htr next to `loghi_dir`
         # TODO: Doesn't work; says "the input device is not a TTY"
         # subprocess.Popen(['%s %s' %(bash_script, os.path.join("..", destination_folder))], shell=True)
 
@@ -35,11 +37,13 @@ def run_bash_script():
         master_fd, slave_fd = pty.openpty()
 
         # Call CLI Process
+        htr_dir = os.path.abspath(htr_dir) if htr_dir else os.path.join("..", destination_folder)
         cmd = "scripts/inference-pipeline.sh " \
-                  "../data/htr"
+                  + shlex.quote(htr_dir)
 
         print("[DEBUG]: {}".format(cmd))
         proc = subprocess.Popen(cmd,
+                                cwd=loghi_dir,
                                 stdin=slave_fd,
                                 stderr=subprocess.STDOUT,
                                 shell=True,
@@ -47,12 +51,12 @@ def run_bash_script():
                                 start_new_session=True)
 
         proc.communicate()
+        os.close(slave_fd)
+        os.close(master_fd)
         print(f"Successfully ran bash script: {cmd}")
-        os.chdir("../") # Change back to the original directory
-        
+
     except subprocess.CalledProcessError as e:
         print(f"Error running bash script: {e}")
-        os.chdir("../") # Change back to the original directory
 
 
 # Function to delete the image
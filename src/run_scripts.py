@@ -9,6 +9,7 @@ from bs4 import BeautifulSoup
 
 from helpers import copy_file, delete_file, read_html_file, write_html_file, write_json_file, read_json_file
 from run_loghi import run_bash_script as run_loghi
+from lore_worker import LORE_ARGS
 
 def run_LOGHI_pipeline(data_path="data"):
     """Run the LOGHI pipeline from bash inside Python."""
@@ -34,31 +35,45 @@ def run_LOGHI_pipeline(data_path="data"):
             time.sleep(5)  # Adjust the sleep time as needed
 
 
-def run_LORE_pipeline():
-    """Run the LORE pipeline from bash inside Python."""
-    commands = f"""
-    cd Image2TableBoundingBoxDetection/src
-    source ~/anaconda3/etc/profile.d/conda.sh
-    conda deactivate
-    conda activate LORE
-    bash scripts/infer/demo_wired.sh
+LORE_ENV_COMMAND = ["conda", "run", "--no-capture-output", "-n", "LORE", "python"]
+
+
+def run_LORE_pipeline(data_path="data", backend="lore", command=LORE_ENV_COMMAND, lore_args=LORE_ARGS, image_names=None):
     """
-    result = subprocess.run(commands, shell=True, text=True, capture_output=True, executable="/bin/bash")
-    print(">>> Pipeline STDOUT:\n", result.stdout)
-    print(">>> Pipeline STDERR:\n", result.stderr)
+    Run LORE over the images of `data_path`/images with a persistent worker (see lore_worker.py).
 
+    The LORE environment is entered and the model loaded once; center/logi cell
+    files are written to `data_path`/tables/cells per image and the per-image
+    latency is reported as results stream in. `lore_args` are the model options
+    (default: those of scripts/infer/demo_wired.sh). Returns the result records.
+    """
+    from lore_worker import LoreWorker, LORE_SRC
+
+    image_dir = os.path.join(data_path, "images")
+    if image_names is None:
+        image_names = sorted(f for f in os.listdir(image_dir) if f.endswith(".jpg"))
+    backend_args = ["--lore_src", os.path.abspath(LORE_SRC), "--lore_args", lore_args] if backend == "lore" else []
+
+    results = []
+    with LoreWorker(backend, os.path.join(data_path, "tables", "cells"), command=command,
+                    backend_args=backend_args, cwd=LORE_SRC if backend == "lore" else None) as worker:
+        print(f"LORE worker ready (model loaded in {worker.load_seconds}s)")
+        for result in worker.process_images(os.path.join(image_dir, name) for name in image_names):
+            if result["status"] == "ok":
+                print(f"{os.path.basename(result['image'])}: {result['seconds']}s")
+            else:
+                print(f"{os.path.basename(result['image'])}: failed ({result['error']})")
+            results.append(result)
+    return results
 
-def reconstruct_table_pipeline(IMAGE_NAME, cells_bounding_box, cells_structure, page_file, json_file):
-    """Run table reconstruction using existing module."""
-    from reconstruct_table import main as reconstruct_table
-    reconstruct_table(cells_bounding_box, cells_structure, page_file, json_file, IMAGE_NAME, wired=True)
 
 # =========================
 # INFORMATION EXTRACTION
 # =========================
-def extract_persons_from_html(constructed_html):
-    """Extract persons from reconstructed HTML using LLM/regex."""
-    from person_info_extraction import extract_info_LLM
+def extract_persons_from_html(constructed_html, batch_size=1, threshold=0.35):
+    """Extract persons from reconstructed HTML using LLM/regex (batch_size rows per LLM call)."""
+    from person_info_extraction import extract_info_LLM, extract_info_LLM_batch
+    from row_filter import filter_rows
 
     soup = BeautifulSoup(constructed_html, 'html.parser')
     rows = soup.find_all('tr')
@@ -98,9 +113,17 @@ def extract_persons_from_html(constructed_html):
             c_idx += cell_data['colspan']
         logical_rows.append(current_row)
 
+    # Skip header / empty / ditto-only rows before any LLM call
+    kept = filter_rows(logical_rows, threshold=threshold)
+    rows = [row for _, row in kept]
+
     # Person extraction
-    for row in logical_rows:
-        person = json.loads(extract_info_LLM(row))
+    if batch_size > 1:
+        responses = extract_info_LLM_batch(rows, row_indices=[i for i, _ in kept], batch_size=batch_size)
+    else:
+        responses = (extract_info_LLM(row) for row in rows)
+    for response in responses:
+        person = json.loads(response)
         if person and not all(v['value'] is None for v in person.values()):
             persons.append(person)
 
@@ -125,26 +148,16 @@ def calculate_TEDS(ground_truth_html, predicted_html):
     print(f"TEDS-Struct: {teds_struct_score:.4f}")
     return teds_score, teds_struct_score
 
-def ml_construct_table(data_path):    
+def ml_construct_table(data_path, workers=None):    
     # Run LOGHI pipeline
     run_LOGHI_pipeline()
 
     # Run LORE pipeline
-    run_LORE_pipeline()
-
-    # Reconstruct tables
-    for filename in os.listdir(os.path.join(data_path, "images")):
-        if not filename.endswith('.jpg'):
-            continue
-        
-        IMAGE_NAME = filename
-        BASE_NAME = os.path.splitext(IMAGE_NAME)[0]
+    run_LORE_pipeline(data_path)
 
-        cells_bounding_box = f"{data_path}/tables/cells/center/{IMAGE_NAME}.txt"
-        cells_structure = f"{data_path}/tables/cells/logi/{IMAGE_NAME}.txt"
-        page_file = f"{data_path}/htr/page/{BASE_NAME}.xml"
-        json_file = f"{data_path}/tables/json/{IMAGE_NAME}.jsonl"
-        reconstruct_table_pipeline(IMAGE_NAME, cells_bounding_box, cells_structure, page_file, json_file)
+    # Reconstruct tables (all pages of the folio in parallel)
+    from reconstruct_table import reconstruct_folio
+    reconstruct_folio(data_path, workers=workers, wired=True)
 
 
 def transkribus_construct_table(data_path, output_path):
@@ -236,6 +249,9 @@ if __name__ == "__main__":
     parser.add_argument("--exp_name", type=str, required=True, help="Name of the process")
     parser.add_argument("--data_path", type=str, required=True, help="Path to the evaluation dataset")
     parser.add_argument("--output_path", type=str, required=False, help="Path to save outputs")
+    parser.add_argument("--workers", type=int, required=False, help="Number of worker processes for table reconstruction")
+    parser.add_argument("--batch_size", type=int, default=1, help="Table rows per LLM call for information extraction")
+    parser.add_argument("--row_threshold", type=float, default=0.35, help="Minimum row-filter score to send a row to the LLM (0 keeps all)")
     args = parser.parse_args()
 
     exp_name = args.exp_name
@@ -261,7 +277,7 @@ if __name__ == "__main__":
     # =========================
     if exp_name == "ml":
         print("Running ML process...")
-        ml_construct_table(data_path)
+        ml_construct_table(data_path, workers=args.workers)
 
     elif exp_name == "transkribus":
         print("Running Transkribus process...")  
@@ -311,7 +327,7 @@ if __name__ == "__main__":
         # =========================
         # INFORMATION EXTRACTION
         # =========================
-        persons_json = extract_persons_from_html(constructed_html)
+        persons_json = extract_persons_from_html(constructed_html, batch_size=args.batch_size, threshold=args.row_threshold)
         write_json_file(f"{data_path}/json/{IMAGE_NAME}.json", persons_json)
 
         from metrics import best_match_similarity
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from constructPersonBasicInfoKG import folio_of
+from lore_worker import LORE_ARGS
+
+# ============================================================
+# Sharded batch execution
+#
+# The pages of a data directory are split deterministically into N shards
+# (by hash of the image name, or by contiguous page ranges per inventory).
+# Every shard runs one pipeline stage on its own pages, on its own node, and
+# writes a manifest to `data_path`/shards/<stage>/shard_<i>_of_<N>.json.
+# `merge` checks that all shards are complete and combines the manifests,
+# the per-folio N-Quads (KG stage) and the timing metrics.
+#
+# Nodes share `data_path` (as on a cluster file system); per-page outputs
+# never collide because every page belongs to exactly one shard.
+# ============================================================
+
+STAGES = ["tsr", "reconstruct", "ie", "kg"]
+STRATEGIES = ["hash", "range"]
+
+
+def list_pages(data_path="data"):
+    return sorted(f for f in os.listdir(os.path.join(data_path, "images")) if f.endswith(".jpg"))
+
+
+def partition(image_names, num_shards, strategy="hash"):
+    """
+    Split pages into `num_shards` lists.
+
+    hash:  shard = md5(image name) mod N; stable when pages are added or removed.
+    range: all pages, ordered by inventory and name, are cut into N contiguous ranges
+           of equal size (+-1), so shard i gets range i: balanced, and neighbouring
+           pages (and mostly whole inventories) stay together.
+    """
+    shards = [[] for _ in range(num_shards)]
+    if strategy == "hash":
+        for image_name in sorted(image_names):
+            digest = hashlib.md5(image_name.encode("utf-8")).hexdigest()
+            shards[int(digest, 16) % num_shards].append(image_name)
+    elif strategy == "range":
+        pages = sorted(image_names, key=lambda image_name: (folio_of(image_name), image_name))
+        for shard in range(num_shards):
+            shards[shard] = pages[shard * len(pages) // num_shards:(shard + 1) * len(pages) // num_shards]
+    else:
+        raise ValueError(f"Unknown sharding strategy: {strategy}")
+    return shards
+
+
+def shard_dir(stage, data_path="data"):
+    return os.path.join(data_path, "shards", stage)
+
+
+def manifest_path(stage, shard, num_shards, data_path="data"):
+    return os.path.join(shard_dir(stage, data_path), f"shard_{shard}_of_{num_shards}.json")
+
+
+# ============================================================
+# Stages: run(pages, data_path, workers, options) -> page records
+# ({"image", "status", "error", "seconds", "outputs"})
+# ============================================================
+
+def _tsr(pages, data_path, workers, options):
+    from run_scripts import run_LORE_pipeline
+
+    kwargs = {"backend": options.get("tsr_backend", "lore"), "lore_args": options.get("lore_args", LORE_ARGS)}
+    if kwargs["backend"] != "lore":
+        kwargs["command"] = None
+    records = []
+    for result in run_LORE_pipeline(data_path, image_names=pages, **kwargs):
+        ok = result["status"] == "ok"
+        records.append({
+            "image": os.path.basename(result["image"]),
+            "status": result["status"],
+            "error": result.get("error"),
+            "seconds": result["seconds"],
+            "outputs": {"center": result["center"], "logi": result["logi"]} if ok else {},
+        })
+    return records
+
+
+def _reconstruct(pages, data_path, workers, options):
+    from reconstruct_table import reconstruct_page
+
+    for folder in [("htr", "csv"), ("tables", "json"), ("tables", "2D"), ("tables", "html")]:
+        os.makedirs(os.path.join(data_path, *folder), exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(reconstruct_page, pages, [data_path] * len(pages), [True] * len(pages)))
+
+
+def _ie_page(image_name, data_path, batch_size, threshold):
+    from streaming_pipeline import ie_page
+
+    start = time.perf_counter()
+    record = {"image": image_name, "status": "ok", "error": None, "outputs": {}}
+    try:
+        ie_page({"image": image_name}, data_path, batch_size, threshold)
+        record["outputs"]["json"] = os.path.join(data_path, "json", image_name + ".json")
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def _ie(pages, data_path, workers, options):
+    # LLM calls are I/O bound: threads, not processes
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda page: _ie_page(page, data_path, options.get("batch_size", 1),
+                                                       options.get("threshold", 0.35)), pages))
+
+
+def _kg(pages, data_path, workers, options):
+    from constructPersonBasicInfoKG import build_page_kg, kg_page_paths, _init_shacl_worker, PROVENANCE_SHAPES
+
+    triples_dir = os.path.join(data_path, "triples")
+    for folder in [triples_dir, os.path.join(triples_dir, "pages"), os.path.join(triples_dir, "folios")]:
+        os.makedirs(folder, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_shacl_worker, initargs=(PROVENANCE_SHAPES,)) as executor:
+        records = list(executor.map(build_page_kg, pages, [data_path] * len(pages)))
+    for record in records:
+        paths = kg_page_paths(record["image"], data_path)
+        if record["status"] == "ok":
+            record["outputs"] = {key: paths[key] for key in ["assertion", "provenance", "assertion_nq", "provenance_nq"]}
+    return records
+
+
+STAGE_RUNNERS = {"tsr": _tsr, "reconstruct": _reconstruct, "ie": _ie, "kg": _kg}
+
+
+def run_shard(stage, shard, num_shards, data_path="data", strategy="hash", workers=None, **options):
+    """Run `stage` on the pages of shard `shard` (0-based) of `num_shards` and write its manifest."""
+    if not 0 <= shard < num_shards:
+        raise ValueError(f"Shard {shard} out of range for {num_shards} shards")
+    workers = workers or os.cpu_count() or 1
+    pages = partition(list_pages(data_path), num_shards, strategy)[shard]
+    print(f"[{stage}] shard {shard}/{num_shards} ({strategy}): {len(pages)} pages on {socket.gethostname()}")
+
+    start = time.perf_counter()
+    records = STAGE_RUNNERS[stage](pages, data_path, workers, options) if pages else []
+    records.sort(key=lambda r: r["image"])
+    failed = [r["image"] for r in records if r["status"] != "ok"]
+    manifest = {
+        "stage": stage,
+        "shard": shard,
+        "num_shards": num_shards,
+        "strategy": strategy,
+        "host": socket.gethostname(),
+        "workers": workers,
+        "pages": pages,
+        "succeeded": len(records) - len(failed),
+        "failed": failed,
+        "seconds": round(time.perf_counter() - start, 3),
+        "records": records,
+    }
+    path = manifest_path(stage, shard, num_shards, data_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)  # a manifest only exists once its shard is complete
+    print(f"[{stage}] shard {shard}: {manifest['succeeded']}/{len(pages)} pages in {manifest['seconds']}s; "
+          f"manifest saved to {path}")
+    return manifest
+
+
+def merge_shards(stage, num_shards, data_path="data", to_trig=False):
+    """
+    Combine the shard manifests of `stage` into `data_path`/shards/<stage>/manifest.json.
+
+    Fails if a shard is missing, was run with another partitioning, or if the
+    shards together do not cover every page. For the KG stage the per-page
+    N-Quads are concatenated into per-folio datasets (and optionally TriG).
+    """
+    manifests, missing = [], []
+    for shard in range(num_shards):
+        path = manifest_path(stage, shard, num_shards, data_path)
+        if not os.path.exists(path):
+            missing.append(shard)
+            continue
+        with open(path, encoding="utf-8") as f:
+            manifests.append(json.load(f))
+    if missing:
+        raise RuntimeError(f"[{stage}] missing shard manifests: {missing}")
+    strategies = {manifest["strategy"] for manifest in manifests}
+    if len(strategies) != 1:
+        raise RuntimeError(f"[{stage}] shards were run with different strategies: {sorted(strategies)}")
+
+    pages = sorted(page for manifest in manifests for page in manifest["pages"])
+    expected = partition(list_pages(data_path), num_shards, strategies.pop())
+    if pages != sorted(page for shard in expected for page in shard):
+        raise RuntimeError(f"[{stage}] shards do not cover the pages of {data_path}/images; rerun them")
+
+    records = sorted((record for manifest in manifests for record in manifest["records"]), key=lambda r: r["image"])
+    failed = [r["image"] for r in records if r["status"] != "ok"]
+    shard_seconds = [manifest["seconds"] for manifest in manifests]
+    busy = sum(r.get("seconds") or 0 for r in records)
+    merged = {
+        "stage": stage,
+        "num_shards": num_shards,
+        "strategy": manifests[0]["strategy"],
+        "pages": len(records),
+        "succeeded": len(records) - len(failed),
+        "failed": failed,
+        "metrics": {
+            "wall_seconds": max(shard_seconds) if shard_seconds else 0.0,
+            "page_seconds": round(busy, 3),
+            "shard_seconds": shard_seconds,
+            "shard_pages": [len(manifest["pages"]) for manifest in manifests],
+            # Slowest shard over the mean: 1.0 is a perfect split
+            "imbalance": round(max(shard_seconds) / (sum(shard_seconds) / len(shard_seconds)), 3)
+            if shard_seconds and sum(shard_seconds) else 1.0,
+            "hosts": sorted({manifest["host"] for manifest in manifests}),
+        },
+        "outputs": {r["image"]: r.get("outputs", {}) for r in records if r["status"] == "ok"},
+        "records": records,
+    }
+
+    if stage == "kg":
+        from constructPersonBasicInfoKG import merge_folio, nquads_to_trig, new_assertion_dataset, new_provenance_dataset
+
+        folios = {}
+        for record in records:
+            if record["status"] == "ok":
+                folios.setdefault(folio_of(record["image"]), []).append(record["image"])
+        merged["folios"] = {}
+        for folio, folio_pages in folios.items():
+            outputs = merge_folio(folio_pages, data_path)
+            if to_trig:
+                outputs["assertion_trig"] = nquads_to_trig(outputs["assertion"], outputs["assertion"].replace(".nq.gz", ".trig"),
+                                                           new_assertion_dataset())
+                outputs["provenance_trig"] = nquads_to_trig(outputs["provenance"], outputs["provenance"].replace(".nq.gz", ".trig"),
+                                                            new_provenance_dataset())
+            merged["folios"][folio] = {"pages": len(folio_pages), "outputs": outputs}
+
+    path = os.path.join(shard_dir(stage, data_path), "manifest.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2)
+    print(f"[{stage}] merged {num_shards} shards: {merged['succeeded']}/{merged['pages']} pages, "
+          f"wall {merged['metrics']['wall_seconds']}s, imbalance {merged['metrics']['imbalance']}; saved to {path}")
+    return merged
+
+
+def launch_local(stage, num_shards, data_path="data", strategy="hash", workers=None, extra_args=()):
+    """
+    Run all shards of `stage` as local processes (one per shard, standing in for
+    cluster nodes), then merge them. Returns the merged manifest.
+    """
+    workers = workers or max(1, (os.cpu_count() or 1) // num_shards)
+    processes = []
+    for shard in range(num_shards):
+        command = [sys.executable, "-u", os.path.abspath(__file__), "run", "--stage", stage,
+                   "--shard", str(shard), "--num_shards", str(num_shards), "--data_path", data_path,
+                   "--strategy", strategy, "--workers", str(workers)] + list(extra_args)
+        processes.append(subprocess.Popen(command))
+    failed = [shard for shard, process in enumerate(processes) if process.wait() != 0]
+    if failed:
+        raise RuntimeError(f"[{stage}] shards {failed} exited with an error")
+    return merge_shards(stage, num_shards, data_path)
+
+
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["run", "merge", "local"],
+                        help="run: one shard (SLURM array task); merge: combine shards; local: run all shards as processes and merge")
+    parser.add_argument("--stage", choices=STAGES, required=True, help="Pipeline stage")
+    parser.add_argument("--data_path", type=str, default="data", help="Root of the data directory (shared by all shards)")
+    parser.add_argument("--shard", type=int, default=None, help="Shard index (default: $SLURM_ARRAY_TASK_ID)")
+    parser.add_argument("--num_shards", type=int, default=None, help="Number of shards (default: $SLURM_ARRAY_TASK_COUNT)")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="hash", help="Page partitioning")
+    parser.add_argument("--workers", type=int, default=None, help="Workers per shard (default: $SLURM_CPUS_PER_TASK or all cores)")
+    parser.add_argument("--tsr_backend", type=str, default="lore", help="LORE worker backend (lore or stub)")
+    parser.add_argument("--lore_args", type=str, default=LORE_ARGS, help="LORE options, as in scripts/infer/demo_wired.sh")
+    parser.add_argument("--batch_size", type=int, default=1, help="Table rows per LLM call for information extraction")
+    parser.add_argument("--row_threshold", type=float, default=0.35, help="Minimum row-filter score to send a row to the LLM")
+    parser.add_argument("--to_trig", action="store_true", help="On merge of the kg stage, also write folio TriG")
+    args = parser.parse_args()
+
+    shard = args.shard if args.shard is not None else _env_int("SLURM_ARRAY_TASK_ID")
+    num_shards = args.num_shards or _env_int("SLURM_ARRAY_TASK_COUNT")
+    workers = args.workers or _env_int("SLURM_CPUS_PER_TASK")
+    if num_shards is None or (args.command == "run" and shard is None):
+        parser.error("--shard and --num_shards are required outside a SLURM array job")
+
+    if args.command == "run":
+        run_shard(args.stage, shard, num_shards, args.data_path, args.strategy, workers,
+                  tsr_backend=args.tsr_backend, lore_args=args.lore_args,
+                  batch_size=args.batch_size, threshold=args.row_threshold)
+    elif args.command == "merge":
+        merge_shards(args.stage, num_shards, args.data_path, to_trig=args.to_trig)
+    else:
+        launch_local(args.stage, num_shards, args.data_path, args.strategy, workers,
+                     extra_args=["--tsr_backend", args.tsr_backend, "--lore_args", args.lore_args,
+                                 "--batch_size", str(args.batch_size), "--row_threshold", str(args.row_threshold)])
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from lore_worker import LORE_ARGS
+
+# The downloaders use repo-root imports (`src.image_downlaod...`)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ============================================================
+# Streaming pipeline: pages flow one by one through
+#   download -> HTR (LOGHI) -> TSR (LORE) -> reconstruction -> IE -> KG
+# with a bounded queue in front of every stage and a worker pool per stage.
+# A full queue blocks the stage before it (backpressure), so a slow LLM stage
+# throttles the downloads instead of piling up pages on disk.
+# ============================================================
+
+_DONE = object()  # end-of-stream marker, one per worker of the receiving stage
+
+
+class Stage:
+    """
+    One pipeline stage.
+
+    Args:
+        name: Stage name (metrics key).
+        func: func(item) -> item, or func(item, state) with `setup`. Raising drops the page.
+        workers: Number of concurrent workers.
+        queue_size: Capacity of the input queue.
+        processes: Run `func` in a process pool of `workers` processes (CPU-bound stages).
+        setup/teardown: Per-worker state (e.g. a model), created in the worker thread.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=4, processes=False, setup=None, teardown=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processes = processes
+        self.setup = setup
+        self.teardown = teardown
+        self.lock = threading.Lock()
+        self.stats = {"done": 0, "failed": 0, "in_flight": 0, "busy_seconds": 0.0,
+                      "first_done": None, "max_queue": 0, "queue_samples": 0, "queue_sum": 0}
+
+
+class StreamingPipeline:
+    """
+    Run items through a list of stages concurrently.
+
+    Queue depth, in-flight and completed counts of every stage are sampled every
+    `interval` seconds and appended to `metrics_file` (JSON lines) if given.
+    """
+
+    def __init__(self, stages, metrics_file=None, interval=1.0, on_result=None):
+        self.stages = stages
+        self.metrics_file = metrics_file
+        self.interval = interval
+        self.on_result = on_result
+        self.failures = []
+        self.results = []
+        self._start = None
+        self._finished = threading.Event()
+
+    def _elapsed(self):
+        return round(time.perf_counter() - self._start, 3)
+
+    def _worker(self, index, executor, exited):
+        stage = self.stages[index]
+        next_queue = self.stages[index + 1].queue if index + 1 < len(self.stages) else None
+        state, setup_error = None, None
+        try:
+            try:
+                state = stage.setup() if stage.setup else None
+            except Exception as e:
+                # Keep consuming the queue (failing every item) so the stream still ends
+                setup_error = f"setup failed: {type(e).__name__}: {e}"
+                self.failures.append({"stage": stage.name, "item": None, "error": setup_error})
+                print(f"[{stage.name}] {setup_error}")
+            while True:
+                item = stage.queue.get()
+                if item is _DONE:
+                    break
+                with stage.lock:
+                    stage.stats["in_flight"] += 1
+                start = time.perf_counter()
+                try:
+                    if setup_error:
+                        raise RuntimeError(setup_error)
+                    if executor is not None:
+                        result = executor.submit(stage.func, item).result()
+                    elif stage.setup:
+                        result = stage.func(item, state)
+                    else:
+                        result = stage.func(item)
+                    ok = True
+                except Exception as e:
+                    ok = False
+                    self.failures.append({"stage": stage.name, "item": item, "error": f"{type(e).__name__}: {e}"})
+                    print(f"[{stage.name}] failed on {item.get('image', item) if isinstance(item, dict) else item}: {e}")
+                with stage.lock:
+                    stage.stats["in_flight"] -= 1
+                    stage.stats["busy_seconds"] += time.perf_counter() - start
+                    stage.stats["done" if ok else "failed"] += 1
+                    if ok and stage.stats["first_done"] is None:
+                        stage.stats["first_done"] = self._elapsed()
+                if not ok:
+                    continue
+                if next_queue is not None:
+                    next_queue.put(result)  # blocks while the next stage is saturated
+                else:
+                    self.results.append(result)
+                    if self.on_result:
+                        self.on_result(result)
+        finally:
+            if stage.teardown and stage.setup and not setup_error:
+                try:
+                    stage.teardown(state)
+                except Exception as e:
+                    error = f"teardown failed: {type(e).__name__}: {e}"
+                    self.failures.append({"stage": stage.name, "item": None, "error": error})
+                    print(f"[{stage.name}] {error}")
+            # The last worker of a stage closes the stream for the next one
+            with stage.lock:
+                exited[index] += 1
+                last = exited[index] == stage.workers
+            if last and next_queue is not None:
+                for _ in range(self.stages[index + 1].workers):
+                    next_queue.put(_DONE)
+
+    def snapshot(self):
+        record = {"t": self._elapsed(), "stages": {}}
+        for stage in self.stages:
+            depth = stage.queue.qsize()
+            with stage.lock:
+                stage.stats["max_queue"] = max(stage.stats["max_queue"], depth)
+                stage.stats["queue_samples"] += 1
+                stage.stats["queue_sum"] += depth
+                record["stages"][stage.name] = {
+                    "queue": depth,
+                    "capacity": stage.queue.maxsize,
+                    "in_flight": stage.stats["in_flight"],
+                    "done": stage.stats["done"],
+                    "failed": stage.stats["failed"],
+                }
+        return record
+
+    def _monitor(self):
+        metrics = open(self.metrics_file, "a", encoding="utf-8") if self.metrics_file else None
+        try:
+            while not self._finished.wait(self.interval):
+                record = self.snapshot()
+                if metrics:
+                    metrics.write(json.dumps(record) + "\n")
+                    metrics.flush()
+            if metrics:
+                metrics.write(json.dumps(self.snapshot()) + "\n")
+        finally:
+            if metrics:
+                metrics.close()
+
+    def run(self, source):
+        """Feed `source` (an iterable of items) through all stages and return the summary."""
+        self._start = time.perf_counter()
+        executors = [ProcessPoolExecutor(max_workers=stage.workers) if stage.processes else None
+                     for stage in self.stages]
+        exited = [0] * len(self.stages)
+        threads = [
+            threading.Thread(target=self._worker, args=(index, executors[index], exited),
+                             name=f"{stage.name}-{n}", daemon=True)
+            for index, stage in enumerate(self.stages) for n in range(stage.workers)
+        ]
+        monitor = threading.Thread(target=self._monitor, name="monitor", daemon=True)
+        for thread in threads:
+            thread.start()
+        monitor.start()
+
+        try:
+            fed = 0
+            for item in source:
+                self.stages[0].queue.put(item)  # backpressure all the way to the source
+                fed += 1
+            for _ in range(self.stages[0].workers):
+                self.stages[0].queue.put(_DONE)
+            for thread in threads:
+                thread.join()
+        finally:
+            self._finished.set()
+            monitor.join()
+            for executor in executors:
+                if executor is not None:
+                    executor.shutdown()
+
+        return self.summary(fed)
+
+    def summary(self, fed):
+        elapsed = self._elapsed()
+        stages = {}
+        for stage in self.stages:
+            stats = stage.stats
+            stages[stage.name] = {
+                "workers": stage.workers,
+                "done": stats["done"],
+                "failed": stats["failed"],
+                "first_done_seconds": stats["first_done"],
+                "busy_seconds": round(stats["busy_seconds"], 3),
+                "utilisation": round(stats["busy_seconds"] / (stage.workers * elapsed), 3) if elapsed else 0.0,
+                "max_queue": stats["max_queue"],
+                "mean_queue": round(stats["queue_sum"] / stats["queue_samples"], 2) if stats["queue_samples"] else 0.0,
+            }
+        return {
+            "items": fed,
+            "completed": len(self.results),
+            "seconds": elapsed,
+            "first_result_seconds": stages[self.stages[-1].name]["first_done_seconds"],
+            "stages": stages,
+            "failures": self.failures,
+        }
+
+
+# ============================================================
+# Page stages (items are dicts with at least "image")
+# ============================================================
+
+def download_page(item, data_path="data"):
+    from src.image_downlaod.download_stamboeken import process_archive_link
+    from src.image_downlaod.download_control_book import download_image
+
+    output_dir = os.path.join(data_path, "images")
+    if not os.path.exists(os.path.join(output_dir, item["image"])):
+        download_url = process_archive_link(item["link"], item["image"])
+        if not download_url:
+            raise RuntimeError("no download URL")
+        download_image(download_url, item["image"], output_dir)
+    if not os.path.exists(os.path.join(output_dir, item["image"])):
+        raise RuntimeError("download failed")
+    return item
+
+
+def htr_page(item, data_path="data", loghi_dir="loghi"):
+    """LOGHI on one page. LOGHI works on the whole `data_path`/htr folder, so run this stage with one worker."""
+    from helpers import copy_file, delete_file
+    from run_loghi import run_bash_script
+
+    htr_dir = os.path.join(data_path, "htr")
+    copy_file(item["image"], os.path.join(data_path, "images"), htr_dir)
+    try:
+        run_bash_script(loghi_dir, htr_dir)
+    finally:
+        delete_file(item["image"], htr_dir)
+    page_file = os.path.join(htr_dir, "page", os.path.splitext(item["image"])[0] + ".xml")
+    if not os.path.exists(page_file):
+        raise RuntimeError(f"LOGHI wrote no {page_file}")
+    return item
+
+
+def lore_setup(data_path="data", backend="lore", command=None, lore_args=LORE_ARGS):
+    from lore_worker import LoreWorker, LORE_SRC
+    from run_scripts import LORE_ENV_COMMAND
+
+    backend_args = ["--lore_src", os.path.abspath(LORE_SRC), "--lore_args", lore_args] if backend == "lore" else []
+    return LoreWorker(backend, os.path.join(data_path, "tables", "cells"),
+                      command=command or (LORE_ENV_COMMAND if backend == "lore" else None),
+                      backend_args=backend_args, cwd=LORE_SRC if backend == "lore" else None)
+
+
+def tsr_page(item, worker, data_path="data"):
+    for result in worker.process_images([os.path.join(data_path, "images", item["image"])]):
+        if result["status"] != "ok":
+            raise RuntimeError(result["error"])
+    return item
+
+
+def reconstruct_stage_page(item, data_path="data"):
+    from reconstruct_table import reconstruct_page
+
+    record = reconstruct_page(item["image"], data_path, True)
+    if record["status"] != "ok":
+        raise RuntimeError(record["error"])
+    return item
+
+
+def ie_page(item, data_path="data", batch_size=1, threshold=0.35):
+    from run_scripts import extract_persons_from_html
+
+    with open(os.path.join(data_path, "tables", "html", item["image"] + ".html"), encoding="utf-8") as f:
+        persons = extract_persons_from_html(f.read(), batch_size=batch_size, threshold=threshold)
+    os.makedirs(os.path.join(data_path, "json"), exist_ok=True)
+    with open(os.path.join(data_path, "json", item["image"] + ".json"), "w", encoding="utf-8") as f:
+        json.dump(persons, f, indent=2, ensure_ascii=False)
+    return item
+
+
+def kg_page(item, data_path="data"):
+    from constructPersonBasicInfoKG import build_page_kg
+
+    record = build_page_kg(item["image"], data_path)
+    if record["status"] != "ok":
+        raise RuntimeError(record["error"])
+    return item
+
+
+def _bind(func, **kwargs):
+    # Module-level callable with fixed keyword arguments (picklable for process stages)
+    from functools import partial
+    return partial(func, **kwargs)
+
+
+def page_stages(data_path="data", download=True, ie_workers=8, kg_workers=2, reconstruct_workers=2,
+                tsr_backend="lore", lore_args=LORE_ARGS, queue_size=4, batch_size=1, threshold=0.35):
+    """The stages of the ML table pipeline for one folio."""
+    for folder in [("images",), ("htr",), ("htr", "csv"), ("tables", "json"), ("tables", "2D"), ("tables", "html"),
+                   ("json",), ("triples",), ("triples", "pages"), ("triples", "folios")]:
+        os.makedirs(os.path.join(data_path, *folder), exist_ok=True)
+
+    stages = []
+    if download:
+        stages.append(Stage("download", _bind(download_page, data_path=data_path), workers=4, queue_size=queue_size))
+    stages += [
+        Stage("htr", _bind(htr_page, data_path=data_path), workers=1, queue_size=queue_size),
+        Stage("tsr", _bind(tsr_page, data_path=data_path), workers=1, queue_size=queue_size,
+              setup=_bind(lore_setup, data_path=data_path, backend=tsr_backend, lore_args=lore_args),
+              teardown=lambda worker: worker.close()),
+        Stage("reconstruct", _bind(reconstruct_stage_page, data_path=data_path), workers=reconstruct_workers,
+              queue_size=queue_size, processes=True),
+        Stage("ie", _bind(ie_page, data_path=data_path, batch_size=batch_size, threshold=threshold),
+              workers=ie_workers, queue_size=queue_size),
+        Stage("kg", _bind(kg_page, data_path=data_path), workers=kg_workers, queue_size=queue_size, processes=True),
+    ]
+    return stages
+
+
+def run_folio_stream(folio_no=None, data_path="data", graph_path=None, metrics_file=None, **stage_options):
+    """
+    Stream the pages of a folio through the pipeline.
+
+    With `folio_no` the scans are downloaded from the archive links in the folio
+    graph (`folio_<n>_graph.ttl`); otherwise the images already in
+    `data_path`/images are processed. The KG of every finished page is written
+    as soon as it is ready; the per-folio N-Quads are merged at the end.
+    """
+    from constructPersonBasicInfoKG import merge_folio, folio_of
+
+    if folio_no is not None:
+        from src.image_downlaod.download_stamboeken import folio_archive_links
+        source = ({"image": image, "link": link} for image, link in
+                  folio_archive_links(folio_no, graph_path or f"folio_{folio_no}_graph.ttl"))
+    else:
+        source = ({"image": image} for image in sorted(os.listdir(os.path.join(data_path, "images")))
+                  if image.endswith(".jpg"))
+
+    if metrics_file is None:
+        metrics_file = os.path.join(data_path, "pipeline_metrics.jsonl")
+    pipeline = StreamingPipeline(
+        page_stages(data_path, download=folio_no is not None, **stage_options),
+        metrics_file=metrics_file,
+        on_result=lambda item: print(f"[{pipeline._elapsed()}s] KG ready for {item['image']}"),
+    )
+    summary = pipeline.run(source)
+
+    folios = {}
+    for item in pipeline.results:
+        folios.setdefault(folio_of(item["image"]), []).append(item["image"])
+    summary["folios"] = {folio: merge_folio(images, data_path) for folio, images in folios.items()}
+
+    with open(os.path.join(data_path, "pipeline_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, default=str)
+    print(f"Streamed {summary['completed']}/{summary['items']} pages in {summary['seconds']}s "
+          f"(first KG after {summary['first_result_seconds']}s)")
+    for name, stats in summary["stages"].items():
+        print(f"  {name:12s} done={stats['done']} failed={stats['failed']} utilisation={stats['utilisation']:.2f} "
+              f"max_queue={stats['max_queue']} mean_queue={stats['mean_queue']}")
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--folio", type=int, default=None, help="Download and process this folio (inventory number)")
+    parser.add_argument("--data_path", type=str, default="data", help="Root of the data directory")
+    parser.add_argument("--graph_path", type=str, default=None, help="Folio graph (default: folio_<n>_graph.ttl)")
+    parser.add_argument("--metrics", type=str, default=None, help="Queue-depth metrics file (JSON lines)")
+    parser.add_argument("--queue_size", type=int, default=4, help="Capacity of every stage queue")
+    parser.add_argument("--ie_workers", type=int, default=8, help="Concurrent LLM extraction workers")
+    parser.add_argument("--kg_workers", type=int, default=2, help="KG worker processes")
+    parser.add_argument("--reconstruct_workers", type=int, default=2, help="Table reconstruction worker processes")
+    parser.add_argument("--tsr_backend", type=str, default="lore", help="LORE worker backend (lore or stub)")
+    parser.add_argument("--lore_args", type=str, default=LORE_ARGS, help="LORE options, as in scripts/infer/demo_wired.sh")
+    parser.add_argument("--batch_size", type=int, default=1, help="Table rows per LLM call for information extraction")
+    parser.add_argument("--row_threshold", type=float, default=0.35, help="Minimum row-filter score to send a row to the LLM")
+    args = parser.parse_args()
+
+    run_folio_stream(
+        args.folio, args.data_path, args.graph_path, args.metrics,
+        queue_size=args.queue_size, ie_workers=args.ie_workers, kg_workers=args.kg_workers,
+        reconstruct_workers=args.reconstruct_workers, tsr_backend=args.tsr_backend, lore_args=args.lore_args,
+        batch_size=args.batch_size, threshold=args.row_threshold,
+    )
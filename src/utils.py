@@ -1,11 +1,33 @@
 from shapely.geometry import Polygon
 from lxml import etree
+import re
 import json
 import csv
 import os
-import xml.etree.ElementTree as ET
+import tempfile
 from bs4 import BeautifulSoup
 
+def to_polygon(coords):
+    """Build a valid shapely Polygon from a coordinates string, or None if it cannot be built."""
+    try:
+        polygon = Polygon(parse_polygon_string(coords))
+    except Exception as e:
+        print(f"Error parsing polygon string: {e}")
+        return None
+    if not polygon.is_valid:
+        print("Error: Polygon is invalid.")
+        return None
+    return polygon
+
+
+def polygon_covered(polygon1, polygon2, threshold=0.5) -> bool:
+    """Check if shapely polygon 1 is at least `threshold` inside shapely polygon 2."""
+    area_1 = polygon1.area
+    if area_1 <= 0:
+        return 0 >= threshold
+    return polygon1.intersection(polygon2).area / area_1 >= threshold
+
+
 def check_polygone_overlap(poly1:str, poly2:str, threshold=0.5) -> bool:
     """
     Check if polygon 1 is at least `threshold` inside polygon 2.
@@ -18,22 +40,11 @@ def check_polygone_overlap(poly1:str, poly2:str, threshold=0.5) -> bool:
     Returns:
         True if A is at least `threshold` inside B, else False
     """
-    try:
-        polygon1 = Polygon(parse_polygon_string(poly1))
-        polygon2 = Polygon(parse_polygon_string(poly2))
-    except Exception as e:
-        print(f"Error parsing polygon string: {e}")
-        return False
-
-    if not polygon1.is_valid or not polygon2.is_valid:
-        print("Error: One of the polygons is invalid.")
+    polygon1 = to_polygon(poly1)
+    polygon2 = to_polygon(poly2)
+    if polygon1 is None or polygon2 is None:
         return False
-    
-    intersection_area = polygon1.intersection(polygon2).area
-    area_1 = polygon1.area
-
-    coverage = intersection_area / area_1 if area_1 > 0 else 0
-    return coverage >= threshold
+    return polygon_covered(polygon1, polygon2, threshold)
 
 
 def compute_iou(poly1:str, poly2:str):
@@ -85,44 +96,234 @@ def parse_polygon_string(polygon_str):
             continue
     return coords
 
-def extract_textline(file_path, output_path):
+# ============================================================
+# Shared cell / text-line records
+# ============================================================
+
+PAGE_NS = "http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15"
+NS = {"pc": PAGE_NS}
+
+
+def parse_points(points_str):
+    """Parse a "x1,y1 x2,y2 ..." (or ';'-separated) string into a list of (x, y) floats, skipping bad pairs."""
+    if not points_str:
+        return []
+    coords = []
+    for pair in points_str.replace(";", " ").split():
+        x_str, sep, y_str = pair.partition(",")
+        if not sep:
+            continue
+        try:
+            coords.append((float(x_str), float(y_str)))
+        except ValueError:
+            continue
+    return coords
+
+
+def parse_reading_order(custom):
+    """Return the `readingOrder {index:N;}` index of a PageXML `custom` attribute, or 9999 if absent."""
+    if not custom or "index:" not in custom:
+        return 9999
     try:
-        # Load the XML content (from a file)
-        root = etree.parse(file_path)
-
-        # XPath query to get TextRegion id, TextLine id, and TextEquiv text without nested Word tags
-        result = root.xpath(
-            '//ns:TextRegion/ns:TextLine[ns:TextEquiv[not(ancestor::ns:Word)]]',
-            namespaces={'ns': 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15'}
-        )
-
-        if result is None:
-            # Log file name if no TextEquiv tag is found
-            with open(os.path.join(output_path, "image_htr_error.txt"), "a+") as error_log:
-                error_log.write(f"{file_path}\n")
-            print(f"No TextEquiv tag found in {file_path}. Logged in image_htr_error.txt.")
-            return
-
-        output_file = os.path.join(output_path, (os.path.basename(file_path) + ".csv"))
-        with open(output_file, "w+") as f:
-            csvwriter = csv.writer(f)
-            # Write header row
-            csvwriter.writerow(["TextRegion ID", "TextLine ID", "TextRegion Coords", "TextEquiv Text"])
-
-            # Extract and print the required information
-            for line in result:
-                text_region_id = line.getparent().get("id")
-                text_line_id = line.get("id")
-                text_line_coords = line.find("ns:Coords", namespaces={
-                    'ns': 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15'}).get("points")
-                text_equiv_text = line.find("ns:TextEquiv/ns:PlainText", namespaces={
-                    'ns': 'http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15'}).text
-                csvwriter.writerow([text_region_id, text_line_id, text_line_coords, text_equiv_text])
-            
-            return output_file
+        return int(custom.split("index:")[1].split(";")[0])
+    except ValueError:
+        return 9999
+
+
+class TextLine:
+    """A PageXML text line: id, parent region (TextRegion or TableCell) id, polygon, baseline and text."""
+    __slots__ = ("id", "region", "coords", "baseline", "text", "order")
+
+    def __init__(self, id, region, coords, baseline=None, text=None, order=9999):
+        self.id = id
+        self.region = region
+        self.coords = coords
+        self.baseline = baseline
+        self.text = text
+        self.order = order
+
+    @property
+    def points(self):
+        return parse_points(self.coords)
+
+    def to_record(self):
+        """Dict with the column names of the text-line CSV."""
+        return {
+            "TextRegion ID": self.region,
+            "TextLine ID": self.id,
+            "TextEquiv Text": self.text,
+            "TextRegion Coords": self.coords,
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(record.get("TextLine ID"), record.get("TextRegion ID"),
+                   record.get("TextRegion Coords"), text=record.get("TextEquiv Text"))
+
+    def __repr__(self):
+        return f"TextLine(id={self.id!r}, region={self.region!r}, text={self.text!r})"
+
+
+class Cell:
+    """A table cell: id, top-left row/col, spans, polygon, its text lines and any cell-level text."""
+    __slots__ = ("id", "row", "col", "row_span", "col_span", "coords", "lines", "text")
+
+    def __init__(self, id, row, col, row_span=1, col_span=1, coords=None, lines=None, text=None):
+        self.id = id
+        self.row = row
+        self.col = col
+        self.row_span = row_span
+        self.col_span = col_span
+        self.coords = coords
+        self.lines = lines if lines is not None else []
+        self.text = text
+
+    @property
+    def end_row(self):
+        return self.row + self.row_span - 1
+
+    @property
+    def end_col(self):
+        return self.col + self.col_span - 1
+
+    @property
+    def points(self):
+        return parse_points(self.coords)
+
+    @property
+    def content(self):
+        """Cell text as HTML, one text line per `<br/>`."""
+        return "".join(str(line.text) + "<br/>" for line in self.lines if line.text is not None)
+
+    def to_polygon_dict(self):
+        """Polygon record as used by the webapp and `data/labels/polygons`."""
+        return {"id": self.id, "row": str(self.row), "col": str(self.col),
+                "points": [[x, y] for x, y in self.points]}
+
+    def __repr__(self):
+        return (f"Cell(id={self.id!r}, row={self.row}, col={self.col}, "
+                f"row_span={self.row_span}, col_span={self.col_span})")
+
+
+# Loghi writes both PlainText and Unicode (which normalises e.g. ",," to "„");
+# the HTR text-line CSV has always used PlainText, the table HTML Unicode.
+HTR_TEXT_TAGS = ("pc:PlainText", "pc:Unicode")
+TABLE_TEXT_TAGS = ("pc:Unicode", "pc:PlainText")
+
+
+def _textequiv_text(element, text_tags):
+    """Text of the element's own TextEquiv, trying `text_tags` in order."""
+    text_equiv = element.find("pc:TextEquiv", namespaces=NS)
+    if text_equiv is None:
+        return None
+    for tag in text_tags:
+        text_el = text_equiv.find(tag, namespaces=NS)
+        if text_el is not None and text_el.text is not None:
+            return text_el.text
+    return None
+
+
+def _textline_from_element(line, text_tags):
+    coords_el = line.find("pc:Coords", namespaces=NS)
+    baseline_el = line.find("pc:Baseline", namespaces=NS)
+    return TextLine(
+        id=line.get("id"),
+        region=line.getparent().get("id"),
+        coords=coords_el.get("points") if coords_el is not None else None,
+        baseline=baseline_el.get("points") if baseline_el is not None else None,
+        text=_textequiv_text(line, text_tags),
+        order=parse_reading_order(line.get("custom")),
+    )
+
+
+def load_textlines(page_file, text_tags=HTR_TEXT_TAGS):
+    """Load the region-level text lines (with a line-level TextEquiv) of a PageXML file."""
+    root = etree.parse(page_file)
+    lines = root.xpath('//pc:TextRegion/pc:TextLine[pc:TextEquiv[not(ancestor::pc:Word)]]', namespaces=NS)
+    return [_textline_from_element(line, text_tags) for line in lines]
+
+
+def load_table_cells(page_file, text_tags=TABLE_TEXT_TAGS, all_regions=True):
+    """
+    Load all TableCells of a PageXML file together with their text lines
+    (with `all_regions=False` only those of the first TableRegion).
 
+    The file is streamed with `iterparse`; each TableCell subtree is freed as soon
+    as it has been converted, so memory stays flat for large pages.
+    """
+    cells = []
+    first_region = None
+    for _, cell in etree.iterparse(page_file, events=("end",), tag=f"{{{PAGE_NS}}}TableCell"):
+        region = cell.getparent()
+        if first_region is None:
+            first_region = region
+        if not all_regions and region is not first_region:
+            break
+        coords_el = cell.find("pc:Coords", namespaces=NS)
+        cells.append(Cell(
+            id=cell.get("id", ""),
+            row=int(cell.get("row", 0)),
+            col=int(cell.get("col", 0)),
+            row_span=int(cell.get("rowSpan", 1)),
+            col_span=int(cell.get("colSpan", 1)),
+            coords=coords_el.get("points") if coords_el is not None else None,
+            lines=[_textline_from_element(line, text_tags) for line in cell.iterfind("pc:TextLine", namespaces=NS)],
+            text=[el.text for el in cell.iterfind("pc:TextEquiv/pc:Unicode", namespaces=NS) if el.text] or None,
+        ))
+        cell.clear()
+        while cell.getprevious() is not None:
+            del cell.getparent()[0]
+    return cells
+
+
+def load_lore_cells(cells_file, structure_file, wired=False):
+    """
+    Load LORE-TSR output: one polygon per line in `cells_file` (center) and one
+    "start_row,end_row,start_col,end_col" line in `structure_file` (logi). With
+    `wired=True` the structure is in "start_col,end_col,start_row,end_row" order.
+    Cell ids are the line indices.
+    """
+    with open(cells_file, 'r') as f:
+        polygons = [line.strip() for line in f]
+    cells = []
+    with open(structure_file, 'r') as f:
+        for idx, line in enumerate(f):
+            if not line.strip():
+                continue
+            if wired:
+                start_col, end_col, start_row, end_row = map(int, line.split(","))
+            else:
+                start_row, end_row, start_col, end_col = map(int, line.split(","))
+            cells.append(Cell(
+                id=idx,
+                row=start_row,
+                col=start_col,
+                row_span=1 + end_row - start_row,
+                col_span=1 + end_col - start_col,
+                coords=polygons[idx] if idx < len(polygons) else None,
+            ))
+    return cells
+
+
+def write_textlines_csv(textlines, output_file):
+    """Write text lines to the text-line CSV ("TextRegion ID", "TextLine ID", "TextRegion Coords", "TextEquiv Text")."""
+    with open(output_file, "w+") as f:
+        csvwriter = csv.writer(f)
+        csvwriter.writerow(["TextRegion ID", "TextLine ID", "TextRegion Coords", "TextEquiv Text"])
+        for line in textlines:
+            csvwriter.writerow([line.region, line.id, line.coords, line.text])
+    return output_file
+
+
+def extract_textline(file_path, output_path):
+    try:
+        textlines = load_textlines(file_path)
     except etree.XMLSyntaxError:
         print(f"Error parsing {file_path}. File may be malformed.")
+        return
+
+    output_file = os.path.join(output_path, (os.path.basename(file_path) + ".csv"))
+    return write_textlines_csv(textlines, output_file)
 
 
 def swap_row_col(file_path):
@@ -145,88 +346,163 @@ def swap_row_col(file_path):
         print(f"Swapped data written to {output_file}")
 
 
-def pagexml_to_html(pagexml_file, output_file):
-    # Register the PAGE namespace
-    ns = {"pc": "http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15"}
+def _html_text(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
-    # Parse the XML
-    tree = ET.parse(pagexml_file)
-    root = tree.getroot()
 
-    # Find the TableRegion
-    table_region = root.find(".//pc:TableRegion", ns)
+def _td_attributes(cell):
+    # Same (alphabetical, double-quoted) attribute order that BeautifulSoup.prettify() produced
+    return (f'col="{cell.col}" colspan="{cell.col_span}" id="{_html_text(str(cell.id))}" '
+            f'row="{cell.row}" rowspan="{cell.row_span}"')
+
+
+def cell_lines(cell):
+    """Stripped text of a cell, one entry per text line in reading order (cell-level TextEquiv as fallback)."""
+    lines = [line.text.strip() for line in sorted(cell.lines, key=lambda line: line.order) if line.text]
+    if not lines and cell.text:
+        lines = [text.strip() for text in cell.text]
+    return lines
+
+
+def table_rows(cells):
+    """
+    Group cells by dense row index: rows[r] holds the cells starting in row r,
+    sorted by column. Also returns {id(cell): cell_lines(cell)}.
+    """
+    max_row = max(cell.row for cell in cells)
+    rows = [[] for _ in range(max_row + 1)]
+    lines = {}
+    for cell in cells:
+        rows[cell.row].append(cell)
+        lines[id(cell)] = cell_lines(cell)
+    for row in rows:
+        row.sort(key=lambda cell: cell.col)
+    return rows, lines
+
+
+def row_html(row, lines, pretty=True):
+    """HTML lines of one `<tr>` as written by `pagexml_to_html`."""
+    if not pretty:
+        return ["<tr>"] + [
+            f"<td {_td_attributes(cell)}>{'<br/>'.join(_html_text(line) for line in lines[id(cell)])}</td>"
+            for cell in row
+        ] + ["</tr>"]
+    out = [" <tr>"]
+    for cell in row:
+        out.append(f"  <td {_td_attributes(cell)}>")
+        for i, line in enumerate(lines[id(cell)]):
+            if i:
+                out.append("   <br/>")
+            out.append(f"   {_html_text(line)}")
+        out.append("  </td>")
+    out.append(" </tr>")
+    return out
+
+
+TR_BLOCK = re.compile(r"<tr>.*?</tr>", re.DOTALL)
+
+
+def patch_html_rows(output_file, cells, row_indices, pretty=True):
+    """
+    Re-render only the given rows of an HTML table written by `pagexml_to_html`.
+
+    Returns False (file left untouched) when the file does not have one `<tr>` per
+    row of `cells`; the caller should then regenerate the whole table.
+    """
+    rows, lines = table_rows(cells)
+    with open(output_file, encoding="utf-8") as f:
+        html = f.read()
+    blocks = list(TR_BLOCK.finditer(html))
+    if len(blocks) != len(rows):
+        return False
+
+    out, last = [], 0
+    for index in sorted(set(row_indices)):
+        if not 0 <= index < len(rows):
+            continue
+        block = blocks[index]
+        out.append(html[last:block.start()])
+        out.append(("\n" if pretty else "").join(row_html(rows[index], lines, pretty)).strip())
+        last = block.end()
+    out.append(html[last:])
+    atomic_write_bytes(output_file, "".join(out).encode("utf-8"))
+    return True
+
+
+def pagexml_to_html(pagexml_file, output_file, pretty=True, force=False, all_regions=False):
+    """
+    Convert the (first) TableRegion of a PageXML file into an HTML table.
+
+    Args:
+        pagexml_file: PageXML file with TableCells (and TextLines inside the cells).
+        output_file: HTML file to write.
+        pretty: Write indented HTML (one tag/line per row, as `prettify()` did) or a compact single line.
+        force: Regenerate even if `output_file` is newer than `pagexml_file`.
+        all_regions: Merge the cells of every TableRegion into one table instead of
+            using the first TableRegion only.
+
+    Returns:
+        The (unindented) HTML string, or None when the output was up to date and not regenerated.
+    """
+    if (not force and os.path.exists(output_file)
+            and os.path.getmtime(output_file) >= os.path.getmtime(pagexml_file)):
+        return None
+
+    cells = load_table_cells(pagexml_file, all_regions=all_regions)
+    rows, lines = table_rows(cells)
 
-    # Collect all cells
-    cells = []
-    for cell in table_region.findall("pc:TableCell", ns):
-        row = int(cell.attrib.get("row", 0))
-        col = int(cell.attrib.get("col", 0))
-        colspan = int(cell.attrib.get("colSpan", 1))   # default = 1
-        rowspan = int(cell.attrib.get("rowSpan", 1))   # default = 1
-        cell_id = cell.attrib.get("id", "")
-
-        # Collect text lines (respect reading order)
-        lines = []
-        for tl in sorted(cell.findall("pc:TextLine", ns), key=lambda x: int(x.attrib["custom"].split("index:")[1].split(";")[0]) if "custom" in x.attrib else 9999):
-            unicode_el = tl.find(".//pc:Unicode", ns)
-            if unicode_el is not None and unicode_el.text:
-                lines.append(unicode_el.text.strip())
-
-        # Fallback for cell-level TextEquiv (if no lines)
-        if not lines:
-            for unicode_el in cell.findall("pc:TextEquiv/pc:Unicode", ns):
-                if unicode_el.text:
-                    lines.append(unicode_el.text.strip())
-
-        cell_text = "<br/>".join(lines)
-
-        cells.append({
-            "row": row,
-            "col": col,
-            "colspan": colspan,
-            "rowspan": rowspan,
-            "id": cell_id,
-            "text": cell_text
-        })
-
-    # Build HTML table
-    max_row = max(c["row"] for c in cells)
-    max_col = max(c["col"] for c in cells)
-
-    # Group by row
-    rows = {}
-    for c in cells:
-        rows.setdefault(c["row"], []).append(c)
-
-    # Sort each row by column
-    for r in rows:
-        rows[r] = sorted(rows[r], key=lambda x: x["col"])
-
-    # Construct HTML string
     html = ["<table border='1'>"]
-    for r in range(max_row + 1):
+    for row in rows:
         html.append("  <tr>")
-        for c in rows.get(r, []):
+        for cell in row:
             html.append(
-                f"    <td id='{c['id']}' "
-                f"row='{c['row']}' col='{c['col']}' "
-                f"colspan='{c['colspan']}' rowspan='{c['rowspan']}'>"
-                f"{c['text']}</td>"
+                f"    <td id='{cell.id}' "
+                f"row='{cell.row}' col='{cell.col}' "
+                f"colspan='{cell.col_span}' rowspan='{cell.row_span}'>"
+                f"{'<br/>'.join(lines[id(cell)])}</td>"
             )
         html.append("  </tr>")
     html.append("</table>")
-
     html_str = "\n".join(html)
 
-    table = BeautifulSoup(html_str, "html.parser")
+    out = ['<table border="1">']
+    for row in rows:
+        out.extend(row_html(row, lines, pretty))
+    out.append("</table>")
+    if pretty:
+        out.append("")
 
     # Save to file
     with open(output_file, "w", encoding="utf-8") as f:
-        f.write(table.prettify())
+        f.write(("\n" if pretty else "").join(out))
 
     return html_str
 
 
+def pagexml_dir_to_html(pagexml_dir, output_dir, pretty=True, force=False):
+    """
+    Convert every `<image>.xml` PageXML file in `pagexml_dir` to `<image>.html` in `output_dir`.
+    Pages whose HTML is newer than their PageXML are skipped unless `force` is set.
+
+    Returns:
+        (converted, skipped) lists of output files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    converted, skipped = [], []
+    for filename in sorted(os.listdir(pagexml_dir)):
+        if not filename.endswith(".xml"):
+            continue
+        output_file = os.path.join(output_dir, filename[:-len(".xml")] + ".html")
+        try:
+            html_str = pagexml_to_html(os.path.join(pagexml_dir, filename), output_file, pretty=pretty, force=force)
+        except (etree.XMLSyntaxError, ValueError) as e:
+            print(f"Error converting {filename}: {e}")
+            continue
+        (converted if html_str is not None else skipped).append(output_file)
+    print(f"Converted {len(converted)} PageXML files to HTML, {len(skipped)} up to date.")
+    return converted, skipped
+
+
 def extract_HTML(text):
     # ```html
     # ```
@@ -263,39 +539,100 @@ def parse_polygon_from_pagexml(file_path):
     """
     Returns list of polygons: [{"id": "t1c1", "points": [[x1,y1],[x2,y2],...]]}
     """
-    ns = {"pc": "http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15"}
-    tree = etree.parse(file_path)
-    root = tree.getroot()
     polygons = []
-    for cell in root.xpath("//pc:TableCell", namespaces=ns):
-        cell_id = cell.get("id")
-        cell_row = cell.get("row")
-        cell_col = cell.get("col")
-        coords_el = cell.find(".//pc:Coords", namespaces=ns)
-        if coords_el is None:
-            continue
-        points_str = coords_el.get("points")  # e.g. "652,320 652,590 1312,590 1311,320"
-        # Split into x,y pairs
-        pts = []
-        for pair in points_str.strip().split():
-            if ',' in pair:
-                x_str, y_str = pair.split(',', 1)
-                try:
-                    x = float(x_str)
-                    y = float(y_str)
-                    pts.append([x, y])
-                except ValueError:
-                    continue
-        if pts:
-            polygons.append({"id": cell_id, "row":cell_row, "col":cell_col, "points": pts})
+    for cell in load_table_cells(file_path):
+        polygon = cell.to_polygon_dict()
+        if polygon["points"]:
+            polygons.append(polygon)
     return polygons
 
+def points_to_str(points):
+    """[[x, y], ...] -> PageXML "x,y x,y ..." points string."""
+    return " ".join(f"{x},{y}" for x, y in points)
+
+# Process umask, read once at import (os.umask can only be read by setting it, which is not thread-safe)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write_bytes(output_file, data):
+    """
+    Write via a temporary file in the same directory + os.replace, so readers never see a partial file.
+
+    The file keeps the permissions of the file it replaces (new files get the
+    usual 0666 & ~umask, not the 0600 of the temporary file).
+    """
+    directory = os.path.dirname(os.path.abspath(output_file))
+    try:
+        mode = os.stat(output_file).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(output_file))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def patch_table_cells(pagexml_file, modified=None, deleted=None):
+    """
+    Patch TableCell polygons of a PageXML file in place (atomic write).
+
+    Args:
+        modified: {cell_id: [[x, y], ...]} new Coords of changed cells.
+        deleted: Ids of TableCells to remove.
+
+    Returns:
+        One change record per requested cell:
+        {"cell_id", "action": "modified"|"deleted"|"missing", "old_points", "points"}.
+        A deleted cell's TextLines are detached, not dropped: its record also holds
+        them (serialized) under "lines", to be re-matched to the remaining cells
+        (see `incremental_update.rematch_lines`).
+    """
+    modified = modified or {}
+    deleted = set(deleted or [])
+    tree = etree.parse(pagexml_file)
+    cells = {cell.get("id"): cell for cell in tree.iter(f"{{{PAGE_NS}}}TableCell")}
+
+    changes = []
+    for cell_id, points in modified.items():
+        cell = cells.get(cell_id)
+        if cell is None or cell_id in deleted:
+            if cell is None:
+                changes.append({"cell_id": cell_id, "action": "missing", "old_points": None, "points": points})
+            continue
+        coords = cell.find("pc:Coords", NS)
+        if coords is None:
+            coords = etree.Element(f"{{{PAGE_NS}}}Coords")
+            cell.insert(0, coords)
+        old_points = coords.get("points")
+        coords.set("points", points_to_str(points))
+        changes.append({"cell_id": cell_id, "action": "modified", "old_points": old_points, "points": points})
+
+    for cell_id in deleted:
+        cell = cells.get(cell_id)
+        if cell is None:
+            changes.append({"cell_id": cell_id, "action": "missing", "old_points": None, "points": None})
+            continue
+        coords = cell.find("pc:Coords", NS)
+        lines = [etree.tostring(line, encoding="unicode", with_tail=False) for line in cell.findall("pc:TextLine", NS)]
+        changes.append({"cell_id": cell_id, "action": "deleted",
+                        "old_points": coords.get("points") if coords is not None else None, "points": None,
+                        "lines": lines})
+        cell.getparent().remove(cell)
+
+    if any(change["action"] != "missing" for change in changes):
+        atomic_write_bytes(pagexml_file, etree.tostring(tree, xml_declaration=True, encoding="utf-8"))
+    return changes
+
 def load_cells(file_path):
     """Load polygons indexed by (row, col)."""
     # check if file is in PageXML format
     if file_path.endswith(".xml"):
-        data = json.dumps(parse_polygon_from_pagexml(file_path))
-        data = json.loads(data)
+        return {(cell.row, cell.col): Polygon(cell.points) for cell in load_table_cells(file_path) if cell.points}
     elif file_path.endswith(".json"):
         with open(file_path, "r") as f:
             data = json.load(f)
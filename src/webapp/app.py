@@ -1,56 +1,157 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory
-from lxml import etree
+import re
+import time
+import uuid
+import hashlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, abort
+from werkzeug.utils import secure_filename
 import json
 
+# Run as a module of src/, like the other pipeline entry points import their
+# siblings (src/utils.py etc.):  cd src && python -m webapp.app
+from lxml import etree
+from utils import patch_table_cells, atomic_write_bytes
+from incremental_update import rematch_lines, orphan_lines
+from .jobs import process_upload, write_status, read_status, write_json_atomic, read_json, file_lock
+
 app = Flask(__name__)
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Storage layout:
+#   uploads/images/<sha256>.<ext>   uploaded images, content-hashed (stored once)
+#   uploads/tiles/<sha256>/         tile pyramid + thumbnail, shared by all uploads of an image
+#   uploads/sessions/<upload id>/   one review session: page.xml, polygons, status, change log
+UPLOAD_FOLDER = os.path.abspath(os.environ.get("UPLOAD_FOLDER", "uploads"))
+IMAGES_FOLDER = os.path.join(UPLOAD_FOLDER, "images")
+TILES_FOLDER = os.path.join(UPLOAD_FOLDER, "tiles")
+SESSIONS_FOLDER = os.path.join(UPLOAD_FOLDER, "sessions")
+for folder in [IMAGES_FOLDER, TILES_FOLDER, SESSIONS_FOLDER]:
+    os.makedirs(folder, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_UPLOAD_MB", 512)) * 1024 * 1024
+
+# Tiles, thumbnails and images are content-addressed, so they can be cached forever
+TILE_MAX_AGE = 365 * 24 * 3600
+CHUNK_SIZE = 1 << 20
+WORKERS = int(os.environ.get("WEBAPP_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+
+UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+IMAGE_SHA = re.compile(r"^[0-9a-f]{64}$")
+IMAGE_FILE = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]+)?$")
+SESSION_XML = "page.xml"  # session copy of the uploaded PageXML
+
+# Background queue for PageXML parsing and tile generation (created on first upload)
+_executor = None
+_executor_lock = Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=WORKERS)
+        return _executor
+
 
-# Helper: parse PageXML and extract TableCell polygons
-def parse_pagexml(file_path):
+def session_dir(upload_id):
+    if not UPLOAD_ID.match(upload_id or ""):
+        abort(404)
+    path = os.path.join(SESSIONS_FOLDER, upload_id)
+    if not os.path.isdir(path):
+        abort(404)
+    return path
+
+
+def tiles_dir(image_sha):
+    if not IMAGE_SHA.match(image_sha or ""):
+        abort(404)
+    return os.path.join(TILES_FOLDER, image_sha)
+
+
+def save_stream(file_storage, directory, suffix=""):
     """
-    Returns list of polygons: [{"id": "t1c1", "points": [[x1,y1],[x2,y2],...]]}
+    Copy an uploaded file to `directory` in chunks, hashing it on the way.
+
+    The file is stored as <sha256><suffix>; when that file already exists the
+    copy is discarded. Returns (sha256, path).
     """
-    ns = {"pc": "http://schema.primaresearch.org/PAGE/gts/pagecontent/2013-07-15"}
-    tree = etree.parse(file_path)
-    root = tree.getroot()
-    polygons = []
-    for cell in root.xpath("//pc:TableCell", namespaces=ns):
-        cell_id = cell.get("id")
-        cell_row = cell.get("row")
-        cell_col = cell.get("col")
-        coords_el = cell.find(".//pc:Coords", namespaces=ns)
-        if coords_el is None:
-            continue
-        points_str = coords_el.get("points")  # e.g. "652,320 652,590 1312,590 1311,320"
-        # Split into x,y pairs
-        pts = []
-        for pair in points_str.strip().split():
-            if ',' in pair:
-                x_str, y_str = pair.split(',', 1)
-                try:
-                    x = float(x_str)
-                    y = float(y_str)
-                    pts.append([x, y])
-                except ValueError:
-                    continue
-        if pts:
-            polygons.append({"id": cell_id, "row":cell_row, "col":cell_col, "points": pts})
-    return polygons
-
-# Route: serve uploaded files (images)
-@app.route('/uploads/<path:filename>')
-def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: file_storage.stream.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        sha = digest.hexdigest()
+        path = os.path.join(directory, sha + suffix)
+        if os.path.exists(path):
+            os.unlink(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return sha, path
+
+
+def _on_job_done(session, future):
+    # A crashed worker never gets to write its own failure
+    error = future.exception()
+    if error is not None and (read_status(session) or {}).get("state") != "failed":
+        write_status(session, "failed", error=f"{type(error).__name__}: {error}")
+
+
+def _cached_file(directory, filename, max_age=TILE_MAX_AGE):
+    response = send_from_directory(directory, filename, max_age=max_age, etag=True, conditional=True)
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+# Route: original image of an upload
+@app.route('/images/<filename>')
+def image_file(filename):
+    if not IMAGE_FILE.match(filename):
+        abort(404)
+    return _cached_file(IMAGES_FOLDER, filename)
+
+# Route: pyramid descriptor
+@app.route('/tiles/<image_sha>/info.json')
+def tile_info(image_sha):
+    return _cached_file(tiles_dir(image_sha), "info.json")
+
+# Route: one tile of the image pyramid
+@app.route('/tiles/<image_sha>/<int:level>/<int:col>_<int:row>.jpg')
+def tile(image_sha, level, col, row):
+    return _cached_file(os.path.join(tiles_dir(image_sha), str(level)), f"{col}_{row}.jpg")
+
+# Route: thumbnail shown while the tiles load
+@app.route('/thumbnails/<image_sha>')
+def thumbnail(image_sha):
+    return _cached_file(tiles_dir(image_sha), "thumb.jpg")
+
+# Route: polygons of a session (changed by saves, so always revalidated)
+@app.route('/sessions/<upload_id>/polygons.json')
+def polygons_file(upload_id):
+    return _cached_file(session_dir(upload_id), "polygons.json", max_age=0)
+
+# Route: background processing status, polled by the result page
+@app.route('/status/<upload_id>')
+def status(upload_id):
+    response = jsonify(read_status(session_dir(upload_id)) or {"state": "queued", "steps": {}, "error": None})
+    response.cache_control.no_store = True
+    return response
 
 # Index: upload form
 @app.route('/', methods=['GET'])
 def index():
     return render_template('index.html')
 
-# Upload: handle image + xml and redirect to result page
+# Upload: store image + xml, queue the processing and redirect to the result page
 @app.route('/upload', methods=['POST'])
 def upload():
     image_file = request.files.get('image')
@@ -59,49 +160,159 @@ def upload():
     if not image_file:
         return "No image uploaded", 400
 
-    image_filename = image_file.filename
-    image_path = os.path.join(app.config['UPLOAD_FOLDER'], image_filename)
-    image_file.save(image_path)
+    image_name = secure_filename(image_file.filename) or "image"
+    image_sha, image_path = save_stream(image_file, IMAGES_FOLDER, os.path.splitext(image_name)[1].lower())
+
+    upload_id = uuid.uuid4().hex
+    session = os.path.join(SESSIONS_FOLDER, upload_id)
+    os.makedirs(session)
 
-    xml_filename = None
-    polygons = []
-    if xml_file:
-        xml_filename = xml_file.filename
-        xml_path = os.path.join(app.config['UPLOAD_FOLDER'], xml_filename)
+    # The PageXML is stored under a fixed name, so a client file name cannot clobber
+    # the session files (meta.json, status.json, ...); the original name goes to meta.json
+    xml_name = None
+    xml_path = None
+    if xml_file and xml_file.filename:
+        xml_name = secure_filename(xml_file.filename) or SESSION_XML
+        xml_path = os.path.join(session, SESSION_XML)
         xml_file.save(xml_path)
-        polygons = parse_pagexml(xml_path)
 
-    # Save polygons as json (server-side) so result page can fetch them
-    polygons_json_path = os.path.join(app.config['UPLOAD_FOLDER'], image_filename + ".polygons.json")
-    with open(polygons_json_path, "w", encoding="utf-8") as f:
-        json.dump(polygons, f, ensure_ascii=False, indent=2)
+    # Which image and PageXML belong to the session, for write-back of corrections
+    write_json_atomic(os.path.join(session, "meta.json"), {
+        "upload": upload_id, "image": image_name, "image_sha": image_sha, "image_file": os.path.basename(image_path),
+        "xml": SESSION_XML if xml_path else None, "xml_name": xml_name, "created": time.time()
+    })
+    write_status(session, "queued", {"polygons": "pending", "tiles": "pending"})
 
-    # Redirect to result page with the image filename
-    return redirect(url_for('result', image=image_filename))
+    future = executor().submit(process_upload, session, image_path, os.path.join(TILES_FOLDER, image_sha), xml_path)
+    future.add_done_callback(lambda f: _on_job_done(session, f))
 
-# Result page: show image and polygons overlay
+    return redirect(url_for('result', upload=upload_id))
+
+# Result page: show image and polygons overlay once processing is done
 @app.route('/result')
 def result():
-    image = request.args.get('image')
-    if not image:
+    upload_id = request.args.get('upload')
+    if not upload_id:
         return redirect(url_for('index'))
-    polygons_json_url = url_for('uploaded_file', filename=image + ".polygons.json")
-    image_url = url_for('uploaded_file', filename=image)
-    return render_template('result.html', image_url=image_url, polygons_url=polygons_json_url, image_name=image)
+    meta = read_json(os.path.join(session_dir(upload_id), "meta.json"), default={})
+    return render_template(
+        'result.html',
+        upload_id=upload_id,
+        image_name=meta.get("image"),
+        image_file=meta["image_file"],
+        polygons_url=url_for('polygons_file', upload_id=upload_id),
+        status_url=url_for('status', upload_id=upload_id),
+        tiles_url=url_for('tile_info', image_sha=meta["image_sha"]).rsplit("/", 1)[0],
+        thumbnail_url=url_for('thumbnail', image_sha=meta["image_sha"]),
+    )
+
+def invalid_edits(modified, deleted):
+    """Reason why the polygons/deleted lists of a save are malformed, or None."""
+    if not isinstance(modified, list) or not isinstance(deleted, list):
+        return "polygons and deleted must be lists"
+    if not all(isinstance(cell_id, str) for cell_id in deleted):
+        return "deleted must hold cell ids"
+    for polygon in modified:
+        if not isinstance(polygon, dict):
+            return "every polygon must be an object"
+        if polygon.get("id") is not None and not isinstance(polygon["id"], str):
+            return f"polygon id {polygon['id']!r} is not a string"
+        points = polygon.get("points")
+        if not isinstance(points, list) or len(points) < 3 or not all(
+                isinstance(point, list) and len(point) == 2
+                and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in point)
+                for point in points):
+            return f"polygon {polygon.get('id')!r} needs \"points\": at least 3 [x, y] pairs"
+    return None
 
 # Endpoint: save polygons posted from client after edit
 @app.route('/save_polygons', methods=['POST'])
 def save_polygons():
-    payload = request.get_json()
-    image = payload.get("image")
-    polygons = payload.get("polygons", [])
-    if not image:
-        return jsonify({"error": "image not specified"}), 400
-    save_path = os.path.join(app.config['UPLOAD_FOLDER'], image + ".polygons.json")
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(polygons, f, ensure_ascii=False, indent=2)
-    return jsonify({"message": "Polygons saved", "path": save_path})
+    """
+    Apply the edits of the result page.
+
+    Payload: {"upload", "polygons": [modified polygons], "deleted": [cell ids]}.
+    Only the given cells are patched, both in the polygons JSON and in the
+    TableCell/Coords of the session's PageXML (atomic writes, one save per session
+    at a time). A polygon is only saved when its cell exists (in the PageXML, or in
+    the polygons JSON of a session without one); polygons without id or with an
+    unknown id are reported back as rejected. Every applied change is appended to
+    the session's changes.jsonl for incremental recomputation downstream.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "expected a JSON object"}), 400
+    upload_id = payload.get("upload")
+    modified = payload.get("polygons") or []
+    deleted = payload.get("deleted") or []
+    if not upload_id or not isinstance(upload_id, str):
+        return jsonify({"error": "upload not specified"}), 400
+    error = invalid_edits(modified, deleted)
+    if error:
+        return jsonify({"error": error}), 400
+    session = session_dir(upload_id)
+    meta = read_json(os.path.join(session, "meta.json"), default={}) or {}
+
+    rejected = [{"id": None, "reason": "no id", "points": polygon.get("points")}
+                for polygon in modified if not polygon.get("id")]
+    requested = {polygon["id"]: polygon["points"] for polygon in modified if polygon.get("id")}
+
+    with file_lock(os.path.join(session, ".lock")):
+        save_path = os.path.join(session, "polygons.json")
+        polygons = read_json(save_path, default=[])
+
+        # PageXML write-back first: it decides which cells exist
+        xml_name = meta.get("xml_name")
+        xml_path = os.path.join(session, SESSION_XML) if meta.get("xml") else None
+        if xml_path and os.path.exists(xml_path):
+            changes = patch_table_cells(xml_path, requested, deleted)
+            # Keep the text of deleted cells: move their lines to the cells now covering them
+            orphans = orphan_lines(changes)
+            if orphans:
+                tree = etree.parse(xml_path)
+                rematch_lines(tree, [], orphans=orphans)
+                atomic_write_bytes(xml_path, etree.tostring(tree, xml_declaration=True, encoding="utf-8"))
+        else:
+            known = {polygon.get("id"): polygon.get("points") for polygon in polygons if polygon.get("id")}
+            changes = [{"cell_id": cell_id, "action": "modified" if cell_id in known else "missing",
+                        "old_points": known.get(cell_id), "points": points}
+                       for cell_id, points in requested.items() if cell_id not in deleted]
+            changes += [{"cell_id": cell_id, "action": "deleted" if cell_id in known else "missing",
+                         "old_points": known.get(cell_id), "points": None} for cell_id in deleted]
+        rejected += [{"id": change["cell_id"], "reason": "unknown id", "points": change["points"]}
+                     for change in changes if change["action"] == "missing"]
+        changes = [change for change in changes if change["action"] != "missing"]
+
+        # Polygons JSON: replace modified polygons by id, drop deleted ones
+        applied = {change["cell_id"]: change["points"] for change in changes if change["action"] == "modified"}
+        deleted_ids = {change["cell_id"] for change in changes if change["action"] == "deleted"}
+        updated = []
+        for polygon in polygons:
+            cell_id = polygon.get("id")
+            if cell_id in deleted_ids:
+                continue
+            if cell_id in applied:
+                polygon = dict(polygon, points=applied.pop(cell_id))
+            updated.append(polygon)
+        updated.extend({"id": cell_id, "points": points} for cell_id, points in applied.items())
+        write_json_atomic(save_path, updated)
+
+        # Change log for downstream stages (see incremental_update.py)
+        timestamp = time.time()
+        with open(os.path.join(session, "changes.jsonl"), "a", encoding="utf-8") as f:
+            for change in changes:
+                f.write(json.dumps(dict(change, image=meta.get("image"), xml=xml_name, time=timestamp),
+                                   ensure_ascii=False) + "\n")
+
+    return jsonify({
+        "message": "Polygons saved",
+        "upload": upload_id,
+        "xml": xml_name,
+        "modified": sum(change["action"] == "modified" for change in changes),
+        "deleted": sum(change["action"] == "deleted" for change in changes),
+        "rejected": rejected,
+    })
 
 if __name__ == "__main__":
-    app.run(debug=True)
- 
\ No newline at end of file
+    # Threaded: uploads and long polls of one reviewer do not block the others
+    app.run(debug=True, threaded=True)
@@ -0,0 +1,74 @@
+import os
+import json
+import time
+import fcntl
+from contextlib import contextmanager
+from utils import parse_polygon_from_pagexml, atomic_write_bytes
+from .tiles import build_pyramid, build_thumbnail
+
+# Background processing of an upload. Runs in a worker process, so all state
+# goes through files: <session>/status.json is what the status endpoint serves.
+
+STATUS_FILE = "status.json"
+
+
+def write_json_atomic(path, data):
+    atomic_write_bytes(path, json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_status(session_dir, state, steps=None, error=None):
+    write_json_atomic(os.path.join(session_dir, STATUS_FILE), {
+        "state": state,  # queued | running | done | failed
+        "steps": steps or {},
+        "error": error,
+        "updated": time.time(),
+    })
+
+
+def read_status(session_dir):
+    return read_json(os.path.join(session_dir, STATUS_FILE))
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock on `path` (created if needed), across processes."""
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def process_upload(session_dir, image_path, tiles_dir, xml_path=None):
+    """
+    Parse the PageXML polygons and build the tile pyramid + thumbnail of an upload.
+
+    Tiles are shared by every upload of the same image (content-hashed), so their
+    generation is serialized with a lock and done once; later uploads find them cached.
+    """
+    steps = {"polygons": "pending", "tiles": "pending"}
+    try:
+        write_status(session_dir, "running", steps)
+
+        polygons = parse_polygon_from_pagexml(xml_path) if xml_path else []
+        write_json_atomic(os.path.join(session_dir, "polygons.json"), polygons)
+        steps["polygons"] = "done"
+        write_status(session_dir, "running", steps)
+
+        os.makedirs(tiles_dir, exist_ok=True)
+        with file_lock(tiles_dir + ".lock"):
+            build_pyramid(image_path, tiles_dir)
+            build_thumbnail(image_path, os.path.join(tiles_dir, "thumb.jpg"))
+        steps["tiles"] = "done"
+        write_status(session_dir, "done", steps)
+    except Exception as e:
+        write_status(session_dir, "failed", steps, f"{type(e).__name__}: {e}")
+        raise
@@ -0,0 +1,92 @@
+import os
+import json
+import math
+from PIL import Image
+
+# DeepZoom-style pyramid: level `max_level` is the full-resolution image and each
+# lower level halves it, down to 1x1 at level 0. Tiles are stored as
+# <tiles_dir>/<level>/<col>_<row>.jpg next to an info.json descriptor.
+TILE_SIZE = 256
+THUMBNAIL_SIZE = 256
+JPEG_QUALITY = 85
+
+
+def pyramid_info(width, height, tile_size=TILE_SIZE):
+    max_level = math.ceil(math.log2(max(width, height))) if max(width, height) > 1 else 0
+    levels = []
+    for level in range(max_level + 1):
+        scale = 2 ** (max_level - level)
+        level_width = max(1, math.ceil(width / scale))
+        level_height = max(1, math.ceil(height / scale))
+        levels.append({
+            "width": level_width,
+            "height": level_height,
+            "cols": math.ceil(level_width / tile_size),
+            "rows": math.ceil(level_height / tile_size),
+        })
+    return {
+        "width": width,
+        "height": height,
+        "tile_size": tile_size,
+        "format": "jpg",
+        "max_level": max_level,
+        "levels": levels,
+    }
+
+
+def _is_fresh(output_path, source_path):
+    return os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(source_path)
+
+
+def build_pyramid(image_path, tiles_dir, tile_size=TILE_SIZE):
+    """
+    Generate the tile pyramid of an image (cached: skipped when info.json is newer
+    than the image). Returns the pyramid descriptor.
+    """
+    info_path = os.path.join(tiles_dir, "info.json")
+    if _is_fresh(info_path, image_path):
+        with open(info_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    with Image.open(image_path) as source:
+        image = source.convert("RGB")
+
+    info = pyramid_info(image.width, image.height, tile_size)
+    # Changes whenever the image is replaced; appended to tile URLs so they can be cached forever
+    stat = os.stat(image_path)
+    info["version"] = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    # Walk from full resolution down, halving the previous level each time
+    level_image = image
+    for level in range(info["max_level"], -1, -1):
+        spec = info["levels"][level]
+        if level_image.size != (spec["width"], spec["height"]):
+            level_image = level_image.resize((spec["width"], spec["height"]), Image.LANCZOS)
+
+        level_dir = os.path.join(tiles_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        for row in range(spec["rows"]):
+            for col in range(spec["cols"]):
+                box = (
+                    col * tile_size,
+                    row * tile_size,
+                    min((col + 1) * tile_size, spec["width"]),
+                    min((row + 1) * tile_size, spec["height"]),
+                )
+                level_image.crop(box).save(os.path.join(level_dir, f"{col}_{row}.jpg"), "JPEG", quality=JPEG_QUALITY)
+
+    # Written last: its presence marks a complete pyramid
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    return info
+
+
+def build_thumbnail(image_path, thumbnail_path, size=THUMBNAIL_SIZE):
+    """Write a JPEG thumbnail (longest side `size`); cached like the pyramid."""
+    if _is_fresh(thumbnail_path, image_path):
+        return thumbnail_path
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        image.thumbnail((size, size), Image.LANCZOS)
+        image.save(thumbnail_path, "JPEG", quality=JPEG_QUALITY)
+    return thumbnail_path